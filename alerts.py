@@ -0,0 +1,383 @@
+"""
+Alert engine for network metrics.
+
+Rules are evaluated against every collected sample on a background worker,
+so neither API requests nor the collector ever wait on an SMTP handshake.
+Notifications are deduplicated per rule and target, held back by duration
+windows, hysteresis and cooldowns, and delivered as digests over a single
+reused SMTP connection.
+"""
+
+import json
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+from datetime import datetime
+from email.message import EmailMessage
+
+from metricsmeasure import sample_series
+
+logger = logging.getLogger('network_alerts')
+
+# Alert configuration (overridable through the environment)
+ALERT_RULES_PATH = os.environ.get('ALERT_RULES_PATH', 'alert_rules.json')
+ALERT_RECIPIENTS = [r.strip() for r in os.environ.get('ALERT_RECIPIENTS', '').split(',') if r.strip()]  # Empty: only logged
+ALERT_SENDER = os.environ.get('ALERT_SENDER', 'network-monitor@example.com')
+SMTP_HOST = os.environ.get('SMTP_HOST')  # Unset: alerts are only logged
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') == '1'
+DIGEST_WINDOW = float(os.environ.get('ALERT_DIGEST_WINDOW', 30))  # seconds
+QUEUE_SIZE = 1000
+
+# Thresholds previously hard-coded in app1.get_metrics
+DEFAULT_RULES = [
+    {
+        "name": "high_packet_loss",
+        "metric": "packet_loss",
+        "operator": ">",
+        "threshold": 10,
+        "clear_threshold": 5,
+        "for_seconds": 0,
+        "cooldown": 900,
+        "severity": "critical"
+    },
+    {
+        "name": "high_latency",
+        "metric": "latency",
+        "operator": ">",
+        "threshold": 100,
+        "clear_threshold": 80,
+        "for_seconds": 0,
+        "cooldown": 900,
+        "severity": "warning"
+    }
+]
+
+
+class AlertRule:
+    """A threshold rule with a duration window, hysteresis and cooldown"""
+
+    OPERATORS = (">", "<")
+
+    def __init__(self, name, metric, threshold, operator=">", clear_threshold=None,
+                 for_seconds=0, cooldown=0, severity="warning"):
+        if operator not in self.OPERATORS:
+            raise ValueError(f"Unsupported operator for rule {name}: {operator}")
+        self.name = name
+        self.metric = metric
+        self.threshold = float(threshold)
+        self.operator = operator
+        # Without an explicit clear threshold the rule resolves as soon as it stops breaching
+        self.clear_threshold = float(threshold if clear_threshold is None else clear_threshold)
+        self.for_seconds = float(for_seconds)
+        self.cooldown = float(cooldown)
+        self.severity = severity
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a rule from its JSON representation"""
+        return cls(
+            name=data["name"],
+            metric=data["metric"],
+            threshold=data["threshold"],
+            operator=data.get("operator", ">"),
+            clear_threshold=data.get("clear_threshold"),
+            for_seconds=data.get("for_seconds", 0),
+            cooldown=data.get("cooldown", 0),
+            severity=data.get("severity", "warning")
+        )
+
+    def breached(self, value):
+        """Whether the value crosses the firing threshold"""
+        return value > self.threshold if self.operator == ">" else value < self.threshold
+
+    def cleared(self, value):
+        """Whether the value is back inside the clear threshold"""
+        return value <= self.clear_threshold if self.operator == ">" else value >= self.clear_threshold
+
+
+class Alert:
+    """A single state transition of a rule for one target"""
+
+    def __init__(self, rule, target, state, value, timestamp):
+        self.rule = rule.name
+        self.metric = rule.metric
+        self.severity = rule.severity
+        self.threshold = rule.threshold
+        self.target = target
+        self.state = state  # "firing" or "resolved"
+        self.value = value
+        self.timestamp = timestamp
+
+    @property
+    def key(self):
+        """Deduplication key: one pending notification per rule, target and state"""
+        return (self.rule, self.target, self.state)
+
+    def to_dict(self):
+        return {
+            "rule": self.rule,
+            "metric": self.metric,
+            "severity": self.severity,
+            "threshold": self.threshold,
+            "target": self.target,
+            "state": self.state,
+            "value": self.value,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+    def __str__(self):
+        when = datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        return (f"[{self.severity.upper()}] {self.rule} {self.state} on {self.target}: "
+                f"{self.metric}={self.value:.2f} (threshold {self.threshold:g}) at {when}")
+
+
+class _RuleState:
+    """Per rule/target evaluation state"""
+
+    __slots__ = ("pending_since", "firing", "notified", "last_notified", "previous_notified")
+
+    def __init__(self):
+        self.pending_since = None
+        self.firing = False
+        self.notified = False
+        self.last_notified = None
+        self.previous_notified = None  # restored if the firing notification is cancelled
+
+
+def load_rules(path=ALERT_RULES_PATH):
+    """Load alert rules from a JSON file, falling back to the built-in defaults"""
+    try:
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                rules = [AlertRule.from_dict(r) for r in json.load(f)]
+            logger.info(f"Loaded {len(rules)} alert rules from {path}")
+            return rules
+    except Exception as e:
+        logger.error(f"Failed to load alert rules from {path}: {e}")
+    return [AlertRule.from_dict(r) for r in DEFAULT_RULES]
+
+
+def _sample_time(sample):
+    """Epoch seconds of a sample, falling back to now"""
+    try:
+        return datetime.fromisoformat(sample["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+class SmtpNotifier:
+    """Delivers alert digests over a persistent, lazily (re)established SMTP connection"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=SMTP_USERNAME,
+                 password=SMTP_PASSWORD, starttls=SMTP_STARTTLS,
+                 sender=ALERT_SENDER, recipients=None, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.sender = sender
+        self.recipients = list(recipients if recipients is not None else ALERT_RECIPIENTS)
+        self.idle_timeout = idle_timeout
+        self._smtp = None
+        self._last_used = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=10)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _connection(self):
+        """Return the pooled connection, probing it with NOOP if it has been idle"""
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def build_message(self, alerts):
+        firing = sum(1 for a in alerts if a.state == "firing")
+        msg = EmailMessage()
+        msg['Subject'] = f"Network Metrics Alert: {firing} firing, {len(alerts) - firing} resolved"
+        msg['From'] = self.sender
+        msg['To'] = ", ".join(self.recipients)
+        lines = ["Network Alert Notification", ""]
+        lines.extend(str(a) for a in alerts)
+        lines.extend(["", "Please check your network metrics dashboard for more details."])
+        msg.set_content("\n".join(lines))
+        return msg
+
+    def send(self, alerts):
+        """Send one digest for a batch of alerts; returns True on success"""
+        if not alerts:
+            return True
+        if not self.recipients:
+            for alert in alerts:
+                logger.warning(f"ALERT (no ALERT_RECIPIENTS configured): {alert}")
+            return True
+        if not self.host:
+            for alert in alerts:
+                logger.info(f"ALERT WOULD BE SENT TO {', '.join(self.recipients)}: {alert}")
+            return True
+
+        msg = self.build_message(alerts)
+        # One retry on a fresh connection covers servers that dropped an idle session
+        for attempt in range(2):
+            try:
+                self._connection().send_message(msg)
+                self._last_used = time.monotonic()
+                logger.info(f"Sent alert digest with {len(alerts)} alerts")
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning(f"Alert delivery attempt {attempt + 1} failed: {e}")
+                self.close()
+        logger.error(f"Failed to send alert digest with {len(alerts)} alerts")
+        return False
+
+
+class AlertEngine:
+    """Evaluates rules against queued samples and batches notifications"""
+
+    def __init__(self, rules=None, notifier=None, digest_window=DIGEST_WINDOW, queue_size=QUEUE_SIZE):
+        self.rules = list(rules if rules is not None else load_rules())
+        self.notifier = notifier if notifier is not None else SmtpNotifier()
+        self.digest_window = digest_window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._states = {}
+        self._pending = {}
+        self._pending_since = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.dropped = 0
+
+    def submit(self, sample):
+        """Queue a sample for evaluation; never blocks the caller"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(sample)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Alert queue full, dropping sample")
+            return False
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="alert-engine", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the worker after flushing queued samples and pending alerts"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def evaluate(self, sample):
+        """Evaluate all rules against a sample and return the resulting alerts"""
+        target = sample_series(sample)
+        now = _sample_time(sample)
+        alerts = []
+        for rule in self.rules:
+            value = sample.get(rule.metric)
+            if not isinstance(value, (int, float)):
+                continue
+            state = self._states.setdefault((rule.name, target), _RuleState())
+
+            if state.firing:
+                if rule.cleared(value):
+                    state.firing = False
+                    state.pending_since = None
+                    if state.notified:
+                        alerts.append(Alert(rule, target, "resolved", value, now))
+                continue
+
+            if not rule.breached(value):
+                state.pending_since = None
+                continue
+            if state.pending_since is None:
+                state.pending_since = now
+            if now - state.pending_since < rule.for_seconds:
+                continue
+
+            state.firing = True
+            state.notified = state.last_notified is None or now - state.last_notified >= rule.cooldown
+            if not state.notified:
+                logger.info(f"Alert {rule.name} on {target} suppressed by cooldown")
+                continue
+            state.previous_notified = state.last_notified
+            state.last_notified = now
+            alerts.append(Alert(rule, target, "firing", value, now))
+        return alerts
+
+    def _queue_alerts(self, alerts):
+        for alert in alerts:
+            if alert.state == "resolved":
+                # A resolution cancels a firing notification that was never sent,
+                # and with it the cooldown that notification started
+                firing_key = (alert.rule, alert.target, "firing")
+                if self._pending.pop(firing_key, None) is not None:
+                    state = self._states.get((alert.rule, alert.target))
+                    if state is not None:
+                        state.last_notified = state.previous_notified
+                    continue
+            self._pending[alert.key] = alert
+        if self._pending and self._pending_since is None:
+            self._pending_since = time.monotonic()
+
+    def flush(self):
+        """Deliver all pending alerts as one digest"""
+        if not self._pending:
+            return True
+        alerts = sorted(self._pending.values(), key=lambda a: a.timestamp)
+        self._pending = {}
+        self._pending_since = None
+        return self.notifier.send(alerts)
+
+    def _run(self):
+        while True:
+            try:
+                sample = self._queue.get(timeout=0.5)
+                self._queue_alerts(self.evaluate(sample))
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+            except Exception as e:
+                logger.error(f"Alert evaluation failed: {e}")
+
+            try:
+                if self._pending and time.monotonic() - self._pending_since >= self.digest_window:
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Alert delivery failed: {e}")
+
+        try:
+            self.flush()
+        finally:
+            self.notifier.close()
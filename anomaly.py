@@ -0,0 +1,158 @@
+"""
+Streaming anomaly detection over collected network metrics.
+
+Every sample is scored incrementally per target and metric against an EWMA
+mean/variance, an hour-of-day seasonal baseline and a one-sided CUSUM
+change-point statistic. State per series is a fixed handful of floats, so
+evaluation is O(1) in time and memory per sample.
+"""
+
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+from metricsmeasure import sample_series
+
+logger = logging.getLogger('network_anomaly')
+
+# metric -> (direction of degradation, detection kind, minimum std deviation)
+DEFAULT_METRICS = {
+    "latency": (1, "latency_spike", 1.0),
+    "jitter": (1, "jitter_spike", 1.0),
+    "dns_lookup_time": (1, "dns_spike", 1.0),
+    "packet_loss": (1, "loss_burst", 1.0),
+    "download_speed": (-1, "throughput_drop", 1.0),
+    "upload_speed": (-1, "throughput_drop", 1.0),
+}
+
+SEASONS = 24  # hour-of-day buckets
+
+
+class _SeriesState:
+    """Constant-size state for one (target, metric) series"""
+
+    __slots__ = ("count", "mean", "var", "cusum", "season_mean", "season_count")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.cusum = 0.0
+        self.season_mean = [0.0] * SEASONS
+        self.season_count = [0] * SEASONS
+
+
+class AnomalyDetector:
+    """Scores samples against recent and seasonal behaviour of each series"""
+
+    def __init__(self, metrics=None, alpha=0.1, season_alpha=0.2, warmup=10,
+                 season_warmup=3, z_threshold=4.0, cusum_drift=0.5,
+                 cusum_threshold=8.0, clip=3.0, relative_floor=0.05, sink=None):
+        self.metrics = dict(metrics if metrics is not None else DEFAULT_METRICS)
+        self.alpha = alpha
+        self.season_alpha = season_alpha
+        self.warmup = warmup
+        self.season_warmup = season_warmup
+        self.z_threshold = z_threshold
+        self.cusum_drift = cusum_drift
+        self.cusum_threshold = cusum_threshold
+        self.clip = clip
+        self.relative_floor = relative_floor
+        self.sink = sink
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def update(self, target, metric, value, ts):
+        """Fold one value into its series and return a detection dict or None"""
+        direction, kind, min_std = self.metrics[metric]
+        key = (target, metric)
+        state = self._series.get(key)
+        if state is None:
+            state = self._series[key] = _SeriesState()
+
+        # Local wall-clock hour, so the seasons follow DST changes
+        season = datetime.fromtimestamp(ts).hour % SEASONS
+        if state.season_count[season] >= self.season_warmup:
+            expected = state.season_mean[season]
+        else:
+            expected = state.mean
+        std = max(math.sqrt(state.var), min_std, self.relative_floor * abs(expected))
+        z = (value - expected) / std
+
+        detection = None
+        if state.count >= self.warmup:
+            score = z * direction
+            state.cusum = max(0.0, state.cusum + score - self.cusum_drift)
+            if score > self.z_threshold:
+                detection = kind
+            elif state.cusum > self.cusum_threshold:
+                detection = "level_shift"
+            if detection is not None:
+                state.cusum = 0.0
+
+        # Clip outliers before learning from them so one spike cannot drag the baseline
+        learned = value
+        if state.count >= self.warmup:
+            if z > self.clip:
+                learned = expected + self.clip * std
+            elif z < -self.clip:
+                learned = expected - self.clip * std
+
+        if state.count == 0:
+            state.mean = learned
+        else:
+            diff = learned - state.mean
+            incr = self.alpha * diff
+            state.mean += incr
+            state.var = (1 - self.alpha) * (state.var + diff * incr)
+        if state.season_count[season] == 0:
+            state.season_mean[season] = learned
+        else:
+            state.season_mean[season] += self.season_alpha * (learned - state.season_mean[season])
+        state.season_count[season] += 1
+        state.count += 1
+
+        if detection is None:
+            return None
+        return {
+            "timestamp": datetime.fromtimestamp(ts).isoformat(),
+            "target": target,
+            "metric": metric,
+            "kind": detection,
+            "value": value,
+            "expected": expected,
+            "score": z
+        }
+
+    def observe(self, sample):
+        """Score every tracked metric of a collected sample; usable as a sample handler"""
+        if "error" in sample:
+            return []
+        target = sample_series(sample)
+        try:
+            ts = datetime.fromisoformat(sample["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            ts = time.time()
+
+        detections = []
+        with self._lock:
+            for metric in self.metrics:
+                value = sample.get(metric)
+                if isinstance(value, (int, float)):
+                    detection = self.update(target, metric, float(value), ts)
+                    if detection is not None:
+                        detections.append(detection)
+
+        if detections:
+            for d in detections:
+                logger.warning(f"Anomaly detected on {d['target']}: {d['kind']} in {d['metric']} "
+                               f"(value={d['value']:.2f}, expected={d['expected']:.2f}, z={d['score']:.1f})")
+            if self.sink is not None:
+                self.sink(detections)
+        return detections
+
+    def series_count(self):
+        return len(self._series)
+
@@ -1,83 +1,148 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Blueprint, Flask, current_app, jsonify, request, send_from_directory
 import os
-import threading
-import time
-import sqlite3
+import gzip
+import zlib
 from flask_cors import CORS
 from datetime import datetime
 import logging
 import json
+import threading
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Import from metricsmeasure.py
 from metricsmeasure import (
     collect_metrics, log_metrics, test_protocol_performance, 
-    get_wifi_signal_strength, save_metrics_to_csv, send_alert,
-    init_db, get_historical_data
+    get_wifi_signal_strength, save_metrics_to_csv, store_metrics_in_db,
+    init_db, get_historical_data, query_historical, get_anomalies, get_latency_distribution, read_latest_sample,
+    save_test_results, publish_sample, configure_logging, DEFAULT_PERCENTILES, MAX_HISTORY_ROWS
 )
+from pipeline import init_pipeline
+from jobs import JobManager, JobQueueFull, DEFAULT_PRIORITY
+from collector import start_embedded_collector
+from columnar import encode_columnar, COLUMNAR_MIMETYPE, MSGPACK_MIMETYPES
+from static_assets import StaticAsset, StaticAssets
+from response_cache import ResponseCache
+from downsample import downsample_rows
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('api_server.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger('network_api')
 
-# Flask app configuration
-app = Flask(__name__, static_folder='static')
-app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+# Routes are registered on a blueprint; create_app() builds the Flask app around it
+api = Blueprint('api', __name__)
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 
-# Create static folder if it doesn't exist
-os.makedirs(app.static_folder, exist_ok=True)
+# Per-process state prepared by create_app() before the first request is served
+static_assets = None
+swagger_asset = None
+_init_lock = threading.Lock()
 
-# Global connection pool for SQLite
-DATABASE_CONNECTION = None
+# Batched ingestion from remote agents (metricsmeasure.py --agent)
+INGEST_TOKEN = os.environ.get('INGEST_TOKEN')
+MAX_INGEST_BYTES = 16 * 1024 * 1024  # decompressed
+MAX_INGEST_SAMPLES = 10000
 
-def get_db_connection():
-    """Get a database connection (singleton pattern)"""
-    global DATABASE_CONNECTION
-    if DATABASE_CONNECTION is None:
-        DATABASE_CONNECTION = sqlite3.connect("network_metrics.db", check_same_thread=False)
-    return DATABASE_CONNECTION
+# Long-running measurements requested through /api/jobs
+job_manager = JobManager()
 
-def store_metrics_in_db(metrics):
-    """Store metrics in the database"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS metrics (
-                            timestamp TEXT,
-                            download_speed REAL,
-                            upload_speed REAL,
-                            latency REAL,
-                            jitter REAL,
-                            dns_lookup_time REAL,
-                            traceroute_hops INTEGER,
-                            packet_loss REAL)
-                        ''')
-        cursor.execute('''INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (datetime.now().isoformat(), 
-                     metrics.get("download_speed", 0), 
-                     metrics.get("upload_speed", 0), 
-                     metrics.get("latency", 0),
-                     metrics.get("jitter", 0), 
-                     metrics.get("dns_lookup_time", 0), 
-                     metrics.get("traceroute_hops", 0), 
-                     metrics.get("packet_loss", 0)))
-        conn.commit()
-        logger.info("Metrics stored in database successfully")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to store metrics in database: {e}")
-        return False
+# Response compression for API payloads (br needs the optional brotli package)
+COMPRESSIBLE_MIMETYPES = {'application/json', COLUMNAR_MIMETYPE, 'application/msgpack'}
+MIN_COMPRESS_BYTES = 1024
+RESPONSE_FORMATS = ('json', 'columnar', 'msgpack')
+
+# Read-only endpoints are cached until the next database commit
+response_cache = ResponseCache()
+SWAGGER_CACHE_CONTROL = 'public, max-age=3600'
+
+# Chart downsampling (?max_points=); label fields are never treated as series values
+MIN_MAX_POINTS = 3
+HISTORY_LABEL_FIELDS = ('timestamp', 'time', 'protocol', 'target', 'agent', 'data')
+
+@api.after_app_request
+def compress_response(response):
+    """Compress JSON/MessagePack responses with br or gzip when the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+    if brotli is not None and request.accept_encodings['br']:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def _response_format():
+    """Negotiate the historical data format from ?format= or the Accept header"""
+    fmt = request.args.get("format")
+    if fmt:
+        if fmt not in RESPONSE_FORMATS:
+            raise ValueError(f"Unknown format: {fmt}. Supported: {', '.join(RESPONSE_FORMATS)}")
+        return fmt
+    best = request.accept_mimetypes.best_match(
+        ['application/json', COLUMNAR_MIMETYPE] + list(MSGPACK_MIMETYPES), default='application/json')
+    if best == COLUMNAR_MIMETYPE:
+        return 'columnar'
+    if best in MSGPACK_MIMETYPES:
+        return 'msgpack'
+    return 'json'
+
+def _historical_response(body, rows, series_fields=()):
+    """Render historical rows as row JSON, columnar JSON or columnar MessagePack
+
+    With ?max_points=N each series is reduced to at most N points by LTTB.
+    """
+    fmt = _response_format()
+    max_points = request.args.get("max_points")
+    if max_points is not None:
+        if not max_points.isdigit() or int(max_points) < MIN_MAX_POINTS:
+            raise ValueError(f"max_points must be an integer of at least {MIN_MAX_POINTS}")
+        total = len(rows)
+        fields = [k for k in rows[0] if k not in HISTORY_LABEL_FIELDS] if rows else []
+        rows = downsample_rows(rows, int(max_points), fields,
+                               time_field='time' if 'time' in series_fields else 'timestamp',
+                               series_fields=[f for f in series_fields if f != 'time'])
+        if len(rows) < total:
+            body["downsampled_from"] = total
+    body["count"] = len(rows)
+    if fmt == 'json':
+        body["data"] = rows
+        response = jsonify(body)
+    else:
+        body["format"] = "columnar"
+        body["data"] = encode_columnar(rows)
+        if fmt == 'msgpack':
+            if msgpack is None:
+                return jsonify({
+                    "status": "error",
+                    "message": "MessagePack support is not installed on this server",
+                    "timestamp": datetime.now().isoformat()
+                }), 406
+            response = current_app.response_class(msgpack.packb(body, use_bin_type=True), mimetype='application/msgpack')
+        else:
+            response = jsonify(body)
+            response.mimetype = COLUMNAR_MIMETYPE
+    response.vary.add('Accept')
+    return response
 
 # API routes
-@app.route("/api/metrics", methods=["GET"])
+@api.route("/api/metrics", methods=["GET"])
 def get_metrics():
     """Get current network metrics"""
     try:
@@ -87,10 +152,6 @@ def get_metrics():
         save_metrics_to_csv(metrics)
         store_metrics_in_db(metrics)
         
-        # Check for alert conditions
-        if metrics.get("packet_loss", 0) > 10 or metrics.get("latency", 0) > 100:
-            send_alert("your_email@gmail.com", "High packet loss or latency detected!")
-        
         return jsonify({
             "status": "success",
             "timestamp": datetime.now().isoformat(),
@@ -104,7 +165,32 @@ def get_metrics():
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@app.route("/api/protocol_test/<protocol>", methods=["GET"])
+@api.route("/api/metrics/latest", methods=["GET"])
+def latest_metrics():
+    """Get the most recently collected metrics without running any probes"""
+    try:
+        logger.info("API request received: /api/metrics/latest")
+        metrics = read_latest_sample()
+        if metrics is None:
+            return jsonify({
+                "status": "error",
+                "message": "No metrics collected yet",
+                "timestamp": datetime.now().isoformat()
+            }), 404
+        return jsonify({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "data": metrics
+        })
+    except Exception as e:
+        logger.error(f"Error in /api/metrics/latest: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@api.route("/api/protocol_test/<protocol>", methods=["GET"])
 def protocol_test(protocol):
     """Test specific protocol performance"""
     try:
@@ -124,7 +210,146 @@ def protocol_test(protocol):
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@app.route("/api/wifi_signal", methods=["GET"])
+@api.route("/api/jobs", methods=["POST"])
+def create_job():
+    """Queue a measurement job and return its ID immediately"""
+    try:
+        payload = request.get_json(silent=True) or {}
+        job_type = payload.get("type", "metrics")
+        logger.info(f"API request received: POST /api/jobs ({job_type})")
+        job, merged = job_manager.submit(
+            job_type,
+            params=payload,
+            priority=int(payload.get("priority", DEFAULT_PRIORITY))
+        )
+        response = jsonify({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "merged": merged,
+            "data": job
+        })
+        response.headers["Location"] = f"/api/jobs/{job['id']}"
+        return response, 202
+    except (ValueError, TypeError) as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    except JobQueueFull as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 503
+    except Exception as e:
+        logger.error(f"Error in POST /api/jobs: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@api.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Get the status and result of a measurement job"""
+    try:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({
+                "status": "error",
+                "message": f"Unknown job: {job_id}",
+                "timestamp": datetime.now().isoformat()
+            }), 404
+        return jsonify({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "data": job
+        })
+    except Exception as e:
+        logger.error(f"Error in /api/jobs/{job_id}: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+def _read_ingest_body():
+    """Return the request body, inflating gzip bodies up to MAX_INGEST_BYTES"""
+    body = request.get_data(cache=False)
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = inflater.decompress(body, MAX_INGEST_BYTES + 1)
+    if len(body) > MAX_INGEST_BYTES:
+        raise RequestEntityTooLarge(f"Batch exceeds {MAX_INGEST_BYTES} bytes")
+    return body
+
+@api.route("/api/ingest", methods=["POST"])
+def ingest():
+    """Ingest an NDJSON batch of samples from a remote agent"""
+    try:
+        if INGEST_TOKEN and request.headers.get("Authorization") != f"Bearer {INGEST_TOKEN}":
+            return jsonify({
+                "status": "error",
+                "message": "Invalid ingest token",
+                "timestamp": datetime.now().isoformat()
+            }), 401
+        
+        agent = request.headers.get("X-Agent-Name", request.remote_addr)
+        samples = []
+        rejected = 0
+        for line in _read_ingest_body().splitlines():
+            if not line.strip():
+                continue
+            try:
+                sample = json.loads(line)
+            except ValueError:
+                rejected += 1
+                continue
+            if not isinstance(sample, dict) or not sample.get("sample_id") or not sample.get("timestamp"):
+                rejected += 1
+                continue
+            sample.setdefault("agent", agent)
+            samples.append(sample)
+        if len(samples) > MAX_INGEST_SAMPLES:
+            raise RequestEntityTooLarge(f"Batch exceeds {MAX_INGEST_SAMPLES} samples")
+        
+        inserted = save_test_results(samples) if samples else []
+        for sample in inserted:
+            publish_sample(sample)
+        logger.info(f"Ingested batch from {agent}: {len(inserted)} new, "
+                    f"{len(samples) - len(inserted)} duplicates, {rejected} rejected")
+        return jsonify({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "data": {
+                "accepted": len(inserted),
+                "duplicates": len(samples) - len(inserted),
+                "rejected": rejected
+            }
+        })
+    except RequestEntityTooLarge as e:
+        # Size limits are not the batch's fault: agents keep it and retry smaller batches
+        return jsonify({
+            "status": "error",
+            "message": e.description,
+            "timestamp": datetime.now().isoformat()
+        }), 413
+    except (ValueError, zlib.error) as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in /api/ingest: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@api.route("/api/wifi_signal", methods=["GET"])
 def wifi_signal():
     """Get WiFi signal strength"""
     try:
@@ -143,37 +368,159 @@ def wifi_signal():
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@app.route("/api/historical/<timeframe>", methods=["GET"])
+def _list_arg(name):
+    """Read a query parameter given repeatedly and/or as a comma-separated list"""
+    values = []
+    for value in request.args.getlist(name):
+        values.extend(v.strip() for v in value.split(',') if v.strip())
+    return values
+
+@api.route("/api/historical", methods=["GET"])
+@response_cache.cached
+def historical_query():
+    """Query historical data over any window, with filters and SQL-side grouping and aggregation"""
+    try:
+        logger.info("API request received: /api/historical")
+        query = {
+            "start": request.args.get("start"),
+            "end": request.args.get("end"),
+            "timeframe": request.args.get("timeframe"),
+            "protocols": _list_arg("protocol"),
+            "targets": _list_arg("target"),
+            "agents": _list_arg("agent"),
+            "group_by": _list_arg("group_by"),
+            "bucket": request.args.get("bucket"),
+            "metrics": _list_arg("metrics"),
+            "aggregates": _list_arg("agg")
+        }
+        # One extra row tells whether the window held more than the cap
+        data = query_historical(**query, limit=MAX_HISTORY_ROWS + 1)
+        truncated = len(data) > MAX_HISTORY_ROWS
+        return _historical_response({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "query": {k: v for k, v in query.items() if v},
+            "truncated": truncated
+        }, data[-MAX_HISTORY_ROWS:], series_fields=query["group_by"])
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in /api/historical: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@api.route("/api/historical/<timeframe>", methods=["GET"])
+@response_cache.cached
 def historical_data(timeframe):
     """Get historical data for specified timeframe (24h, 7d, 30d)"""
     try:
         logger.info(f"API request received: /api/historical/{timeframe}")
         data = get_historical_data(timeframe)
+        return _historical_response({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "timeframe": timeframe
+        }, data)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in /api/historical/{timeframe}: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@api.route("/api/latency_distribution", methods=["GET"])
+@response_cache.cached
+def latency_distribution():
+    """Latency percentiles merged from the per-interval RTT histograms of the probes"""
+    try:
+        logger.info("API request received: /api/latency_distribution")
+        query = {
+            "start": request.args.get("start"),
+            "end": request.args.get("end"),
+            "timeframe": request.args.get("timeframe"),
+            "probes": _list_arg("probe"),
+            "targets": _list_arg("target"),
+            "protocols": _list_arg("protocol"),
+            "group_by": _list_arg("group_by"),
+            "bucket": request.args.get("bucket")
+        }
+        percentiles = _list_arg("percentiles")
+        try:
+            query["percentiles"] = [float(p) for p in percentiles] if percentiles else DEFAULT_PERCENTILES
+        except ValueError:
+            raise ValueError(f"Invalid percentiles: {','.join(percentiles)}")
+        data = get_latency_distribution(**query)
         return jsonify({
             "status": "success",
             "timestamp": datetime.now().isoformat(),
-            "timeframe": timeframe,
+            "query": {k: v for k, v in query.items() if v},
             "count": len(data),
             "data": data
         })
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
     except Exception as e:
-        logger.error(f"Error in /api/historical/{timeframe}: {str(e)}")
+        logger.error(f"Error in /api/latency_distribution: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@api.route("/api/anomalies", methods=["GET"])
+@response_cache.cached
+def anomalies():
+    """Get recent anomaly detections"""
+    try:
+        logger.info("API request received: /api/anomalies")
+        limit = min(request.args.get("limit", 100, type=int), 1000)
+        data = get_anomalies(
+            since=request.args.get("since"),
+            target=request.args.get("target"),
+            metric=request.args.get("metric"),
+            limit=limit
+        )
+        return jsonify({
+            "status": "success",
+            "timestamp": datetime.now().isoformat(),
+            "count": len(data),
+            "data": data
+        })
+    except Exception as e:
+        logger.error(f"Error in /api/anomalies: {str(e)}")
         return jsonify({
             "status": "error",
             "message": str(e),
             "timestamp": datetime.now().isoformat()
         }), 500
 
-@app.route("/api/docs", methods=["GET"])
+@api.route("/api/docs", methods=["GET"])
 def api_docs():
     """Serve API documentation"""
-    return send_from_directory(app.static_folder, 'api-docs.html')
+    return send_from_directory(current_app.static_folder, 'api-docs.html')
 
-# Generate Swagger JSON file for API documentation
-@app.route("/api/swagger.json", methods=["GET"])
-def swagger_json():
-    """Serve Swagger JSON specification"""
-    swagger_spec = {
+# Swagger JSON specification for API documentation
+def build_swagger_spec():
+    """Build the Swagger JSON specification"""
+    return {
         "openapi": "3.0.0",
         "info": {
             "title": "Network Metrics API",
@@ -204,6 +551,26 @@ def swagger_json():
                     }
                 }
             },
+            "/api/metrics/latest": {
+                "get": {
+                    "summary": "Get the most recently collected metrics without running probes",
+                    "responses": {
+                        "200": {
+                            "description": "Successful response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object"
+                                    }
+                                }
+                            }
+                        },
+                        "404": {
+                            "description": "No metrics collected yet"
+                        }
+                    }
+                }
+            },
             "/api/protocol_test/{protocol}": {
                 "get": {
                     "summary": "Test specific protocol performance",
@@ -233,6 +600,63 @@ def swagger_json():
                     }
                 }
             },
+            "/api/jobs": {
+                "post": {
+                    "summary": "Queue a measurement job; identical queued jobs are merged",
+                    "requestBody": {
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "type": {"type": "string", "enum": ["metrics", "protocol_test", "wifi_signal"]},
+                                        "protocol": {"type": "string", "enum": ["tcp", "udp", "http", "https", "icmp"]},
+                                        "priority": {"type": "integer", "description": "Lower runs first (default 5)"}
+                                    }
+                                }
+                            }
+                        }
+                    },
+                    "responses": {
+                        "202": {"description": "Job queued (or merged into an identical queued job)"},
+                        "400": {"description": "Invalid job request"},
+                        "503": {"description": "Job queue full"}
+                    }
+                }
+            },
+            "/api/jobs/{job_id}": {
+                "get": {
+                    "summary": "Get job status (queued, running, succeeded, failed) and result",
+                    "parameters": [
+                        {"name": "job_id", "in": "path", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "responses": {
+                        "200": {"description": "Job status"},
+                        "404": {"description": "Unknown job"}
+                    }
+                }
+            },
+            "/api/ingest": {
+                "post": {
+                    "summary": "Ingest a batch of samples from a remote agent",
+                    "description": "Newline-delimited JSON, optionally gzip-compressed (Content-Encoding: gzip). Samples are deduplicated on sample_id.",
+                    "requestBody": {
+                        "content": {
+                            "application/x-ndjson": {
+                                "schema": {
+                                    "type": "string"
+                                }
+                            }
+                        }
+                    },
+                    "responses": {
+                        "200": {"description": "Counts of accepted, duplicate and rejected samples"},
+                        "400": {"description": "Malformed batch"},
+                        "401": {"description": "Invalid ingest token"},
+                        "413": {"description": "Batch exceeds the size or sample limit"}
+                    }
+                }
+            },
             "/api/wifi_signal": {
                 "get": {
                     "summary": "Get WiFi signal strength",
@@ -250,6 +674,46 @@ def swagger_json():
                     }
                 }
             },
+            "/api/historical": {
+                "get": {
+                    "summary": "Query historical data over any window, optionally grouped and aggregated",
+                    "description": "Without group_by or agg the matching rows are returned; otherwise one row per group with a count and <metric>_<agg> values, computed in the database",
+                    "parameters": [
+                        {"name": "start", "in": "query", "schema": {"type": "string"}, "description": "ISO timestamp, defaults to end minus timeframe"},
+                        {"name": "end", "in": "query", "schema": {"type": "string"}, "description": "ISO timestamp, defaults to now"},
+                        {"name": "timeframe", "in": "query", "schema": {"type": "string"}, "description": "Window length when start is omitted, e.g. 6h or 7d (default 24h)"},
+                        {"name": "protocol", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated protocols to include"},
+                        {"name": "target", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated targets to include"},
+                        {"name": "agent", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated agents to include ('local' for this server)"},
+                        {"name": "group_by", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated subset of time, protocol, target, agent"},
+                        {"name": "bucket", "in": "query", "schema": {"type": "string"}, "description": "Time bucket for group_by=time, e.g. 5m, 1h, 1d (default 1h)"},
+                        {"name": "metrics", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated metrics, defaults to all"},
+                        {"name": "agg", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated subset of avg, min, max, sum, count (default avg when grouping)"},
+                        {"name": "format", "in": "query", "schema": {"type": "string", "enum": ["json", "columnar", "msgpack"]}, "description": "Response encoding; columnar returns one array per field with a delta-encoded timestamp array (also negotiable via Accept)"},
+                        {"name": "max_points", "in": "query", "schema": {"type": "integer", "minimum": 3}, "description": "Downsample each series to at most this many points with LTTB, keeping peaks and dips"}
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Successful response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "status": {"type": "string"},
+                                            "timestamp": {"type": "string"},
+                                            "query": {"type": "object"},
+                                            "count": {"type": "integer"},
+                                            "data": {"type": "array"}
+                                        }
+                                    }
+                                }
+                            }
+                        },
+                        "400": {"description": "Invalid query parameters"}
+                    }
+                }
+            },
             "/api/historical/{timeframe}": {
                 "get": {
                     "summary": "Get historical data for the specified timeframe",
@@ -263,7 +727,9 @@ def swagger_json():
                                 "enum": ["24h", "7d", "30d"]
                             },
                             "description": "Time period for historical data (24 hours, 7 days, or 30 days)"
-                        }
+                        },
+                        {"name": "format", "in": "query", "schema": {"type": "string", "enum": ["json", "columnar", "msgpack"]}, "description": "Response encoding; columnar returns one array per field with a delta-encoded timestamp array (also negotiable via Accept)"},
+                        {"name": "max_points", "in": "query", "schema": {"type": "integer", "minimum": 3}, "description": "Downsample each series to at most this many points with LTTB, keeping peaks and dips"}
                     ],
                     "responses": {
                         "200": {
@@ -282,6 +748,67 @@ def swagger_json():
                                     }
                                 }
                             }
+                        },
+                        "400": {"description": "Unknown timeframe"}
+                    }
+                }
+            },
+            "/api/latency_distribution": {
+                "get": {
+                    "summary": "Latency percentiles over any window, merged from per-interval RTT histograms",
+                    "description": "ICMP, DNS and HTTP probes record every round trip into log-bucketed histograms (within about 1% of the true value); results are always split by probe. Only this server's collector records histograms, so there is no agent filter",
+                    "parameters": [
+                        {"name": "start", "in": "query", "schema": {"type": "string"}, "description": "ISO timestamp, defaults to end minus timeframe"},
+                        {"name": "end", "in": "query", "schema": {"type": "string"}, "description": "ISO timestamp, defaults to now"},
+                        {"name": "timeframe", "in": "query", "schema": {"type": "string"}, "description": "Window length when start is omitted, e.g. 6h or 30d (default 24h)"},
+                        {"name": "probe", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated subset of icmp, dns, http"},
+                        {"name": "target", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated targets to include"},
+                        {"name": "protocol", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated protocols to include"},
+                        {"name": "group_by", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated subset of time, target, protocol"},
+                        {"name": "bucket", "in": "query", "schema": {"type": "string"}, "description": "Time bucket for group_by=time, e.g. 1h or 1d (default 1h)"},
+                        {"name": "percentiles", "in": "query", "schema": {"type": "string"}, "description": "Comma-separated percentiles (default 50,90,99,99.9)"}
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Successful response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "status": {"type": "string"},
+                                            "timestamp": {"type": "string"},
+                                            "query": {"type": "object"},
+                                            "count": {"type": "integer"},
+                                            "data": {"type": "array"}
+                                        }
+                                    }
+                                }
+                            }
+                        },
+                        "400": {"description": "Invalid query parameters"}
+                    }
+                }
+            },
+            "/api/anomalies": {
+                "get": {
+                    "summary": "Get recent anomaly detections (latency spikes, loss bursts, throughput drops)",
+                    "parameters": [
+                        {"name": "since", "in": "query", "schema": {"type": "string"}, "description": "ISO timestamp, defaults to 24 hours ago"},
+                        {"name": "target", "in": "query", "schema": {"type": "string"}},
+                        {"name": "metric", "in": "query", "schema": {"type": "string"}},
+                        {"name": "limit", "in": "query", "schema": {"type": "integer", "default": 100}}
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Successful response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object"
+                                    }
+                                }
+                            }
                         }
                     }
                 }
@@ -322,37 +849,61 @@ def swagger_json():
             }
         }
     }
-    return jsonify(swagger_spec)
+
+@api.route("/api/swagger.json", methods=["GET"])
+def swagger_json():
+    """Serve Swagger JSON specification"""
+    return swagger_asset.respond(request)
 
 # Serve front-end application
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+@api.route('/', defaults={'path': ''})
+@api.route('/<path:path>')
 def serve_app(path):
-    """Serve the front-end application"""
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, 'index.html')
-
-# Function to run metrics collection in background
-def background_metrics_collection():
-    """Background thread to periodically collect and store metrics"""
-    while True:
-        try:
-            metrics = collect_metrics()
-            store_metrics_in_db(metrics)
-            save_metrics_to_csv(metrics)
-            logger.info("Background metrics collection completed")
-        except Exception as e:
-            logger.error(f"Error in background metrics collection: {str(e)}")
-        time.sleep(300)  # Collect metrics every 5 minutes
+    """Serve the front-end application from the in-memory asset snapshot"""
+    return static_assets.respond(static_assets.get(path), request)
+
+def _initialize(static_folder):
+    """One-time per-process setup: schema, sample pipeline and in-memory responses"""
+    global static_assets, swagger_asset
+    with _init_lock:
+        if static_assets is not None:
+            return
+        started = time.perf_counter()
+
+        # Schema before any worker accepts traffic, not lazily inside the first request
+        init_db()
+
+        # Alerting, anomaly detection, export and the latest-sample cache for every collected sample
+        init_pipeline()
+
+        # Dashboard files (and build_assets.py bundles) are loaded once and served from memory
+        os.makedirs(static_folder, exist_ok=True)
+        static_assets = StaticAssets(static_folder)
+
+        # Swagger spec serialized and compressed once
+        swagger_asset = StaticAsset(json.dumps(build_swagger_spec()).encode('utf-8'), 'application/json',
+                                    SWAGGER_CACHE_CONTROL).compress()
+        logger.info(f"API initialized in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def create_app():
+    """Create the API app; schema and warmup run once per process, before it is returned
+
+    Importing this module has no side effects. Probe backends (ping3,
+    speedtest) are imported only when a measurement first runs.
+    """
+    configure_logging('api_server.log')
+    app = Flask(__name__, static_folder=STATIC_FOLDER)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    app.register_blueprint(api)
+    _initialize(app.static_folder)
+    return app
 
 if __name__ == "__main__":
-    # Initialize database
-    init_db()
-    
-    # Start background metrics collection
-    metrics_thread = threading.Thread(target=background_metrics_collection, daemon=True)
-    metrics_thread.start()
+    app = create_app()
+
+    # Start background metrics collection (stands by if a collector daemon already leads)
+    start_embedded_collector()
     
     # Start the Flask server
     logger.info("Starting Network Metrics API server")
@@ -0,0 +1,82 @@
+"""
+Per-sample cost benchmark for the streaming anomaly detector and latency histograms.
+
+The anomaly run scores synthetic samples across many series, as the pipeline
+does for every collected sample. The histogram run records a lognormal
+latency sample and compares its percentiles and encoded size with the exact
+values.
+
+    python bench_detectors.py
+    python bench_detectors.py --series 5000 --steps 50 --samples 500000
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+
+from anomaly import AnomalyDetector
+from histogram import LatencyHistogram
+
+
+def bench_anomaly(series, steps, seed=1):
+    """Score steps samples for each of series targets; returns (samples, series, seconds)"""
+    rng = random.Random(seed)
+    detector = AnomalyDetector()
+    targets = [f"10.0.{i // 256}.{i % 256}" for i in range(series)]
+    start_ts = time.time()
+    n = 0
+    started = time.perf_counter()
+    for step in range(steps):
+        for target in targets:
+            detector.observe({
+                "target": target,
+                "timestamp": datetime.fromtimestamp(start_ts + step * 300).isoformat(),
+                "latency": rng.gauss(20, 2),
+                "jitter": rng.gauss(3, 0.5),
+                "dns_lookup_time": rng.gauss(5, 1),
+                "packet_loss": 0.0,
+                "download_speed": rng.gauss(100, 5),
+                "upload_speed": rng.gauss(40, 2),
+            })
+            n += 1
+    return n, detector.series_count(), time.perf_counter() - started
+
+
+def bench_histogram(count, seed=1):
+    """Record count lognormal samples; returns (sorted samples, histogram, seconds)"""
+    rng = random.Random(seed)
+    samples = [rng.lognormvariate(3, 0.6) for _ in range(count)]
+    histogram = LatencyHistogram()
+    started = time.perf_counter()
+    for sample in samples:
+        histogram.record(sample)
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return samples, histogram, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure anomaly detection and histogram recording cost")
+    parser.add_argument('--series', type=int, default=2000, help="Targets scored by the anomaly detector")
+    parser.add_argument('--steps', type=int, default=20, help="Samples per target")
+    parser.add_argument('--samples', type=int, default=100000, help="Latencies recorded into the histogram")
+    args = parser.parse_args()
+
+    n, series, elapsed = bench_anomaly(args.series, args.steps)
+    print(f"Anomaly detection: {n} samples across {series} series, {elapsed / n * 1e6:.1f} us/sample")
+
+    samples, histogram, elapsed = bench_histogram(args.samples)
+    print(f"\nHistogram: {len(samples)} samples in {len(histogram.to_bytes())} bytes, "
+          f"{elapsed / len(samples) * 1e6:.2f} us per record")
+    for p in (50, 90, 99, 99.9):
+        exact = samples[int(len(samples) * p / 100) - 1]
+        estimate = histogram.percentile(p)
+        print(f"  p{p:<5g} exact {exact:9.3f} ms  histogram {estimate:9.3f} ms  "
+              f"error {abs(estimate - exact) / exact:.3%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Cold-start benchmark for API workers.
+
+Every run starts a fresh interpreter in an empty scratch directory, as a new
+WSGI worker or a restarted container would, and times `import app1` and
+`create_app()` (schema, pipeline and warmup) separately. Imports are traced
+with -X importtime so the cost is attributed to app1's direct imports, and
+the run fails when a probe backend is loaded before a measurement needs it.
+
+    python bench_startup.py --runs 10
+    python bench_startup.py --budget-ms 400 --json startup.json
+
+Exits non-zero when the median import time exceeds --budget-ms or a lazy
+module was imported, so CI catches regressions as probes are added.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+logger = logging.getLogger('network_bench')
+
+# Probe dependencies that only measurements may import (metricsmeasure._backend)
+LAZY_MODULES = ('ping3', 'speedtest')
+
+CHILD_SCRIPT = r'''
+import json, sys, time
+started = time.perf_counter()
+import app1
+imported = time.perf_counter()
+app1.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "modules": sorted(sys.modules)
+}))
+'''
+
+
+def parse_importtime(stderr, root='app1'):
+    """Cumulative import time in ms of each direct import of `root`
+
+    -X importtime prints a module after everything it imports, indented by
+    two spaces per nesting level, so the direct imports of root are the
+    level-1 lines printed before root's own line.
+    """
+    direct = {}
+    total = None
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        name = name.strip()
+        if level == 0:
+            if name == root:
+                total = int(cumulative) / 1000
+                break
+            direct = {}  # those were imports of another top-level module
+        elif level == 1:
+            direct[name] = int(cumulative) / 1000
+    return total, direct
+
+
+def run_once(repo_dir, python=sys.executable):
+    """Time one cold start in a new interpreter and an empty working directory"""
+    workdir = tempfile.mkdtemp(prefix='network-startup-')
+    try:
+        env = dict(os.environ, PYTHONPATH=repo_dir)
+        proc = subprocess.run([python, '-X', 'importtime', '-c', CHILD_SCRIPT], cwd=workdir, env=env,
+                              capture_output=True, text=True, timeout=120)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Startup failed:\n{proc.stderr[-2000:]}")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["importtime_ms"], result["direct_imports"] = parse_importtime(proc.stderr)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(results, top=10):
+    imports = [r["import_ms"] for r in results]
+    creates = [r["create_app_ms"] for r in results]
+    per_module = defaultdict(list)
+    for r in results:
+        for name, ms in r["direct_imports"].items():
+            per_module[name].append(ms)
+    heaviest = sorted(((name, statistics.median(v)) for name, v in per_module.items()),
+                      key=lambda item: item[1], reverse=True)[:top]
+    loaded = sorted({m for r in results for m in r["modules"] if m.split('.')[0] in LAZY_MODULES})
+    return {
+        "runs": len(results),
+        "import_ms": {"median": statistics.median(imports), "min": min(imports), "max": max(imports)},
+        "create_app_ms": {"median": statistics.median(creates), "min": min(creates), "max": max(creates)},
+        "heaviest_imports": [{"module": name, "ms": round(ms, 1)} for name, ms in heaviest],
+        "lazy_modules_loaded": loaded
+    }
+
+
+def print_report(summary):
+    imp, create = summary["import_ms"], summary["create_app_ms"]
+    print(f"\nCold start over {summary['runs']} runs (median / min / max)")
+    print(f"  import app1   {imp['median']:8.1f} {imp['min']:8.1f} {imp['max']:8.1f} ms")
+    print(f"  create_app()  {create['median']:8.1f} {create['min']:8.1f} {create['max']:8.1f} ms")
+    print("\nHeaviest direct imports of app1 (median cumulative ms)")
+    for item in summary["heaviest_imports"]:
+        print(f"  {item['module']:<28} {item['ms']:8.1f}")
+    loaded = summary["lazy_modules_loaded"]
+    print(f"\nProbe backends loaded at startup: {', '.join(loaded) if loaded else 'none'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API worker import and initialization time")
+    parser.add_argument('--runs', type=int, default=5, help="Cold starts to measure")
+    parser.add_argument('--budget-ms', type=float, help="Fail when the median import time exceeds this")
+    parser.add_argument('--top', type=int, default=10, help="Direct imports to list")
+    parser.add_argument('--json', dest='json_path', help="Also write the summary to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    run_once(repo_dir)  # compile bytecode so every measured run starts from the same state
+    results = [run_once(repo_dir) for _ in range(args.runs)]
+    summary = summarize(results, args.top)
+    print_report(summary)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Summary written to {args.json_path}")
+
+    failed = False
+    if summary["lazy_modules_loaded"]:
+        logger.error(f"Probe backends imported at startup: {', '.join(summary['lazy_modules_loaded'])}")
+        failed = True
+    if args.budget_ms is not None and summary["import_ms"]["median"] > args.budget_ms:
+        logger.error(f"Median import time {summary['import_ms']['median']:.1f} ms exceeds "
+                     f"the {args.budget_ms:g} ms budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Static asset build for the dashboard.
+
+Concatenates the scripts and stylesheets referenced by static/index.html into
+content-hashed bundles, minifies them, precompresses them with gzip (and
+Brotli when the optional brotli package is installed) and writes
+static/dist/ with a manifest.json and an index.html that loads the bundles.
+app1.py serves the result from memory with immutable cache headers.
+
+    python build_assets.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('network_assets')
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+SCRIPT_TAG = re.compile(r'[ \t]*<script\s+src="([^":]+?\.js)"\s*>\s*</script>[ \t]*\n?')
+STYLESHEET_TAG = re.compile(r'[ \t]*<link\s+rel="stylesheet"\s+href="([^":]+?\.css)"\s*/?>[ \t]*\n?')
+
+# A '/' after one of these (or at the start) begins a regular expression literal, not a division
+REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'throw', 'delete', 'new')
+
+
+def minify_js(source):
+    """Strip comments, indentation and blank lines while keeping literals intact
+
+    Deliberately conservative: line breaks are kept so automatic semicolon
+    insertion behaves exactly as in the original sources.
+    """
+    out = []
+    pending = ''  # collapsed whitespace waiting for the next token
+    last = ''     # last significant character written
+    word = ''     # identifier or keyword ending at `last`
+    i = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c.isspace():
+            if out and pending != '\n':
+                pending = '\n' if c == '\n' else ' '
+            i += 1
+            continue
+        if c == '/' and source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end == -1 else end
+            continue
+        if c == '/' and source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            if out and not pending:
+                pending = ' '
+            continue
+
+        out.append(pending)
+        pending = ''
+        if c in '\'"`' or (c == '/' and (not last or last in REGEX_PRECEDERS or word in REGEX_KEYWORDS)):
+            # String, template or regex literal: copy verbatim up to the closing delimiter
+            j = i + 1
+            in_class = False
+            while j < n and (source[j] != c or in_class):
+                if source[j] == '\\':
+                    j += 1
+                elif c == '/' and source[j] == '[':
+                    in_class = True
+                elif c == '/' and source[j] == ']':
+                    in_class = False
+                j += 1
+            out.append(source[i:j + 1])
+            last, word = c, ''
+            i = j + 1
+            continue
+
+        out.append(c)
+        if c.isalnum() or c in '_$':
+            word = word + c if last.isalnum() or last in '_$' else c
+        else:
+            word = ''
+        last = c
+        i += 1
+    return ''.join(out) + '\n'
+
+
+def minify_css(source):
+    """Strip comments and collapse whitespace around CSS punctuation"""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    return source.replace(';}', '}').strip() + '\n'
+
+
+def _write_bundle(dist_dir, name, ext, content):
+    """Write a content-hashed bundle and its precompressed variants; returns the file name"""
+    data = content.encode('utf-8')
+    filename = f"{name}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+    path = os.path.join(dist_dir, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+    logger.info(f"Wrote {filename} ({len(data)} bytes)")
+    return filename
+
+
+def _replace_tags(pattern, html, bundle_tag):
+    """Replace the first matching tag with the bundle tag and drop the others"""
+    first = [True]
+
+    def replace(match):
+        if first[0]:
+            first[0] = False
+            return bundle_tag
+        return ''
+    return pattern.sub(replace, html)
+
+
+def build(static_dir=STATIC_DIR, minify=True):
+    """Build bundles, manifest and index.html into static/dist; returns the manifest"""
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    os.makedirs(dist_dir, exist_ok=True)
+    for old in os.listdir(dist_dir):
+        os.remove(os.path.join(dist_dir, old))
+
+    with open(os.path.join(static_dir, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+
+    scripts = SCRIPT_TAG.findall(html)
+    stylesheets = STYLESHEET_TAG.findall(html)
+
+    sources = []
+    for script in scripts:
+        with open(os.path.join(static_dir, script), encoding='utf-8') as f:
+            source = f.read()
+        sources.append(minify_js(source) if minify else source)
+    # Each file is a classic script; the separator guards against a missing final semicolon
+    js_bundle = _write_bundle(dist_dir, 'app', 'js', ';\n'.join(sources))
+
+    css_sources = []
+    for stylesheet in stylesheets:
+        with open(os.path.join(static_dir, stylesheet), encoding='utf-8') as f:
+            source = f.read()
+        css_sources.append(minify_css(source) if minify else source)
+    css_bundle = _write_bundle(dist_dir, 'app', 'css', '\n'.join(css_sources)) if css_sources else None
+
+    html = _replace_tags(SCRIPT_TAG, html, f'    <script src="/{DIST_DIRNAME}/{js_bundle}"></script>\n')
+    if css_bundle:
+        html = _replace_tags(STYLESHEET_TAG, html,
+                             f'    <link rel="stylesheet" href="/{DIST_DIRNAME}/{css_bundle}">\n')
+    with open(os.path.join(dist_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    manifest = {
+        "app.js": f"{DIST_DIRNAME}/{js_bundle}",
+        "sources": {"app.js": scripts}
+    }
+    if css_bundle:
+        manifest["app.css"] = f"{DIST_DIRNAME}/{css_bundle}"
+        manifest["sources"]["app.css"] = stylesheets
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Bundled {len(scripts)} scripts and {len(stylesheets)} stylesheets into {dist_dir}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hashed, minified and precompressed dashboard bundles")
+    parser.add_argument('--static', default=STATIC_DIR, help="Static folder containing index.html")
+    parser.add_argument('--no-minify', action='store_true', help="Concatenate without minifying")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    build(args.static, minify=not args.no_minify)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Standalone network metrics collector.
+
+Exactly one process measures at a time: collectors elect a leader through an
+exclusive lock on a shared lock file, and the leader publishes each sample to
+the shared SQLite store and the latest-sample cache read by API workers.
+Standby collectors keep retrying the lock and take over when the leader exits,
+since the operating system releases the lock with the process.
+
+Run as a daemon next to any number of WSGI workers:
+
+    python collector.py --interval 300
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from metricsmeasure import collect_metrics, configure_logging, init_db, save_metrics_to_csv, store_metrics_in_db
+from pipeline import init_pipeline, shutdown_pipeline
+
+logger = logging.getLogger('network_collector')
+
+COLLECTOR_LOCK_PATH = os.environ.get('COLLECTOR_LOCK_PATH', 'collector.lock')
+COLLECTION_INTERVAL = int(os.environ.get('COLLECTION_INTERVAL', 300))  # seconds
+STANDBY_RETRY_INTERVAL = 15  # seconds between leadership attempts
+
+
+class LeaderLock:
+    """Non-blocking exclusive file lock used for leader election"""
+
+    def __init__(self, path=COLLECTOR_LOCK_PATH):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def try_acquire(self):
+        """Try to become leader; returns True if the lock is now held"""
+        if self._file is not None:
+            return True
+        f = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        f.truncate()
+        f.write(f"{os.getpid()}\n")
+        f.flush()
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def collect_once():
+    """Run one collection and publish it to every store"""
+    metrics = collect_metrics()
+    store_metrics_in_db(metrics)
+    save_metrics_to_csv(metrics)
+    return metrics
+
+
+class Collector:
+    """Periodic collection loop that only measures while holding leadership"""
+
+    def __init__(self, interval=COLLECTION_INTERVAL, lock=None, retry_interval=STANDBY_RETRY_INTERVAL):
+        self.interval = interval
+        self.lock = lock if lock is not None else LeaderLock()
+        self.retry_interval = retry_interval
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.is_set():
+            if not self.lock.held:
+                if not self.lock.try_acquire():
+                    self._stop.wait(self.retry_interval)
+                    continue
+                logger.info(f"Acquired collector leadership (pid {os.getpid()})")
+
+            started = time.monotonic()
+            try:
+                collect_once()
+                logger.info("Background metrics collection completed")
+            except Exception as e:
+                logger.error(f"Error in background metrics collection: {str(e)}")
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+        self.lock.release()
+
+    def stop(self):
+        self._stop.set()
+
+
+def start_embedded_collector(interval=COLLECTION_INTERVAL):
+    """Run a collector thread inside a server process; it stands by while another process leads"""
+    collector = Collector(interval=interval)
+    thread = threading.Thread(target=collector.run, name="metrics-collector", daemon=True)
+    thread.start()
+    return collector
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Network metrics collector daemon")
+    parser.add_argument('--interval', type=int, default=COLLECTION_INTERVAL,
+                        help="Seconds between collections")
+    parser.add_argument('--lock', default=COLLECTOR_LOCK_PATH, help="Leader election lock file")
+    parser.add_argument('--once', action='store_true', help="Collect a single sample if leader, then exit")
+    args = parser.parse_args()
+
+    configure_logging('collector.log')
+
+    init_db()
+    init_pipeline()
+
+    lock = LeaderLock(args.lock)
+    try:
+        if args.once:
+            if lock.try_acquire():
+                collect_once()
+            else:
+                logger.info("Another collector is leading, nothing to do")
+        else:
+            logger.info(f"Starting collector (interval {args.interval}s, lock {args.lock})")
+            Collector(interval=args.interval, lock=lock).run()
+    except KeyboardInterrupt:
+        logger.info("Collector stopped")
+    finally:
+        lock.release()
+        shutdown_pipeline()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Compact columnar encoding for historical query results.
+
+Row-oriented JSON repeats every key name on every row. The columnar form
+stores one array per field plus a shared timestamp array, delta-encoded in
+milliseconds from the first sample, which is small on its own and compresses
+very well:
+
+    {"start": 1760000000000, "timestamp": [0, 300000, 300012, ...],
+     "columns": {"protocol": ["tcp", ...], "latency": [12.3, ...]}}
+"""
+
+from datetime import datetime
+
+# Accept header media types and their ?format= equivalents
+COLUMNAR_MIMETYPE = 'application/vnd.network-metrics.columnar+json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+# Nested copy of the full sample; redundant with the columns
+SKIPPED_FIELDS = ('data',)
+
+
+def _epoch_ms(value):
+    return int(round(datetime.fromisoformat(value).timestamp() * 1000))
+
+
+def encode_columnar(rows, time_field=None):
+    """Convert a list of row dicts into column arrays with a delta-encoded time axis"""
+    if time_field is None:
+        time_field = 'timestamp' if rows and 'timestamp' in rows[0] else 'time'
+    fields = []
+    for row in rows[:1]:
+        fields = [k for k in row if k != time_field and k not in SKIPPED_FIELDS]
+
+    start = None
+    deltas = []
+    if rows and time_field in rows[0]:
+        previous = start = _epoch_ms(rows[0][time_field])
+        for row in rows:
+            current = _epoch_ms(row[time_field])
+            deltas.append(current - previous)
+            previous = current
+
+    return {
+        "start": start,
+        "timestamp": deltas,
+        "columns": {field: [row.get(field) for row in rows] for field in fields}
+    }
+
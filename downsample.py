@@ -0,0 +1,96 @@
+"""
+Largest-Triangle-Three-Buckets (LTTB) downsampling for chart data.
+
+LTTB keeps the point of each bucket that forms the largest triangle with the
+point kept from the previous bucket and the average of the next one, so peaks
+and dips such as packet-loss spikes survive where plain averaging or striding
+would flatten them. Bucket averages are computed for all buckets at once and
+each bucket's triangle areas in a single numpy operation.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points LTTB keeps when reducing (x, y) to `threshold` points"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are always kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = ends - starts
+    next_x = np.append(((cx[ends] - cx[starts]) / sizes)[1:], x[-1])
+    next_y = np.append(((cy[ends] - cy[starts]) / sizes)[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        s, e = starts[i], ends[i]
+        area = np.abs((x[a] - next_x[i]) * (y[s:e] - y[a]) - (x[a] - x[s:e]) * (next_y[i] - y[a]))
+        a = s + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _epoch(value):
+    return datetime.fromisoformat(value).timestamp()
+
+
+def significance(values):
+    """Combine the columns of values into one series of per-row significance
+
+    Each varying column is scaled by its range and measured as the distance
+    from its median, and a row takes the largest distance of any column, so a
+    spike or dip in any single field stands out in the combined series.
+    Constant columns contribute nothing.
+    """
+    if values.shape[1] == 0:
+        return np.zeros(len(values))
+    spread = np.ptp(values, axis=0)
+    varying = spread > 0
+    if not varying.any():
+        return np.zeros(len(values))
+    values = values[:, varying]
+    return (np.abs(values - np.median(values, axis=0)) / spread[varying]).max(axis=1)
+
+
+def downsample_rows(rows, max_points, fields, time_field='timestamp', series_fields=()):
+    """Reduce time-ordered rows to at most max_points per series with LTTB
+
+    LTTB runs once per series on the combined significance of all fields, so
+    an extreme value in any field is preserved and the point cap holds however
+    many fields vary. Rows are partitioned into series by series_fields (e.g.
+    protocol when grouping by time and protocol); order is kept.
+    """
+    if not rows or max_points is None or time_field not in rows[0]:
+        return rows
+    fields = [f for f in fields if f in rows[0]]
+
+    series = {}
+    for position, row in enumerate(rows):
+        series.setdefault(tuple(row.get(f) for f in series_fields), []).append(position)
+
+    keep = []
+    for positions in series.values():
+        if len(positions) <= max_points:
+            keep.extend(positions)
+            continue
+        if max_points < 3:
+            keep.extend([positions[0], positions[-1]][:max_points])
+            continue
+        x = np.array([_epoch(rows[p][time_field]) for p in positions])
+        values = np.array([[rows[p][field] for field in fields] for p in positions], dtype=float)
+        values = np.nan_to_num(values.reshape(len(positions), len(fields)), nan=0.0)  # NULL aggregates
+        keep.extend(positions[i] for i in lttb_indices(x, significance(values), max_points))
+    keep.sort()
+    return [rows[p] for p in keep]
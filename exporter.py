@@ -0,0 +1,208 @@
+"""
+Graphite / StatsD export of collected network metrics.
+
+Samples and per-probe timings are appended to a bounded in-memory queue and
+shipped in batches by a background thread. When the queue is full the oldest
+points are dropped, so a slow or unreachable Graphite never slows down
+measurement.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from metricsmeasure import sample_series
+
+logger = logging.getLogger('network_exporter')
+
+# Export configuration (overridable through the environment)
+METRICS_EXPORT = os.environ.get('METRICS_EXPORT', '').lower()  # "graphite", "statsd" or empty
+METRICS_PREFIX = os.environ.get('METRICS_PREFIX', 'network_analyzer')
+GRAPHITE_HOST = os.environ.get('GRAPHITE_HOST', 'graphite')
+GRAPHITE_PORT = int(os.environ.get('GRAPHITE_PORT', 2003))
+STATSD_HOST = os.environ.get('STATSD_HOST', 'graphite')
+STATSD_PORT = int(os.environ.get('STATSD_PORT', 8125))
+EXPORT_QUEUE_SIZE = int(os.environ.get('METRICS_EXPORT_QUEUE', 10000))
+
+_SANITIZE = re.compile(r'[^a-zA-Z0-9_-]')
+
+
+def sanitize(name):
+    """Make a name safe for use as a Graphite path component"""
+    return _SANITIZE.sub('_', str(name))
+
+
+class CarbonBackend:
+    """Carbon plaintext protocol over a persistent TCP connection"""
+
+    def __init__(self, host=GRAPHITE_HOST, port=GRAPHITE_PORT, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.socket = None
+
+    def send(self, points):
+        """Send (path, value, timestamp, kind) points; raises OSError on failure"""
+        payload = ''.join(f"{path} {value} {int(ts)}\n" for path, value, ts, kind in points)
+        if self.socket is None:
+            self.socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            self.socket.sendall(payload.encode('utf-8'))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
+
+class StatsdBackend:
+    """StatsD over UDP, packing as many metrics per datagram as fit the MTU"""
+
+    MAX_DATAGRAM = 1432
+
+    def __init__(self, host=STATSD_HOST, port=STATSD_PORT):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, points):
+        datagram = b''
+        for path, value, ts, kind in points:
+            line = f"{path}:{value}|{'ms' if kind == 'timing' else 'g'}".encode('utf-8')
+            if datagram and len(datagram) + len(line) + 1 > self.MAX_DATAGRAM:
+                self.socket.sendto(datagram, self.address)
+                datagram = b''
+            datagram = datagram + b'\n' + line if datagram else line
+        if datagram:
+            self.socket.sendto(datagram, self.address)
+
+    def close(self):
+        pass
+
+
+class MetricsExporter:
+    """Bounded, batching, drop-oldest exporter fed by the collection pipeline"""
+
+    def __init__(self, backend, prefix=METRICS_PREFIX, queue_size=EXPORT_QUEUE_SIZE,
+                 batch_size=500, flush_interval=1.0, max_backoff=30.0):
+        self.backend = backend
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._queue = deque(maxlen=queue_size)
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.dropped = 0
+        self.exported = 0
+
+    def _enqueue(self, points):
+        self._ensure_started()
+        queue = self._queue
+        for point in points:
+            if len(queue) == queue.maxlen:
+                self.dropped += 1
+            queue.append(point)  # deque(maxlen) evicts the oldest point
+        if len(queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def export_sample(self, sample):
+        """Sample handler: queue every numeric field of a collected sample"""
+        if "error" in sample:
+            return
+        try:
+            ts = datetime.fromisoformat(sample["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            ts = time.time()
+        base = (f"{self.prefix}.{sanitize(sample_series(sample))}."
+                f"{sanitize(sample.get('protocol', 'tcp'))}.")
+        self._enqueue([
+            (base + key, value, ts, 'gauge')
+            for key, value in sample.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ])
+
+    def export_timings(self, target, protocol, timings):
+        """Timing handler: queue per-probe durations in milliseconds"""
+        ts = time.time()
+        base = f"{self.prefix}.{sanitize(target)}.{sanitize(protocol)}.probe_ms."
+        self._enqueue([(base + sanitize(probe), round(ms, 3), ts, 'timing')
+                       for probe, ms in timings.items()])
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+                self._thread.start()
+
+    def _take_batch(self):
+        batch = []
+        queue = self._queue
+        while queue and len(batch) < self.batch_size:
+            batch.append(queue.popleft())
+        return batch
+
+    def _run(self):
+        backoff = 1.0
+        batch = []
+        while self._running or self._queue or batch:
+            if not batch:
+                if len(self._queue) < self.batch_size and self._running:
+                    self._wakeup.wait(self.flush_interval)
+                    self._wakeup.clear()
+                batch = self._take_batch()
+                if not batch:
+                    continue
+            try:
+                self.backend.send(batch)
+                self.exported += len(batch)
+                batch = []
+                backoff = 1.0
+            except OSError as e:
+                # Keep retrying the in-flight batch; new points keep evicting the oldest ones
+                logger.warning(f"Metrics export failed ({e}), retrying in {backoff:.0f}s")
+                if not self._running:
+                    break
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            except Exception as e:
+                logger.error(f"Metrics export failed, dropping {len(batch)} points: {e}")
+                self.dropped += len(batch)
+                batch = []
+        self.backend.close()
+
+    def stop(self, timeout=5):
+        """Flush what can be sent and stop the worker"""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def create_exporter(kind=METRICS_EXPORT):
+    """Build the configured exporter, or None when export is disabled"""
+    if kind == 'graphite':
+        logger.info(f"Exporting metrics to carbon at {GRAPHITE_HOST}:{GRAPHITE_PORT}")
+        return MetricsExporter(CarbonBackend())
+    if kind == 'statsd':
+        logger.info(f"Exporting metrics to StatsD at {STATSD_HOST}:{STATSD_PORT}")
+        return MetricsExporter(StatsdBackend())
+    if kind:
+        logger.warning(f"Unknown METRICS_EXPORT backend: {kind}")
+    return None
@@ -0,0 +1,13 @@
+# Gunicorn settings; gunicorn loads this file from the working directory
+import os
+
+
+def post_fork(server, worker):
+    """Start a standby collector in every worker when EMBEDDED_COLLECTOR=1
+
+    Threads do not survive fork, so under --preload a collector started while
+    importing wsgi.py would run in the master process, not in the workers.
+    """
+    if os.environ.get('EMBEDDED_COLLECTOR') == '1':
+        from collector import start_embedded_collector
+        start_embedded_collector()
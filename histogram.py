@@ -0,0 +1,144 @@
+"""
+Mergeable log-bucketed latency histograms.
+
+Values are recorded in microseconds into HDR-style buckets: exact below 128 us,
+then 64 buckets per power of two, so any reported percentile is within about
+0.8% of the true sample value. Histograms merge by adding bucket counts, which
+makes percentiles over any window or set of targets exact-enough without
+keeping raw samples. The binary encoding is a short header followed by
+varint-encoded (bucket delta, count) pairs; a typical probe interval encodes
+in a few dozen bytes.
+"""
+
+import struct
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS        # exact values below this
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1       # buckets per power of two above it
+ENCODING_VERSION = 1
+
+
+def _bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + ((value >> shift) - HALF_SUB_BUCKETS)
+
+
+def _bucket_bounds(index):
+    """Lowest value and width of a bucket"""
+    if index < SUB_BUCKETS:
+        return index, 1
+    shift, offset = divmod(index - SUB_BUCKETS, HALF_SUB_BUCKETS)
+    shift += 1
+    return (HALF_SUB_BUCKETS + offset) << shift, 1 << shift
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram of latencies recorded in milliseconds"""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def record(self, ms, count=1):
+        value = max(0, int(round(ms * 1000)))
+        index = _bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, p):
+        """Value in milliseconds below which p percent of the samples fall"""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * p // 100))  # ceil, at least the first sample
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, width = _bucket_bounds(index)
+                value = low + (width - 1) / 2
+                return min(max(value, self.min), self.max) / 1000
+        return self.max / 1000
+
+    def mean(self):
+        if not self.count:
+            return None
+        total = 0.0
+        for index, count in self.counts.items():
+            low, width = _bucket_bounds(index)
+            total += (low + (width - 1) / 2) * count
+        return total / self.count / 1000
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        return {
+            "count": self.count,
+            "min": self.min / 1000 if self.min is not None else None,
+            "max": self.max / 1000 if self.max is not None else None,
+            "mean": self.mean(),
+            "percentiles": {f"p{p:g}": self.percentile(p) for p in percentiles}
+        }
+
+    def to_bytes(self):
+        out = bytearray(struct.pack('BB', ENCODING_VERSION, SUB_BUCKET_BITS))
+        _write_varint(out, self.min or 0)
+        _write_varint(out, self.max or 0)
+        previous = 0
+        for index in sorted(self.counts):
+            _write_varint(out, index - previous)
+            _write_varint(out, self.counts[index])
+            previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, sub_bucket_bits = struct.unpack_from('BB', data)
+        if version != ENCODING_VERSION or sub_bucket_bits != SUB_BUCKET_BITS:
+            raise ValueError(f"Unsupported histogram encoding {version}/{sub_bucket_bits}")
+        histogram = cls()
+        minimum, pos = _read_varint(data, 2)
+        maximum, pos = _read_varint(data, pos)
+        index = 0
+        while pos < len(data):
+            delta, pos = _read_varint(data, pos)
+            count, pos = _read_varint(data, pos)
+            index += delta
+            histogram.counts[index] = count
+            histogram.count += count
+        if histogram.count:
+            histogram.min, histogram.max = minimum, maximum
+        return histogram
+
@@ -0,0 +1,306 @@
+"""
+Asynchronous measurement jobs.
+
+Long-running measurements (speedtest plus traceroute take 30-60 s) are
+queued instead of holding an HTTP worker. Jobs are persisted in SQLite so any
+API worker can report their status, run on a small bounded pool of threads in
+priority order, and identical jobs that are still queued are merged so a
+burst of requests costs a single measurement. Overlapping link-saturating
+probes are prevented by metricsmeasure.exclusive_probe.
+
+Each manager owns the jobs it accepted and keeps a heartbeat in the
+database while its workers run. Queued or running jobs whose owner stopped
+beating (the process exited or was killed) are marked failed, so they no
+longer absorb identical requests or count against the queue limit.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime, timedelta
+
+import metricsmeasure
+from metricsmeasure import (
+    collect_metrics, get_wifi_signal_strength, log_metrics, save_metrics_to_csv,
+    store_metrics_in_db, test_protocol_performance
+)
+
+logger = logging.getLogger('network_jobs')
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 100))
+DEFAULT_PRIORITY = 5  # lower runs first
+JOB_RETENTION = timedelta(hours=24)
+JOB_HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', 10))  # seconds
+JOB_OWNER_TIMEOUT = int(os.environ.get('JOB_OWNER_TIMEOUT', 60))  # seconds without a heartbeat
+ORPHANED_JOB_ERROR = "Worker exited before the job finished"
+
+
+# Managers created before a fork (gunicorn --preload) need a fresh identity in each child
+_managers = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for manager in _managers:
+        manager._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class JobQueueFull(Exception):
+    """Raised when the bounded job queue cannot accept more work"""
+
+
+def _run_metrics(params):
+    metrics = collect_metrics()
+    log_metrics(metrics)
+    save_metrics_to_csv(metrics)
+    store_metrics_in_db(metrics)
+    return metrics
+
+
+def _run_protocol_test(params):
+    return test_protocol_performance(params["protocol"])
+
+
+def _run_wifi_signal(params):
+    return {"wifi_signal": get_wifi_signal_strength()}
+
+
+# type -> (runner, parameter names)
+JOB_TYPES = {
+    "metrics": (_run_metrics, ()),
+    "protocol_test": (_run_protocol_test, ("protocol",)),
+    "wifi_signal": (_run_wifi_signal, ()),
+}
+
+
+def init_jobs_table(conn):
+    """Create or migrate the job tables; the caller commits
+
+    The migration runs in one immediate transaction, so workers starting at
+    the same time (e.g. forked by gunicorn) serialize on it.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        type TEXT,
+        params TEXT,
+        dedupe_key TEXT,
+        priority INTEGER,
+        status TEXT,
+        created TEXT,
+        started TEXT,
+        finished TEXT,
+        result TEXT,
+        error TEXT
+    )
+    ''')
+    # Columns added after the original schema
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+    if 'owner' not in existing:
+        conn.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+    # Managers that can still run their jobs, by last heartbeat
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS job_owners (
+        owner TEXT PRIMARY KEY,
+        pid INTEGER,
+        heartbeat TEXT
+    )
+    ''')
+    # At most one queued job per identical request; duplicates merge into it
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_queued
+    ON jobs (dedupe_key) WHERE status = 'queued'
+    ''')
+
+
+def _row_to_job(row):
+    job_id, job_type, params, priority, status, created, started, finished, result, error = row
+    return {
+        "id": job_id,
+        "type": job_type,
+        "params": json.loads(params),
+        "priority": priority,
+        "status": status,
+        "created": created,
+        "started": started,
+        "finished": finished,
+        "result": json.loads(result) if result else None,
+        "error": error
+    }
+
+
+class JobManager:
+    """Bounded priority executor for measurement jobs"""
+
+    def __init__(self, db_path=None, workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS):
+        self.db_path = db_path or metricsmeasure.DB_PATH
+        self.workers = workers
+        self.max_queued = max_queued
+        self._counter = itertools.count()
+        self._reset()
+        _managers.add(self)
+
+    def _reset(self):
+        """Start with a new owner and no threads, queue or connection
+
+        Called again in forked children: every process must beat for its own
+        owner, or jobs of a dead worker stay alive on a sibling's heartbeat.
+        The parent's connection is dropped without being closed.
+        """
+        self._heap = []
+        self._cond = threading.Condition()
+        self._threads = []
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self.owner = uuid.uuid4().hex
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+            init_jobs_table(self._conn)
+            self._conn.commit()
+            self._reap_orphans(self._conn)
+        return self._conn
+
+    def _reap_orphans(self, conn):
+        """Fail queued and running jobs whose owner stopped sending heartbeats"""
+        now = datetime.now()
+        cutoff = (now - timedelta(seconds=JOB_OWNER_TIMEOUT)).isoformat()
+        conn.execute("DELETE FROM job_owners WHERE heartbeat < ?", (cutoff,))
+        cursor = conn.execute('''
+        UPDATE jobs SET status = 'failed', finished = ?, error = ?
+        WHERE status IN ('queued', 'running')
+        AND (owner IS NULL OR owner NOT IN (SELECT owner FROM job_owners))
+        ''', (now.isoformat(), ORPHANED_JOB_ERROR))
+        conn.commit()
+        if cursor.rowcount:
+            logger.warning(f"Marked {cursor.rowcount} orphaned job(s) as failed")
+        return cursor.rowcount
+
+    def _execute(self, query, params=()):
+        with self._db_lock:
+            conn = self._db()
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor
+
+    def _beat(self):
+        self._execute('INSERT OR REPLACE INTO job_owners (owner, pid, heartbeat) VALUES (?, ?, ?)',
+                      (self.owner, os.getpid(), datetime.now().isoformat()))
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                self._beat()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {e}")
+
+    def _ensure_started(self):
+        """Start the workers and the heartbeat; a manager without workers never beats"""
+        if self._threads or not self.workers:
+            return
+        with self._cond:
+            if not self._threads:
+                self._beat()
+                thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, job_type, params=None, priority=DEFAULT_PRIORITY):
+        """Queue a job, or return the identical job already waiting; returns (job, merged)"""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type}. Supported: {', '.join(JOB_TYPES)}")
+        runner, names = JOB_TYPES[job_type]
+        params = params or {}
+        missing = [n for n in names if not params.get(n)]
+        if missing:
+            raise ValueError(f"Missing parameters for {job_type}: {', '.join(missing)}")
+        params = {n: str(params[n]).lower() for n in names}
+        dedupe_key = f"{job_type}:{json.dumps(params, sort_keys=True)}"
+
+        self._ensure_started()
+        with self._cond:
+            # Jobs of exited workers must neither absorb this request nor fill the queue
+            with self._db_lock:
+                self._reap_orphans(self._db())
+            if self.queued_count() >= self.max_queued:
+                raise JobQueueFull(f"Job queue is full ({self.max_queued} jobs)")
+            job_id = uuid.uuid4().hex
+            try:
+                self._execute('''
+                INSERT INTO jobs (id, type, params, dedupe_key, priority, status, created, owner)
+                VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)
+                ''', (job_id, job_type, json.dumps(params), dedupe_key, priority,
+                      datetime.now().isoformat(), self.owner))
+            except sqlite3.IntegrityError:
+                existing = self._execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status = 'queued'",
+                    (dedupe_key,)
+                ).fetchone()
+                if existing is not None:
+                    logger.info(f"Merged {job_type} job into pending job {existing[0]}")
+                    return self.get(existing[0]), True
+                raise
+            heapq.heappush(self._heap, (priority, next(self._counter), job_id, job_type, params))
+            self._cond.notify()
+        logger.info(f"Queued {job_type} job {job_id} (priority {priority})")
+        return self.get(job_id), False
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if unknown"""
+        row = self._execute('''
+        SELECT id, type, params, priority, status, created, started, finished, result, error
+        FROM jobs WHERE id = ?
+        ''', (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def queued_count(self):
+        """Jobs waiting across all API workers sharing the database"""
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, job_id, job_type, params = heapq.heappop(self._heap)
+
+            # Leaving the 'queued' state closes the job to further merges
+            claimed = self._execute(
+                "UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'",
+                (datetime.now().isoformat(), job_id)).rowcount
+            if not claimed:
+                logger.warning(f"Job {job_id} ({job_type}) is no longer queued, skipping")
+                continue
+            try:
+                result = JOB_TYPES[job_type][0](params)
+                self._execute('''
+                UPDATE jobs SET status = 'succeeded', finished = ?, result = ? WHERE id = ?
+                ''', (datetime.now().isoformat(), json.dumps(result), job_id))
+                logger.info(f"Job {job_id} ({job_type}) succeeded")
+            except Exception as e:
+                logger.error(f"Job {job_id} ({job_type}) failed: {e}")
+                self._execute('''
+                UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?
+                ''', (datetime.now().isoformat(), str(e), job_id))
+
+            self._execute("DELETE FROM jobs WHERE finished < ?",
+                          ((datetime.now() - JOB_RETENTION).isoformat(),))
@@ -0,0 +1,493 @@
+"""
+End-to-end API load test against local network stand-ins.
+
+Starts the API server in-process on a scratch working directory, replaces
+the network probes with clients of local stand-in servers (UDP echo for
+ICMP ping, a minimal DNS responder, an HTTP server for protocol tests and
+speedtest transfers) that inject configurable delay and loss, seeds the
+history, then drives a weighted mix of API requests at a fixed concurrency.
+
+    python loadtest.py --concurrency 16 --duration 60 --delay-ms 20 --loss 0.01
+    python loadtest.py --mix historical=8,wifi_signal=2 --json baseline.json
+
+The report lists throughput, latency percentiles and errors per endpoint,
+response cache hits, and SQLite write-lock waits sampled during the run.
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import json
+import logging
+import os
+import random
+import socket
+import socketserver
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+logger = logging.getLogger('network_loadtest')
+
+DEFAULT_MIX = "historical=6,wifi_signal=2,metrics=1,protocol_test=1"
+HISTORICAL_TIMEFRAMES = ('24h', '7d', '30d')
+PROTOCOLS = ('tcp', 'udp', 'http', 'https', 'icmp')
+TRANSFER_BYTES = 2 * 1024 * 1024
+TRACEROUTE_HOPS = 8
+
+
+def _endpoint_path(name, rng):
+    """Request path for one call of a mix entry"""
+    if name == 'metrics':
+        return '/api/metrics'
+    if name == 'protocol_test':
+        return f'/api/protocol_test/{rng.choice(PROTOCOLS)}'
+    if name == 'wifi_signal':
+        return '/api/wifi_signal'
+    if name == 'historical':
+        timeframe = rng.choice(HISTORICAL_TIMEFRAMES)
+        return rng.choice((
+            f'/api/historical/{timeframe}',
+            f'/api/historical?timeframe={timeframe}&metrics=download_speed,upload_speed'
+            f'&max_points=200&format=columnar',
+            f'/api/historical?timeframe={timeframe}&group_by=time,protocol&bucket=1h'
+            f'&metrics=latency,packet_loss&agg=avg,max',
+        ))
+    raise ValueError(f"Unknown endpoint in mix: {name}")
+
+
+def parse_mix(value):
+    """Parse 'name=weight,...' into a list of (name, weight)"""
+    mix = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        _endpoint_path(name, random.Random())  # validates the name
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+class Impairment:
+    """Injected one-way delay, jitter and loss shared by all stand-ins"""
+
+    def __init__(self, delay_ms=10.0, jitter_ms=2.0, loss=0.0):
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+
+    def dropped(self):
+        return random.random() < self.loss
+
+    def wait(self):
+        delay = self.delay_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+class _EchoHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        impairment = self.server.impairment
+        if impairment.dropped():
+            return
+        impairment.wait()
+        sock.sendto(data, self.client_address)
+
+
+class _DnsHandler(socketserver.BaseRequestHandler):
+    """Answers every A query with 127.0.0.1"""
+
+    def handle(self):
+        query, sock = self.request
+        impairment = self.server.impairment
+        if len(query) < 12 or impairment.dropped():
+            return
+        impairment.wait()
+        question = query[12:]
+        end = question.index(b'\x00') + 5  # QNAME terminator, QTYPE, QCLASS
+        header = query[:2] + struct.pack('>HHHHH', 0x8180, 1, 1, 0, 0)
+        answer = struct.pack('>HHHIH', 0xC00C, 1, 1, 60, 4) + socket.inet_aton('127.0.0.1')
+        sock.sendto(header + question[:end] + answer, self.client_address)
+
+
+class _HttpHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.impairment.wait()
+        if self.path.startswith('/download'):
+            size = int(self.path.partition('bytes=')[2] or TRANSFER_BYTES)
+            self._reply(b'\0' * size)
+        else:
+            self._reply(b'<html><body>stand-in</body></html>')
+
+    def do_POST(self):
+        self.server.impairment.wait()
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+        self._reply(b'ok')
+
+
+class _ThreadingUDPServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+
+
+class StandIns:
+    """Local ICMP/DNS/HTTP/speedtest stand-ins and the probe functions that use them"""
+
+    def __init__(self, impairment, transfer_bytes=TRANSFER_BYTES):
+        self.impairment = impairment
+        self.transfer_bytes = transfer_bytes
+        self.servers = []
+        self._restore = []
+
+    def _serve(self, server):
+        server.impairment = self.impairment
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return server.server_address
+
+    def start(self):
+        self.echo_address = self._serve(_ThreadingUDPServer(('127.0.0.1', 0), _EchoHandler))
+        self.dns_address = self._serve(_ThreadingUDPServer(('127.0.0.1', 0), _DnsHandler))
+        http_server = ThreadingHTTPServer(('127.0.0.1', 0), _HttpHandler)
+        http_server.daemon_threads = True
+        host, port = self._serve(http_server)
+        self.http_url = f"http://{host}:{port}"
+        logger.info(f"Stand-ins: echo {self.echo_address}, dns {self.dns_address}, http {self.http_url}")
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.unpatch()
+
+    # Stand-in probes, same signatures and failure values as the real ones
+
+    def ping(self, host, timeout=4, **kwargs):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            started = time.perf_counter()
+            sock.sendto(b'ping', self.echo_address)
+            try:
+                sock.recvfrom(64)
+            except socket.timeout:
+                return None
+            return time.perf_counter() - started
+
+    def dns_lookup_time(self, host="google.com"):
+        query_id = random.getrandbits(16)
+        qname = b''.join(bytes([len(label)]) + label.encode() for label in host.split('.')) + b'\x00'
+        query = struct.pack('>HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + qname + struct.pack('>HH', 1, 1)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(2)
+            started = time.perf_counter()
+            sock.sendto(query, self.dns_address)
+            try:
+                sock.recvfrom(512)
+            except socket.timeout:
+                return 0
+            return (time.perf_counter() - started) * 1000
+
+    def traceroute_hops(self, host="8.8.8.8"):
+        for _ in range(TRACEROUTE_HOPS):
+            if self.ping(host, timeout=1) is None:
+                break
+        return TRACEROUTE_HOPS
+
+    def test_bandwidth(self):
+        try:
+            started = time.perf_counter()
+            with urllib.request.urlopen(f"{self.http_url}/download?bytes={self.transfer_bytes}") as response:
+                size = len(response.read())
+            download = size * 8 / (time.perf_counter() - started) / 1_000_000
+            started = time.perf_counter()
+            request = urllib.request.Request(f"{self.http_url}/upload", data=b'\0' * self.transfer_bytes,
+                                             method='POST')
+            with urllib.request.urlopen(request) as response:
+                response.read()
+            upload = self.transfer_bytes * 8 / (time.perf_counter() - started) / 1_000_000
+            return download, upload
+        except OSError:
+            return 0, 0
+
+    def patch(self, module):
+        """Point the probes of metricsmeasure at the stand-ins"""
+        patches = {
+            'ping': self.ping,
+            'dns_lookup_time': self.dns_lookup_time,
+            'traceroute_hops': self.traceroute_hops,
+            'test_bandwidth': self.test_bandwidth,
+            'HTTP_TEST_URL': self.http_url + '/',
+            'HTTPS_TEST_URL': self.http_url + '/',
+        }
+        for name, value in patches.items():
+            self._restore.append((module, name, getattr(module, name)))
+            setattr(module, name, value)
+
+    def unpatch(self):
+        while self._restore:
+            module, name, value = self._restore.pop()
+            setattr(module, name, value)
+
+
+class ContentionMonitor:
+    """Samples how long a writer waits for the SQLite write lock, and counts lock errors
+
+    The probe takes the write lock with BEGIN IMMEDIATE and rolls back, so it
+    never commits and does not invalidate the response cache.
+    """
+
+    def __init__(self, db_path, interval=0.1, busy_timeout=5.0):
+        self.db_path = db_path
+        self.interval = interval
+        self.busy_timeout = busy_timeout
+        self.waits = []
+        self.lock_timeouts = 0
+        self.logged_lock_errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._handler = None
+
+    def start(self):
+        monitor = self
+
+        class LockErrorHandler(logging.Handler):
+            def emit(self, record):
+                if 'locked' in record.getMessage():
+                    monitor.logged_lock_errors += 1
+
+        self._handler = LockErrorHandler(logging.ERROR)
+        logging.getLogger().addHandler(self._handler)
+        self._thread = threading.Thread(target=self._run, name="contention-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+        while not self._stop.wait(self.interval):
+            started = time.perf_counter()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('ROLLBACK')
+                self.waits.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                self.lock_timeouts += 1
+        conn.close()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        logging.getLogger().removeHandler(self._handler)
+
+
+def seed_history(save_test_results, days, interval_minutes=5):
+    """Fill the history with synthetic samples so historical queries have realistic sizes"""
+    rng = random.Random(1)
+    now = datetime.now()
+    count = int(days * 24 * 60 / interval_minutes)
+    samples = []
+    for i in range(count):
+        loss = rng.choice((0.0,) * 50 + (10.0, 30.0))
+        samples.append({
+            "timestamp": (now - timedelta(minutes=i * interval_minutes)).isoformat(),
+            "protocol": rng.choice(("tcp", "udp")),
+            "target": "8.8.8.8",
+            "download_speed": rng.gauss(90, 10),
+            "upload_speed": rng.gauss(20, 3),
+            "latency": rng.gauss(25, 5),
+            "jitter": abs(rng.gauss(3, 1)),
+            "dns_lookup_time": abs(rng.gauss(15, 5)),
+            "traceroute_hops": 12,
+            "packet_loss": loss,
+            "packet_sent": 10.0,
+            "packet_rec": 10.0 - loss / 10,
+            "sample_id": f"seed-{i}"
+        })
+    for start in range(0, count, 5000):
+        save_test_results(samples[start:start + 5000])
+    return count
+
+
+def run_load(host, port, mix, concurrency, duration, timeout, seed=0):
+    """Drive the request mix from `concurrency` keep-alive clients; returns (results, elapsed)"""
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    deadline = time.monotonic() + duration
+    results = []
+    results_lock = threading.Lock()
+
+    def client(index):
+        rng = random.Random(seed + index)
+        conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        local = []
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            path = _endpoint_path(name, rng)
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = conn.getresponse()
+                response.read()
+                local.append((name, response.status, time.perf_counter() - started, None))
+            except (OSError, http.client.HTTPException) as e:
+                local.append((name, None, time.perf_counter() - started, type(e).__name__))
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.close()
+        with results_lock:
+            results.extend(local)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - started
+
+
+def _latency_summary(latencies):
+    values = np.array(latencies) * 1000
+    if not len(values):
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50_ms": round(p50, 2), "p90_ms": round(p90, 2), "p99_ms": round(p99, 2),
+            "max_ms": round(values.max(), 2)}
+
+
+def summarize(results, elapsed):
+    """Aggregate raw results into throughput, percentiles and error rates"""
+    by_endpoint = defaultdict(list)
+    for result in results:
+        by_endpoint[result[0]].append(result)
+
+    def stats(rows):
+        errors = sum(1 for _, status, _, error in rows if error or status >= 500)
+        return {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 2) if elapsed else 0,
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4) if rows else 0,
+            "status": dict(sorted(Counter(str(status or error) for _, status, _, error in rows).items())),
+            **_latency_summary([latency for _, _, latency, _ in rows])
+        }
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total": stats(results),
+        "endpoints": {name: stats(rows) for name, rows in sorted(by_endpoint.items())}
+    }
+
+
+def print_report(summary):
+    print(f"\nLoad test: {summary['config']}")
+    header = f"{'endpoint':<15}{'reqs':>7}{'rps':>9}{'err%':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = list(summary["endpoints"].items()) + [("TOTAL", summary["total"])]
+    for name, s in rows:
+        print(f"{name:<15}{s['requests']:>7}{s['throughput_rps']:>9.1f}{s['error_rate'] * 100:>7.1f}"
+              f"{s.get('p50_ms', 0):>10.1f}{s.get('p90_ms', 0):>10.1f}{s.get('p99_ms', 0):>10.1f}"
+              f"{s.get('max_ms', 0):>10.1f}")
+    db = summary["db"]
+    print(f"\nDB write-lock wait: p50 {db.get('p50_ms', 0):.1f} ms, p99 {db.get('p99_ms', 0):.1f} ms, "
+          f"max {db.get('max_ms', 0):.1f} ms over {db['samples']} samples; "
+          f"lock timeouts {db['lock_timeouts']}, 'database is locked' errors logged {db['logged_lock_errors']}")
+    cache = summary["cache"]
+    print(f"Response cache: {cache['hits']} hits, {cache['misses']} misses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the network metrics API against local stand-ins")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent keep-alive clients")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to drive load")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Weighted endpoint mix (default {DEFAULT_MIX})")
+    parser.add_argument('--delay-ms', type=float, default=10.0, help="Injected stand-in delay")
+    parser.add_argument('--jitter-ms', type=float, default=2.0, help="Injected delay variation")
+    parser.add_argument('--loss', type=float, default=0.0, help="Injected packet loss ratio (0-1)")
+    parser.add_argument('--transfer-bytes', type=int, default=TRANSFER_BYTES,
+                        help="Bytes moved per direction by the speedtest stand-in")
+    parser.add_argument('--seed-days', type=float, default=30, help="Days of 5-minute history to seed")
+    parser.add_argument('--timeout', type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument('--workdir', help="Scratch directory (default: a new temporary directory)")
+    parser.add_argument('--json', dest='json_path', help="Also write the summary to this file")
+    parser.add_argument('--verbose', action='store_true', help="Keep the server's INFO logging")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix='network-loadtest-')
+    os.makedirs(workdir, exist_ok=True)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)  # database, CSV, logs and lock files stay in the scratch directory
+
+    import metricsmeasure
+    import app1
+    from werkzeug.serving import make_server
+
+    # Server logs go to api_server.log in the workdir; the console shows only the harness
+    metricsmeasure.configure_logging('api_server.log', stream=args.verbose)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+    app = app1.create_app()
+
+    stand_ins = StandIns(Impairment(args.delay_ms, args.jitter_ms, args.loss), args.transfer_bytes).start()
+    stand_ins.patch(metricsmeasure)
+
+    seeded = seed_history(metricsmeasure.save_test_results, args.seed_days)
+    logger.info(f"Seeded {seeded} samples into {os.path.join(workdir, metricsmeasure.DB_PATH)}")
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"API server on port {server.server_port}; {args.concurrency} clients for {args.duration}s")
+
+    monitor = ContentionMonitor(metricsmeasure.DB_PATH).start()
+    try:
+        # log_metrics prints every collected sample; keep the report readable
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+            results, elapsed = run_load('127.0.0.1', server.server_port, mix, args.concurrency,
+                                        args.duration, args.timeout)
+    finally:
+        monitor.stop()
+        server.shutdown()
+        stand_ins.stop()
+
+    summary = summarize(results, elapsed)
+    summary["config"] = {k: v for k, v in vars(args).items() if k not in ('json_path', 'verbose', 'workdir')}
+    summary["db"] = {"samples": len(monitor.waits), "lock_timeouts": monitor.lock_timeouts,
+                     "logged_lock_errors": monitor.logged_lock_errors, **_latency_summary(monitor.waits)}
+    summary["cache"] = {"hits": app1.response_cache.hits, "misses": app1.response_cache.misses}
+    print_report(summary)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Summary written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
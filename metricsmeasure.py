@@ -3,34 +3,175 @@ import time
 import os
 import json
 import csv
-import smtplib
-from email.message import EmailMessage
+import re
 from datetime import datetime, timedelta
-from ping3 import ping
-import speedtest
+import importlib
 import socket
 import subprocess
+import threading
 import logging
+import uuid
+import gzip
+import random
+import argparse
+import urllib.request
+import urllib.error
+from contextlib import contextmanager
+from histogram import LatencyHistogram
 import socket
 import time
 
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='network_metrics.log'
-)
 logger = logging.getLogger('network_metrics')
 
+# Logging is configured by entry points (configure_logging), never on import
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+_logging_configured = False
+
+# Probe backends (ping3, speedtest) are imported on first use; see _backend
+_backends = {}
+_backends_lock = threading.Lock()
+
 # Create a database to store test history
 DB_PATH = 'network_metrics.db'
 
+# Most recent sample, shared with API workers that do not measure themselves
+LATEST_SAMPLE_PATH = os.environ.get('LATEST_SAMPLE_PATH', 'latest_metrics.json')
+
+# Local outbox used in agent mode
+AGENT_SPOOL_PATH = os.environ.get('AGENT_SPOOL_PATH', 'agent_spool.db')
+
+# Columns added to test_history after the original schema
+TEST_HISTORY_EXTRA_COLUMNS = [
+    ('target', 'TEXT'),
+    ('agent', 'TEXT'),
+    ('sample_id', 'TEXT'),
+]
+
+# Historical queries: named windows, and the fields that may be grouped, aggregated or filtered
+HISTORICAL_TIMEFRAMES = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+}
+HISTORY_METRICS = ('download_speed', 'upload_speed', 'latency', 'jitter', 'packet_loss',
+                   'dns_lookup_time', 'traceroute_hops', 'packet_sent', 'packet_rec')
+HISTORY_GROUPS = ('time', 'protocol', 'target', 'agent')
+HISTORY_AGGREGATES = ('avg', 'min', 'max', 'sum', 'count')
+MAX_HISTORY_ROWS = 10000
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Targets of the HTTP/HTTPS protocol tests
+HTTP_TEST_URL = os.environ.get('HTTP_TEST_URL', 'http://example.com')
+HTTPS_TEST_URL = os.environ.get('HTTPS_TEST_URL', 'https://www.google.com')
+
+# Per-interval RTT histograms of the probes run by the current thread
+_rtt_recording = threading.local()
+LATENCY_GROUPS = ('time', 'probe', 'target', 'protocol')
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+# Global connection for the legacy metrics table
+DATABASE_CONNECTION = None
+
+# Link-saturating measurements (speedtest) must never overlap, across threads or processes
+PROBE_LOCK_PATH = os.environ.get('PROBE_LOCK_PATH', 'probe.lock')
+_probe_lock = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:  # Windows: serialize within the process only
+    fcntl = None
+
+# Callables invoked with every sample produced by collect_metrics
+_sample_handlers = []
+# Callables invoked with per-probe durations of every collection run
+_timing_handlers = []
+
+def register_sample_handler(handler):
+    """Register a callable that receives every collected metrics sample"""
+    if handler not in _sample_handlers:
+        _sample_handlers.append(handler)
+
+def register_timing_handler(handler):
+    """Register a callable that receives (target, protocol, timings) after each collection"""
+    if handler not in _timing_handlers:
+        _timing_handlers.append(handler)
+
+def publish_sample(metrics):
+    """Hand a sample to all registered handlers; handler failures never reach the caller"""
+    for handler in list(_sample_handlers):
+        try:
+            handler(metrics)
+        except Exception as e:
+            logger.error(f"Sample handler {getattr(handler, '__qualname__', handler)} failed: {e}")
+
+def publish_probe_timings(target, protocol, timings):
+    """Hand per-probe durations (ms) to all registered timing handlers"""
+    for handler in list(_timing_handlers):
+        try:
+            handler(target, protocol, timings)
+        except Exception as e:
+            logger.error(f"Timing handler {getattr(handler, '__qualname__', handler)} failed: {e}")
+
+def sample_series(sample):
+    """Series name of a sample: its target, prefixed by the agent for remotely collected samples"""
+    target = sample.get("target", "default")
+    agent = sample.get("agent")
+    if agent and agent != "local":
+        return f"{agent}/{target}"
+    return target
+
+def _timed(timings, probe, func, *args):
+    """Run a probe and record its wall-clock duration in milliseconds"""
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[probe] = (time.perf_counter() - started) * 1000
+
+@contextmanager
+def recording_rtts():
+    """Collect RTT histograms from every probe run by this thread inside the block"""
+    _rtt_recording.histograms = histograms = {}
+    try:
+        yield histograms
+    finally:
+        _rtt_recording.histograms = None
+
+def record_rtt(probe, ms):
+    """Record one round-trip time into the histograms of the collection in progress"""
+    histograms = getattr(_rtt_recording, 'histograms', None)
+    if histograms is not None:
+        histograms.setdefault(probe, LatencyHistogram()).record(ms)
+
+def configure_logging(filename, stream=True, level=logging.INFO):
+    """Install the root log handlers once per process; later calls are no-ops
+
+    Called by entry points (app factory, collector, CLI) so that importing a
+    module never adds handlers of its own.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return False
+    handlers = [logging.FileHandler(filename)]
+    if stream:
+        handlers.append(logging.StreamHandler())
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
+    _logging_configured = True
+    return True
+
 def init_db():
-    """Initialize SQLite database for storing metrics"""
+    """Initialize SQLite database for storing metrics
+
+    Safe to run from several processes at once: the migration runs in one
+    immediate transaction, so concurrently starting workers serialize on it.
+    """
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
+        # WAL lets API readers proceed while the collector or ingest endpoint writes
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('BEGIN IMMEDIATE')
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS test_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -48,6 +189,40 @@ def init_db():
             raw_data TEXT
         )
         ''')
+        # Columns added after the original schema
+        existing = {row[1] for row in cursor.execute('PRAGMA table_info(test_history)')}
+        for column, column_type in TEST_HISTORY_EXTRA_COLUMNS:
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE test_history ADD COLUMN {column} {column_type}')
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_test_history_sample_id ON test_history (sample_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_test_history_timestamp ON test_history (timestamp)')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anomalies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            target TEXT,
+            metric TEXT,
+            kind TEXT,
+            value REAL,
+            expected REAL,
+            score REAL
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp ON anomalies (timestamp)')
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rtt_histograms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            sample_id TEXT,
+            target TEXT,
+            agent TEXT,
+            protocol TEXT,
+            probe TEXT,
+            count INTEGER,
+            histogram BLOB
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rtt_histograms_timestamp ON rtt_histograms (timestamp)')
         conn.commit()
         conn.close()
         logger.info("Database initialized successfully")
@@ -56,33 +231,39 @@ def init_db():
         logger.error(f"Database initialization failed: {e}")
         return False
 
+def _test_history_row(protocol, metrics):
+    """Map a metrics sample to a test_history row"""
+    return (
+        metrics.get('timestamp') or datetime.now().isoformat(),
+        protocol,
+        metrics.get('download_speed', 0),
+        metrics.get('upload_speed', 0),
+        metrics.get('latency', 0),
+        metrics.get('jitter', 0),
+        metrics.get('packet_loss', 0),
+        metrics.get('dns_lookup_time', 0),
+        metrics.get('traceroute_hops', 0),
+        metrics.get('packet_sent', 0),
+        metrics.get('packet_rec', 0),
+        json.dumps(metrics),
+        metrics.get('target'),
+        metrics.get('agent', 'local'),
+        metrics.get('sample_id')
+    )
+
+TEST_HISTORY_INSERT = '''
+INSERT OR IGNORE INTO test_history 
+(timestamp, protocol, download_speed, upload_speed, latency, jitter, packet_loss, 
+dns_lookup_time, traceroute_hops, packet_sent, packet_rec, raw_data, target, agent, sample_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
 def save_test_result(protocol, metrics):
     """Save test results to the database"""
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
-        
-        timestamp = datetime.now().isoformat()
-        cursor.execute('''
-        INSERT INTO test_history 
-        (timestamp, protocol, download_speed, upload_speed, latency, jitter, packet_loss, 
-        dns_lookup_time, traceroute_hops, packet_sent, packet_rec, raw_data)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            timestamp,
-            protocol,
-            metrics.get('download_speed', 0),
-            metrics.get('upload_speed', 0),
-            metrics.get('latency', 0),
-            metrics.get('jitter', 0),
-            metrics.get('packet_loss', 0),
-            metrics.get('dns_lookup_time', 0),
-            metrics.get('traceroute_hops', 0),
-            metrics.get('packet_sent', 0),
-            metrics.get('packet_rec', 0),
-            json.dumps(metrics)
-        ))
-        
+        cursor.execute(TEST_HISTORY_INSERT, _test_history_row(protocol, metrics))
         conn.commit()
         conn.close()
         logger.info(f"Test result saved for protocol: {protocol}")
@@ -91,21 +272,115 @@ def save_test_result(protocol, metrics):
         logger.error(f"Failed to save test result: {e}")
         return False
 
+def save_test_results(samples):
+    """Bulk-insert samples in one transaction, skipping already stored sample IDs
+
+    Returns the samples that were newly inserted.
+    """
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        cursor = conn.cursor()
+        sample_ids = [s['sample_id'] for s in samples]
+        known = set()
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(sample_ids), 500):
+            chunk = sample_ids[i:i + 500]
+            cursor.execute(
+                f"SELECT sample_id FROM test_history WHERE sample_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            known.update(row[0] for row in cursor.fetchall())
+        new_samples = []
+        for sample in samples:
+            if sample['sample_id'] not in known:
+                known.add(sample['sample_id'])
+                new_samples.append(sample)
+        cursor.executemany(TEST_HISTORY_INSERT, [
+            _test_history_row(s.get('protocol', 'tcp'), s) for s in new_samples
+        ])
+        conn.commit()
+        logger.info(f"Bulk-saved {len(new_samples)} samples ({len(samples) - len(new_samples)} duplicates)")
+        return new_samples
+    finally:
+        conn.close()
+
+def get_db_connection():
+    """Get a database connection (singleton pattern)"""
+    global DATABASE_CONNECTION
+    if DATABASE_CONNECTION is None:
+        DATABASE_CONNECTION = sqlite3.connect(DB_PATH, check_same_thread=False)
+    return DATABASE_CONNECTION
+
+def store_metrics_in_db(metrics):
+    """Store metrics in the database"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS metrics (
+                            timestamp TEXT,
+                            download_speed REAL,
+                            upload_speed REAL,
+                            latency REAL,
+                            jitter REAL,
+                            dns_lookup_time REAL,
+                            traceroute_hops INTEGER,
+                            packet_loss REAL)
+                        ''')
+        cursor.execute('''INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (datetime.now().isoformat(), 
+                     metrics.get("download_speed", 0), 
+                     metrics.get("upload_speed", 0), 
+                     metrics.get("latency", 0),
+                     metrics.get("jitter", 0), 
+                     metrics.get("dns_lookup_time", 0), 
+                     metrics.get("traceroute_hops", 0), 
+                     metrics.get("packet_loss", 0)))
+        conn.commit()
+        logger.info("Metrics stored in database successfully")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to store metrics in database: {e}")
+        return False
+
+def write_latest_sample(metrics):
+    """Atomically replace the latest-sample cache file
+
+    Only samples measured by this deployment count as the current reading;
+    ingested agent samples (possibly hours old when replayed from a spool)
+    are skipped.
+    """
+    if "error" in metrics or metrics.get("agent", "local") != "local":
+        return False
+    try:
+        tmp_path = f"{LATEST_SAMPLE_PATH}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metrics, f)
+        os.replace(tmp_path, LATEST_SAMPLE_PATH)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to write latest sample: {e}")
+        return False
+
+def read_latest_sample():
+    """Read the latest collected sample, or None if nothing was collected yet"""
+    try:
+        with open(LATEST_SAMPLE_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Failed to read latest sample: {e}")
+        return None
+
 def get_historical_data(timeframe='24h'):
     """Retrieve historical data from the database"""
+    if timeframe not in HISTORICAL_TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe: {timeframe}. Supported: {', '.join(HISTORICAL_TIMEFRAMES)}")
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        now = datetime.now()
-        if timeframe == '24h':
-            cutoff = (now - timedelta(hours=24)).isoformat()
-        elif timeframe == '7d':
-            cutoff = (now - timedelta(days=7)).isoformat()
-        elif timeframe == '30d':
-            cutoff = (now - timedelta(days=30)).isoformat()
-        else:
-            cutoff = (now - timedelta(hours=24)).isoformat()
+        cutoff = (datetime.now() - HISTORICAL_TIMEFRAMES[timeframe]).isoformat()
         
         cursor.execute('''
         SELECT timestamp, protocol, download_speed, upload_speed, latency, jitter, 
@@ -142,6 +417,257 @@ def get_historical_data(timeframe='24h'):
         logger.error(f"Failed to get historical data: {e}")
         return []
 
+def parse_duration(value):
+    """Parse a duration such as '90s', '5m', '1h' or '7d' into seconds"""
+    match = re.fullmatch(r'\s*(\d+)\s*([smhdw])\s*', str(value or ''))
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration: {value!r}. Use a number followed by s, m, h, d or w")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+def _parse_time(value, name):
+    """Parse an ISO timestamp into the naive local form stored in test_history"""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid {name} timestamp: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def _query_window(start, end, timeframe):
+    """Resolve start/end timestamps, or a timeframe ending now (default 24h)"""
+    end = _parse_time(end, 'end') if end else datetime.now()
+    if start:
+        start = _parse_time(start, 'start')
+    else:
+        start = end - timedelta(seconds=parse_duration(timeframe or '24h'))
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start, end
+
+def _in_filter(column, values, clauses, params):
+    if values:
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+
+def query_historical(start=None, end=None, timeframe=None, protocols=None, targets=None, agents=None,
+                     group_by=None, bucket=None, metrics=None, aggregates=None, limit=MAX_HISTORY_ROWS):
+    """Query test history over an arbitrary window, optionally grouped and aggregated in SQL
+
+    Without group_by or aggregates the matching rows are returned as stored;
+    otherwise one row is returned per group with a count and a
+    '<metric>_<aggregate>' value for every requested metric and aggregate.
+    Rows come in ascending order; when more than limit match, the newest
+    limit are returned. Raises ValueError for invalid parameters.
+    """
+    start, end = _query_window(start, end, timeframe)
+
+    group_by = list(group_by or [])
+    for group in group_by:
+        if group not in HISTORY_GROUPS:
+            raise ValueError(f"Unknown group_by field: {group}. Supported: {', '.join(HISTORY_GROUPS)}")
+    metrics = list(metrics or HISTORY_METRICS)
+    for metric in metrics:
+        if metric not in HISTORY_METRICS:
+            raise ValueError(f"Unknown metric: {metric}. Supported: {', '.join(HISTORY_METRICS)}")
+    for aggregate in aggregates or []:
+        if aggregate not in HISTORY_AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {aggregate}. Supported: {', '.join(HISTORY_AGGREGATES)}")
+    if 'time' in group_by:
+        bucket_seconds = parse_duration(bucket or '1h')
+    elif bucket:
+        raise ValueError("bucket requires group_by=time")
+    if group_by and not aggregates:
+        aggregates = ['avg']
+
+    # Column names below only ever come from the whitelists above
+    clauses = ['timestamp >= ?', 'timestamp <= ?']
+    params = [start.isoformat(), end.isoformat()]
+    _in_filter('protocol', protocols, clauses, params)
+    _in_filter('target', targets, clauses, params)
+    _in_filter("COALESCE(agent, 'local')", agents, clauses, params)
+    where = ' AND '.join(clauses)
+
+    if aggregates:
+        select = []
+        for group in group_by:
+            if group == 'time':
+                select.append("strftime('%Y-%m-%dT%H:%M:%S', "
+                              "CAST(strftime('%s', timestamp) AS INTEGER) / ? * ?, 'unixepoch') AS time")
+            elif group == 'agent':
+                select.append("COALESCE(agent, 'local') AS agent")
+            else:
+                select.append(group)
+        select.append('COUNT(*) AS count')
+        columns = group_by + ['count']
+        for metric in metrics:
+            for aggregate in aggregates:
+                if aggregate != 'count':
+                    select.append(f"{aggregate.upper()}({metric})")
+                    columns.append(f"{metric}_{aggregate}")
+        query = f"SELECT {', '.join(select)} FROM test_history WHERE {where}"
+        if 'time' in group_by:
+            params = [bucket_seconds, bucket_seconds] + params
+        if group_by:
+            # By position, so agent groups on the COALESCE expression rather than the raw column
+            positions = range(1, len(group_by) + 1)
+            query += (f" GROUP BY {', '.join(str(i) for i in positions)}"
+                      f" ORDER BY {', '.join(f'{i} DESC' for i in positions)}")
+    else:
+        columns = ['timestamp', 'protocol', 'target', 'agent'] + metrics
+        query = (f"SELECT timestamp, protocol, target, COALESCE(agent, 'local'), {', '.join(metrics)} "
+                 f"FROM test_history WHERE {where} ORDER BY timestamp DESC")
+    # Newest first so the limit drops the oldest rows, then back to ascending order
+    query += ' LIMIT ?'
+    params.append(limit)
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.execute(query, params)
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        results.reverse()
+        conn.close()
+        logger.info(f"Historical query returned {len(results)} rows ({start.isoformat()} - {end.isoformat()})")
+        return results
+    except Exception as e:
+        logger.error(f"Failed to query historical data: {e}")
+        return []
+
+def save_rtt_histograms(metrics, histograms):
+    """Save the RTT histograms recorded while collecting a sample"""
+    if not histograms:
+        return True
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        conn.executemany('''
+        INSERT INTO rtt_histograms (timestamp, sample_id, target, agent, protocol, probe, count, histogram)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (metrics.get('timestamp') or datetime.now().isoformat(), metrics.get('sample_id'),
+             metrics.get('target'), metrics.get('agent', 'local'), metrics.get('protocol'),
+             probe, histogram.count, histogram.to_bytes())
+            for probe, histogram in histograms.items()
+        ])
+        conn.commit()
+        conn.close()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save RTT histograms: {e}")
+        return False
+
+def get_latency_distribution(start=None, end=None, timeframe=None, probes=None, targets=None, protocols=None,
+                             group_by=None, bucket=None, percentiles=DEFAULT_PERCENTILES):
+    """Merge stored RTT histograms over a window into latency percentiles
+
+    Results are always split by probe (icmp, dns, http), and additionally by
+    any of time bucket, target and protocol. Histograms are only recorded by
+    this server's own collector; agents do not ship them.
+    Raises ValueError for invalid parameters.
+    """
+    start, end = _query_window(start, end, timeframe)
+    group_by = ['probe'] + [g for g in (group_by or []) if g != 'probe']
+    for group in group_by:
+        if group not in LATENCY_GROUPS:
+            raise ValueError(f"Unknown group_by field: {group}. Supported: {', '.join(LATENCY_GROUPS)}")
+    for p in percentiles:
+        if not 0 < p <= 100:
+            raise ValueError(f"Invalid percentile: {p}")
+    if 'time' in group_by:
+        bucket_seconds = parse_duration(bucket or '1h')
+    elif bucket:
+        raise ValueError("bucket requires group_by=time")
+
+    clauses = ['timestamp >= ?', 'timestamp <= ?']
+    params = [start.isoformat(), end.isoformat()]
+    _in_filter('probe', probes, clauses, params)
+    _in_filter('target', targets, clauses, params)
+    _in_filter('protocol', protocols, clauses, params)
+    select = []
+    for group in group_by:
+        if group == 'time':
+            select.append("strftime('%Y-%m-%dT%H:%M:%S', "
+                          "CAST(strftime('%s', timestamp) AS INTEGER) / ? * ?, 'unixepoch')")
+            params = [bucket_seconds, bucket_seconds] + params
+        else:
+            select.append(group)
+
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.execute(f'''
+        SELECT {', '.join(select)}, histogram FROM rtt_histograms
+        WHERE {' AND '.join(clauses)}
+        ORDER BY timestamp ASC
+        ''', params)
+        merged = {}
+        for row in cursor:
+            key = row[:-1]
+            histogram = LatencyHistogram.from_bytes(row[-1])
+            if key in merged:
+                merged[key].merge(histogram)
+            else:
+                merged[key] = histogram
+        conn.close()
+    except Exception as e:
+        logger.error(f"Failed to query latency distribution: {e}")
+        return []
+
+    return [
+        {**dict(zip(group_by, key)), **histogram.summary(percentiles)}
+        for key, histogram in sorted(merged.items(), key=lambda item: tuple(str(k) for k in item[0]))
+    ]
+
+def save_anomalies(detections):
+    """Save anomaly detections to the database"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.executemany('''
+        INSERT INTO anomalies (timestamp, target, metric, kind, value, expected, score)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (d['timestamp'], d['target'], d['metric'], d['kind'], d['value'], d['expected'], d['score'])
+            for d in detections
+        ])
+        conn.commit()
+        conn.close()
+        logger.info(f"Saved {len(detections)} anomaly detections")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to save anomalies: {e}")
+        return False
+
+def get_anomalies(since=None, target=None, metric=None, limit=100):
+    """Retrieve recent anomaly detections, newest first"""
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        
+        if since is None:
+            since = (datetime.now() - timedelta(hours=24)).isoformat()
+        query = '''
+        SELECT timestamp, target, metric, kind, value, expected, score
+        FROM anomalies
+        WHERE timestamp >= ?
+        '''
+        params = [since]
+        if target:
+            query += ' AND target = ?'
+            params.append(target)
+        if metric:
+            query += ' AND metric = ?'
+            params.append(metric)
+        query += ' ORDER BY timestamp DESC LIMIT ?'
+        params.append(limit)
+        cursor.execute(query, params)
+        
+        columns = ['timestamp', 'target', 'metric', 'kind', 'value', 'expected', 'score']
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        conn.close()
+        return results
+    except Exception as e:
+        logger.error(f"Failed to get anomalies: {e}")
+        return []
+
 def dns_lookup_time(host="google.com"):
     """Measure DNS lookup time in milliseconds"""
     try:
@@ -169,11 +695,34 @@ def traceroute_hops(host="8.8.8.8"):
         logger.error(f"Traceroute failed: {e}")
         return 0
 
+def _backend(name):
+    """Import a probe backend module on first use
+
+    Keeps `import metricsmeasure` (and with it every API worker) free of probe
+    dependencies until a measurement actually runs.
+    """
+    module = _backends.get(name)
+    if module is None:
+        with _backends_lock:
+            module = _backends.get(name)
+            if module is None:
+                module = _backends[name] = importlib.import_module(name)
+    return module
+
+def ping(host, **kwargs):
+    """ICMP echo round trip in seconds (None on timeout), via ping3"""
+    return _backend('ping3').ping(host, **kwargs)
+
 def measure_packet_loss(host="google.com", count=10):
     """Measure packet loss percentage"""
     try:
         sent = count
-        received = sum(1 for _ in range(count) if ping(host, timeout=1) is not None)
+        received = 0
+        for _ in range(count):
+            result = ping(host, timeout=1)
+            if result is not None:
+                received += 1
+                record_rtt("icmp", result * 1000)
         lost = sent - received
         packet_loss = (lost / sent) * 100 if sent > 0 else 0
         logger.info(f"Packets: Sent={sent}, Received={received}, Loss={packet_loss:.2f}%")
@@ -185,7 +734,7 @@ def measure_packet_loss(host="google.com", count=10):
 def test_bandwidth():
     """Measure download and upload speeds"""
     try:
-        st = speedtest.Speedtest()
+        st = _backend('speedtest').Speedtest()
         st.get_best_server()
         download_speed = st.download() / 1_000_000  # Convert to Mbps
         upload_speed = st.upload() / 1_000_000  # Convert to Mbps
@@ -203,6 +752,7 @@ def test_latency(host="8.8.8.8"):
             logger.warning(f"Ping to {host} timed out")
             return 0
         latency = result * 1000  # Convert to ms
+        record_rtt("icmp", latency)
         logger.info(f"Latency: {latency:.2f} ms")
         return latency
     except Exception as e:
@@ -217,6 +767,7 @@ def test_jitter(host="8.8.8.8", count=5):
             result = ping(host, timeout=1)
             if result is not None:
                 latencies.append(result * 1000)
+                record_rtt("icmp", result * 1000)
         
         if not latencies:
             logger.warning("No successful pings for jitter measurement")
@@ -297,18 +848,37 @@ def get_wifi_signal_strength():
         # Return simulated data
         return {"percentage": 75, "dbm": -65, "note": "Simulated data due to error"}
 
+@contextmanager
+def exclusive_probe():
+    """Hold the exclusive measurement lock for the duration of the block"""
+    with _probe_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(PROBE_LOCK_PATH, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
 def collect_metrics(server="8.8.8.8", protocol="tcp"):
     """Collect all network performance metrics"""
+    with exclusive_probe(), recording_rtts() as histograms:
+        return _collect_metrics(server, protocol, histograms)
+
+def _collect_metrics(server, protocol, histograms):
     logger.info(f"Starting metrics collection for protocol: {protocol}")
     
     try:
         # Protocol factor adjustments
         protocol_factor = 1.0 if protocol == "tcp" else 1.1
         reliability_factor = 1.0 if protocol == "tcp" else 0.85
+        timings = {}
         
         # Core metrics with exception handling for each
         try:
-            download_speed, upload_speed = test_bandwidth()
+            download_speed, upload_speed = _timed(timings, "bandwidth", test_bandwidth)
             download_speed *= protocol_factor
             upload_speed *= protocol_factor
         except Exception as e:
@@ -316,33 +886,35 @@ def collect_metrics(server="8.8.8.8", protocol="tcp"):
             download_speed, upload_speed = 0, 0
         
         try:
-            latency = test_latency(server)
+            latency = _timed(timings, "latency", test_latency, server)
             latency = latency / protocol_factor if protocol == "udp" else latency
         except Exception as e:
             logger.error(f"Latency test failed: {e}")
             latency = 0
         
         try:
-            jitter = test_jitter(server)
+            jitter = _timed(timings, "jitter", test_jitter, server)
             jitter = jitter / reliability_factor if protocol == "udp" else jitter
         except Exception as e:
             logger.error(f"Jitter test failed: {e}")
             jitter = 0
         
         try:
-            dns_time = dns_lookup_time()
+            dns_time = _timed(timings, "dns_lookup", dns_lookup_time)
+            if dns_time:
+                record_rtt("dns", dns_time)
         except Exception as e:
             logger.error(f"DNS lookup test failed: {e}")
             dns_time = 0
         
         try:
-            hops = traceroute_hops(server)
+            hops = _timed(timings, "traceroute", traceroute_hops, server)
         except Exception as e:
             logger.error(f"Traceroute test failed: {e}")
             hops = 0
         
         try:
-            packet_loss, packet_sent, packet_rec = measure_packet_loss()
+            packet_loss, packet_sent, packet_rec = _timed(timings, "packet_loss", measure_packet_loss)
             if protocol == "udp":
                 packet_loss *= (1/reliability_factor)
                 packet_rec = packet_sent - int((packet_sent * packet_loss) / 100)
@@ -352,7 +924,7 @@ def collect_metrics(server="8.8.8.8", protocol="tcp"):
         
         # Additional metrics
         try:
-            rx_rate, tx_rate = measure_bandwidth_utilization()
+            rx_rate, tx_rate = _timed(timings, "bandwidth_utilization", measure_bandwidth_utilization)
         except Exception as e:
             logger.error(f"Bandwidth utilization test failed: {e}")
             rx_rate, tx_rate = 0, 0
@@ -371,11 +943,16 @@ def collect_metrics(server="8.8.8.8", protocol="tcp"):
             "rx_bandwidth": rx_rate,
             "tx_bandwidth": tx_rate,
             "protocol": protocol,
+            "target": server,
+            "sample_id": uuid.uuid4().hex,
             "timestamp": datetime.now().isoformat()
         }
         
         # Save the test result
         save_test_result(protocol, metrics)
+        save_rtt_histograms(metrics, histograms)
+        publish_sample(metrics)
+        publish_probe_timings(server, protocol, timings)
         logger.info("Metrics collection completed successfully")
         
         return metrics
@@ -408,7 +985,7 @@ def test_protocol_performance(protocol):
     
     elif protocol.lower() in ["http", "https"]:
         # Test HTTP/HTTPS with a simple request
-        test_url = "https://www.google.com" if protocol.lower() == "https" else "http://example.com"
+        test_url = HTTPS_TEST_URL if protocol.lower() == "https" else HTTP_TEST_URL
         try:
             import requests
             start_time = time.time()
@@ -416,6 +993,8 @@ def test_protocol_performance(protocol):
             request_time = (time.time() - start_time) * 1000  # Convert to ms
             
             metrics["request_time"] = request_time
+            save_rtt_histograms({**metrics, "target": test_url, "protocol": protocol.lower()},
+                                {"http": LatencyHistogram().record(request_time)})
             metrics["status_code"] = response.status_code
             metrics["content_length"] = len(response.content)
             metrics["notes"] = f"{protocol.upper()} request completed successfully"
@@ -438,43 +1017,6 @@ def test_protocol_performance(protocol):
     
     return metrics
 
-def send_alert(email, message):
-    """Send an email alert when critical metrics exceed thresholds"""
-    try:
-        logger.info(f"Sending alert to {email}: {message}")
-        
-        # This is a simple email sending function.
-        # In a production environment, you would use a more robust solution.
-        msg = EmailMessage()
-        msg.set_content(f"""
-        Network Alert Notification
-        
-        {message}
-        
-        Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-        
-        Please check your network metrics dashboard for more details.
-        """)
-        
-        msg['Subject'] = 'Network Metrics Alert'
-        msg['From'] = 'network-monitor@example.com'  # Replace with your sending email
-        msg['To'] = email
-        
-        # Configure your SMTP server details here
-        # For demonstration purposes, we'll just log the alert
-        logger.info(f"ALERT WOULD BE SENT TO {email}: {message}")
-        
-        # Uncomment below to actually send emails (with proper SMTP configuration)
-        # with smtplib.SMTP('smtp.example.com', 587) as server:
-        #     server.starttls()
-        #     server.login('username', 'password')
-        #     server.send_message(msg)
-        
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send alert: {e}")
-        return False
-
 def save_metrics_to_csv(metrics):
     """Save metrics to a CSV file for long-term data storage"""
     try:
@@ -520,8 +1062,170 @@ def log_metrics(metrics):
         logger.error(f"Failed to log metrics: {e}")
         return False
 
+class AgentSpool:
+    """Local durable outbox of samples awaiting delivery to the central server"""
+
+    def __init__(self, path=AGENT_SPOOL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            body TEXT
+        )
+        ''')
+        self._conn.commit()
+
+    def append(self, sample):
+        with self._lock:
+            self._conn.execute('INSERT INTO outbox (body) VALUES (?)', (json.dumps(sample),))
+            self._conn.commit()
+
+    def peek(self, limit):
+        """Oldest pending samples as (last_seq, [json lines])"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT seq, body FROM outbox ORDER BY seq LIMIT ?', (limit,)
+            ).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [body for _, body in rows]
+
+    def ack(self, last_seq):
+        """Drop everything up to and including last_seq once the server accepted it"""
+        with self._lock:
+            self._conn.execute('DELETE FROM outbox WHERE seq <= ?', (last_seq,))
+            self._conn.commit()
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+def ship_batch(server_url, lines, agent_name, token=None, timeout=30):
+    """POST a gzip-compressed NDJSON batch to the central /api/ingest endpoint"""
+    body = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'), compresslevel=6)
+    req = urllib.request.Request(
+        server_url.rstrip('/') + '/api/ingest',
+        data=body,
+        method='POST',
+        headers={
+            'Content-Type': 'application/x-ndjson',
+            'Content-Encoding': 'gzip',
+            'X-Agent-Name': agent_name
+        }
+    )
+    if token:
+        req.add_header('Authorization', f'Bearer {token}')
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+# Agent shipping: only a 400 means the server judged the batch itself invalid.
+# Auth, routing and size errors are deployment problems; the batch is kept.
+AGENT_DROP_STATUSES = (400,)
+AGENT_ALERT_STATUSES = {
+    401: "ingest token rejected, check INGEST_TOKEN on agent and server",
+    403: "ingest token rejected, check INGEST_TOKEN on agent and server",
+    404: "ingest endpoint not found, check the server URL and version",
+    413: "batch too large for the server or a proxy in front of it",
+}
+
+def ship_pending(spool, server_url, agent_name, token=None, batch_size=500):
+    """Ship the oldest spooled batch once
+
+    Returns 'empty', 'partial' or 'full' (shipped; full means more may be
+    waiting), 'dropped' for a batch the server rejected as invalid, or the
+    HTTP status (or 'error') of a failure after which the batch stays spooled.
+    """
+    last_seq, lines = spool.peek(batch_size)
+    if not lines:
+        return 'empty'
+    try:
+        result = ship_batch(server_url, lines, agent_name, token=token)
+    except urllib.error.HTTPError as e:
+        if e.code in AGENT_DROP_STATUSES:
+            # The server will never accept this batch; do not retry it forever
+            logger.error(f"Server rejected batch as invalid ({e.code}), dropping {len(lines)} samples")
+            spool.ack(last_seq)
+            return 'dropped'
+        if e.code in AGENT_ALERT_STATUSES:
+            logger.error(f"ALERT: shipping failed ({e.code}): {AGENT_ALERT_STATUSES[e.code]}; "
+                         f"keeping {spool.pending()} samples spooled")
+        else:
+            logger.warning(f"Shipping failed ({e.code})")
+        return e.code
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        logger.warning(f"Shipping failed ({e})")
+        return 'error'
+    spool.ack(last_seq)
+    logger.info(f"Shipped {len(lines)} samples: {result.get('data', result)}")
+    return 'full' if len(lines) == batch_size else 'partial'
+
+def run_agent(server_url, interval=300, agent_name=None, token=None, batch_size=500,
+              ship_interval=30, spool_path=AGENT_SPOOL_PATH, max_backoff=300):
+    """Run the probe schedule locally and ship samples to a central server
+
+    Samples are buffered in a local spool and only removed once the server
+    acknowledged them (at-least-once delivery); the server deduplicates on
+    sample_id, so retries after a lost acknowledgement are harmless.
+    """
+    agent_name = agent_name or socket.gethostname()
+    spool = AgentSpool(spool_path)
+    stop = threading.Event()
+
+    def probe_loop():
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                metrics = collect_metrics()
+                if "error" not in metrics:
+                    metrics["agent"] = agent_name
+                    spool.append(metrics)
+            except Exception as e:
+                logger.error(f"Agent collection failed: {e}")
+            stop.wait(max(0, interval - (time.monotonic() - started)))
+
+    threading.Thread(target=probe_loop, name="agent-probes", daemon=True).start()
+    logger.info(f"Agent {agent_name} shipping to {server_url} ({spool.pending()} samples pending)")
+
+    backoff = ship_interval
+    try:
+        while True:
+            outcome = ship_pending(spool, server_url, agent_name, token=token, batch_size=batch_size)
+            if outcome in ('full', 'dropped'):
+                backoff = ship_interval
+            elif outcome in ('empty', 'partial'):
+                backoff = ship_interval
+                time.sleep(ship_interval)
+            else:
+                if outcome == 413 and batch_size > 1:
+                    batch_size //= 2
+                    logger.warning(f"Reducing batch size to {batch_size}")
+                logger.warning(f"Retrying in {backoff:.0f}s")
+                time.sleep(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, max_backoff)
+    finally:
+        stop.set()
+
 def main():
     """Main function to initialize database and collect metrics"""
+    parser = argparse.ArgumentParser(description="Collect network performance metrics")
+    parser.add_argument('--agent', metavar='SERVER_URL',
+                        help="Run as a remote agent shipping samples to SERVER_URL/api/ingest")
+    parser.add_argument('--interval', type=int, default=300, help="Agent: seconds between collections")
+    parser.add_argument('--name', help="Agent: name reported to the server (default: hostname)")
+    parser.add_argument('--token', default=os.environ.get('INGEST_TOKEN'), help="Agent: ingest bearer token")
+    parser.add_argument('--spool', default=AGENT_SPOOL_PATH, help="Agent: local spool database")
+    args = parser.parse_args()
+    
+    configure_logging('network_metrics.log', stream=False)
+
+    if args.agent:
+        init_db()
+        run_agent(args.agent, interval=args.interval, agent_name=args.name,
+                  token=args.token, spool_path=args.spool)
+        return None
+    
     try:
         # Initialize the database
         init_db()
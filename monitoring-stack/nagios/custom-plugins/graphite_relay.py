@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Graphite Relay Daemon
+Accepts Graphite plaintext lines on a local UNIX socket and forwards them to
+carbon over one persistent connection, batched by size and time. While carbon
+is unreachable batches are spooled to disk and replayed in order on reconnect.
+"""
+
+import argparse
+import os
+import pickle
+import select
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+DEFAULT_SOCKET = os.environ.get('GRAPHITE_RELAY_SOCKET', '/tmp/graphite-relay.sock')
+DEFAULT_SPOOL_DIR = os.environ.get('GRAPHITE_RELAY_SPOOL', '/var/spool/graphite-relay')
+
+
+def parse_line(line):
+    """Split a plaintext line into (path, value, timestamp) or return None if malformed"""
+    parts = line.split()
+    if len(parts) != 3:
+        return None
+    try:
+        return parts[0], float(parts[1]), int(float(parts[2]))
+    except ValueError:
+        return None
+
+
+class DiskSpool:
+    """Append-only directory of batch segments, replayed oldest first"""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        return sorted(f for f in os.listdir(self.directory) if f.endswith('.spool'))
+
+    def write(self, lines):
+        """Persist a batch atomically as one segment"""
+        self._write_segment(f"{time.time_ns():020d}.spool", lines)
+        self._enforce_limit()
+
+    def rewrite(self, name, lines):
+        """Atomically replace a segment with its undelivered remainder, keeping its place in order"""
+        self._write_segment(name, lines)
+
+    def _write_segment(self, name, lines):
+        tmp_path = os.path.join(self.directory, name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines))
+            f.write('\n')
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return [line for line in f.read().split('\n') if line]
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _enforce_limit(self):
+        """Drop the oldest segments once the spool exceeds its size budget"""
+        segments = self.segments()
+        sizes = {s: os.path.getsize(os.path.join(self.directory, s)) for s in segments}
+        total = sum(sizes.values())
+        for name in segments:
+            if total <= self.max_bytes:
+                break
+            print(f"Spool over {self.max_bytes} bytes, dropping segment {name}")
+            total -= sizes[name]
+            self.remove(name)
+
+
+class CarbonSender:
+    """Persistent carbon connection speaking plaintext or pickle protocol"""
+
+    def __init__(self, host, port, use_pickle=False, timeout=5):
+        self.host = host
+        self.port = port
+        self.use_pickle = use_pickle
+        self.timeout = timeout
+        self.socket = None
+
+    def connect(self):
+        self.close()
+        self.socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def encode(self, lines):
+        if not self.use_pickle:
+            return ('\n'.join(lines) + '\n').encode('utf-8')
+        metrics = []
+        for line in lines:
+            parsed = parse_line(line)
+            if parsed:
+                path, value, timestamp = parsed
+                metrics.append((path, (timestamp, value)))
+        payload = pickle.dumps(metrics, protocol=2)
+        return struct.pack('!L', len(payload)) + payload
+
+    def _peer_closed(self):
+        """Carbon never writes to clients, so a readable socket means it closed the connection"""
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+            return bool(readable) and not self.socket.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def send(self, lines):
+        """Send a batch, connecting on demand; raises OSError on failure
+
+        A connection carbon already closed is replaced first; writing to it
+        would appear to succeed and lose the batch.
+        """
+        if self.socket is None or self._peer_closed():
+            self.connect()
+        try:
+            self.socket.sendall(self.encode(lines))
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
+
+class GraphiteRelay:
+    """Buffers incoming lines and forwards them in batches, spooling during outages"""
+
+    def __init__(self, sender, spool, batch_size=500, flush_interval=1.0,
+                 max_buffer=100000, retry_interval=5.0):
+        self.sender = sender
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.retry_interval = retry_interval
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._next_retry = 0
+        self.sent = 0
+        self.spooled = 0
+
+    def submit(self, lines):
+        with self._cond:
+            self._buffer.extend(lines)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+            overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            # Never let memory grow unbounded: move the excess straight to disk
+            self._spool_batch(self._take(overflow))
+
+    def _take(self, count=None):
+        with self._cond:
+            if count is None or count >= len(self._buffer):
+                batch, self._buffer = self._buffer, []
+            else:
+                batch, self._buffer = self._buffer[:count], self._buffer[count:]
+        return batch
+
+    def _spool_batch(self, batch):
+        if batch:
+            self.spool.write(batch)
+            self.spooled += len(batch)
+
+    def _send(self, batch):
+        """Deliver a batch in chunks of batch_size; returns the lines that were not sent"""
+        if time.monotonic() < self._next_retry:
+            return batch
+        for i in range(0, len(batch), self.batch_size):
+            chunk = batch[i:i + self.batch_size]
+            try:
+                self.sender.send(chunk)
+            except OSError as e:
+                print(f"Carbon unavailable ({e}), spooling for {self.retry_interval}s")
+                self._next_retry = time.monotonic() + self.retry_interval
+                return batch[i:]
+            self.sent += len(chunk)
+        return []
+
+    def _replay_spool(self):
+        """Replay spooled segments oldest first; stops at the first failure"""
+        for name in self.spool.segments():
+            lines = self.spool.read(name)
+            unsent = self._send(lines)
+            if unsent:
+                if len(unsent) < len(lines):
+                    self.spool.rewrite(name, unsent)  # never resend what carbon already has
+                return False
+            self.spool.remove(name)
+            print(f"Replayed spool segment {name}")
+        return True
+
+    def flush(self):
+        batch = self._take()
+        # Spooled data goes first so carbon receives points in order
+        if not self._replay_spool():
+            self._spool_batch(batch)
+            return False
+        unsent = self._send(batch) if batch else []
+        self._spool_batch(unsent)
+        return not unsent
+
+    def run(self):
+        self._running = True
+        while self._running:
+            with self._cond:
+                if len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Relay flush failed: {e}")
+        self.flush()
+        self.sender.close()
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify()
+
+
+class _RelayHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # Bulk senders stream whole perfdata files; hand lines over in batches while reading
+        relay = self.server.relay
+        lines = []
+        for raw in self.rfile:
+            line = raw.decode('utf-8', errors='replace').strip()
+            if line and parse_line(line):
+                lines.append(line)
+                if len(lines) >= relay.batch_size:
+                    relay.submit(lines)
+                    lines = []
+        if lines:
+            relay.submit(lines)
+
+
+class RelayServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, relay):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _RelayHandler)
+        os.chmod(path, 0o666)
+        self.relay = relay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent batching relay from Nagios to Graphite")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="UNIX socket to listen on")
+    parser.add_argument('--graphite-host', default='graphite')
+    parser.add_argument('--graphite-port', type=int, default=None,
+                        help="Carbon port (default 2003, or 2004 with --pickle)")
+    parser.add_argument('--pickle', action='store_true', help="Use the carbon pickle protocol")
+    parser.add_argument('--spool-dir', default=DEFAULT_SPOOL_DIR)
+    parser.add_argument('--spool-max-mb', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    port = args.graphite_port or (2004 if args.pickle else 2003)
+    relay = GraphiteRelay(
+        CarbonSender(args.graphite_host, port, use_pickle=args.pickle),
+        DiskSpool(args.spool_dir, max_bytes=args.spool_max_mb * 1024 * 1024),
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval
+    )
+    server = RelayServer(args.socket, relay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def shutdown(signum, frame):
+        relay.stop()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"Relaying {args.socket} -> {args.graphite_host}:{port} "
+          f"({'pickle' if args.pickle else 'plaintext'})")
+    try:
+        relay.run()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        print(f"Relay stopped: sent={relay.sent} spooled={relay.spooled}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
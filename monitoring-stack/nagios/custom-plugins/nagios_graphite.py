@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Nagios to Graphite Integration Plugin
-This script sends Nagios performance data to Graphite
+This script sends Nagios performance data to Graphite, either per check from
+the Nagios environment or in bulk from rotated perfdata files
 """
 
 import socket
@@ -10,15 +11,94 @@ import sys
 import re
 import os
 from datetime import datetime
+from functools import lru_cache
+
+RELAY_SOCKET = os.environ.get('GRAPHITE_RELAY_SOCKET', '/tmp/graphite-relay.sock')
+BULK_BATCH_SIZE = 5000
+OFFSET_SUFFIX = '.offset'  # bytes of a perfdata file already sent, kept next to it
+
+# 'label'=value[UOM];[warn];[crit];[min];[max] - thresholds are optional
+PERFDATA_PATTERN = re.compile(r"(?:'([^']+)'|([^\s'=]+))=(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\S*")
+SANITIZE_PATTERN = re.compile(r'[^a-zA-Z0-9_-]')
+
+@lru_cache(maxsize=65536)
+def sanitize(name):
+    """Make a name safe for use as a Graphite path component"""
+    return SANITIZE_PATTERN.sub('_', name)
+
+@lru_cache(maxsize=16384)
+def service_prefix(hostname, service_desc):
+    return f"nagios.services.{sanitize(hostname)}.{sanitize(service_desc)}."
+
+@lru_cache(maxsize=16384)
+def host_prefix(hostname):
+    return f"nagios.hosts.{sanitize(hostname)}."
+
+def parse_perfdata_record(line):
+    """Parse one perfdata file line into (kind, timestamp, hostname, service, perfdata)
+
+    Supports the self-describing KEY::value template (DATATYPE::SERVICEPERFDATA,
+    TIMET::..., HOSTNAME::...) and Nagios' default positional templates.
+    """
+    fields = line.rstrip('\r\n').split('\t')
+    if '::' in fields[0]:
+        record = dict(f.split('::', 1) for f in fields if '::' in f)
+        if record.get('DATATYPE', 'SERVICEPERFDATA') == 'HOSTPERFDATA':
+            return 'host', record.get('TIMET'), record.get('HOSTNAME'), None, record.get('HOSTPERFDATA', '')
+        return ('service', record.get('TIMET'), record.get('HOSTNAME'),
+                record.get('SERVICEDESC'), record.get('SERVICEPERFDATA', ''))
+    if fields[0] == '[HOSTPERFDATA]' and len(fields) >= 4:
+        return 'host', fields[1], fields[2], None, fields[-1]
+    if fields[0] == '[SERVICEPERFDATA]' and len(fields) >= 5:
+        return 'service', fields[1], fields[2], fields[3], fields[-1]
+    return None
+
+def read_offset(path):
+    """Bytes of a perfdata file sent by an earlier run (0 if none, or if the file was replaced)"""
+    try:
+        with open(path + OFFSET_SUFFIX) as f:
+            offset = int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+    return offset if offset <= os.path.getsize(path) else 0
+
+def write_offset(path, offset):
+    tmp_path = f"{path}{OFFSET_SUFFIX}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(offset))
+    os.replace(tmp_path, path + OFFSET_SUFFIX)
+
+def remove_offset(path):
+    try:
+        os.remove(path + OFFSET_SUFFIX)
+    except FileNotFoundError:
+        pass
 
 class NagiosGraphiteReporter:
-    def __init__(self, graphite_host='graphite', graphite_port=2003):
+    def __init__(self, graphite_host='graphite', graphite_port=2003, relay_socket=RELAY_SOCKET):
         self.graphite_host = graphite_host
         self.graphite_port = graphite_port
+        self.relay_socket = relay_socket
         self.socket = None
+        self.buffer = []
         
+    def connect_to_relay(self):
+        """Connect to the local graphite_relay.py daemon if it is running"""
+        if not self.relay_socket or not os.path.exists(self.relay_socket):
+            return False
+        try:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(self.relay_socket)
+            return True
+        except Exception as e:
+            print(f"Graphite relay unavailable, falling back to direct connection: {e}")
+            self.socket = None
+            return False
+    
     def connect_to_graphite(self):
-        """Establish connection to Graphite"""
+        """Establish connection to the local relay, or directly to Graphite"""
+        if self.connect_to_relay():
+            return True
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.graphite_host, self.graphite_port))
@@ -28,19 +108,27 @@ class NagiosGraphiteReporter:
             return False
     
     def send_metric(self, metric_path, value, timestamp=None):
-        """Send a single metric to Graphite"""
+        """Queue a single metric; queued metrics are written in one batch by flush()"""
         if timestamp is None:
             timestamp = int(time.time())
         
-        message = f"{metric_path} {value} {timestamp}\n"
-        
+        self.buffer.append(f"{metric_path} {value} {timestamp}\n")
+        return True
+    
+    def flush(self):
+        """Send all queued metrics with a single write"""
+        if not self.buffer:
+            return True
         try:
             if self.socket:
-                self.socket.sendall(message.encode('utf-8'))
+                self.socket.sendall(''.join(self.buffer).encode('utf-8'))
+                self.buffer = []
                 return True
         except Exception as e:
-            print(f"Failed to send metric: {e}")
-            return False
+            print(f"Failed to send metrics: {e}")
+        # Drop the batch so close_connection does not resend it; bulk mode resumes from the saved offset
+        self.buffer = []
+        return False
     
     def parse_nagios_perfdata(self, perfdata):
         """Parse Nagios performance data string"""
@@ -48,24 +136,26 @@ class NagiosGraphiteReporter:
         if not perfdata:
             return metrics
         
-        # Pattern to match performance data format: 'label'=value[UOM];[warn];[crit];[min];[max]
-        pattern = r"'?([^'=]+)'?=([^;]+)(?:;([^;]*);([^;]*);([^;]*);([^;]*))?(?:\s|$)"
-        
-        for match in re.finditer(pattern, perfdata):
-            label = match.group(1).strip()
-            value_str = match.group(2).strip()
-            
-            # Extract numeric value
-            value_match = re.search(r'(-?\d+\.?\d*)', value_str)
-            if value_match:
-                try:
-                    value = float(value_match.group(1))
-                    metrics[label] = value
-                except ValueError:
-                    continue
+        for quoted, plain, value in PERFDATA_PATTERN.findall(perfdata):
+            try:
+                metrics[(quoted or plain).strip()] = float(value)
+            except ValueError:
+                continue
         
         return metrics
     
+    def service_metrics(self, hostname, service_desc, perfdata):
+        """Yield (metric_path, value) for a service check's perfdata"""
+        prefix = service_prefix(hostname, service_desc)
+        for metric_name, value in self.parse_nagios_perfdata(perfdata).items():
+            yield prefix + sanitize(metric_name), value
+    
+    def host_metrics(self, hostname, perfdata):
+        """Yield (metric_path, value) for a host check's perfdata"""
+        prefix = host_prefix(hostname)
+        for metric_name, value in self.parse_nagios_perfdata(perfdata).items():
+            yield prefix + sanitize(metric_name), value
+    
     def process_service_perfdata(self):
         """Process service performance data from environment variables"""
         # Nagios service perfdata environment variables
@@ -74,15 +164,7 @@ class NagiosGraphiteReporter:
         perfdata = os.environ.get('NAGIOS_SERVICEPERFDATA', '')
         timestamp = int(os.environ.get('NAGIOS_TIMET', time.time()))
         
-        # Clean hostname and service description for Graphite path
-        hostname = re.sub(r'[^a-zA-Z0-9_-]', '_', hostname)
-        service_desc = re.sub(r'[^a-zA-Z0-9_-]', '_', service_desc)
-        
-        metrics = self.parse_nagios_perfdata(perfdata)
-        
-        for metric_name, value in metrics.items():
-            metric_name = re.sub(r'[^a-zA-Z0-9_-]', '_', metric_name)
-            metric_path = f"nagios.services.{hostname}.{service_desc}.{metric_name}"
+        for metric_path, value in self.service_metrics(hostname, service_desc, perfdata):
             self.send_metric(metric_path, value, timestamp)
             print(f"Sent metric: {metric_path} = {value}")
     
@@ -92,25 +174,84 @@ class NagiosGraphiteReporter:
         perfdata = os.environ.get('NAGIOS_HOSTPERFDATA', '')
         timestamp = int(os.environ.get('NAGIOS_TIMET', time.time()))
         
-        # Clean hostname for Graphite path
-        hostname = re.sub(r'[^a-zA-Z0-9_-]', '_', hostname)
-        
-        metrics = self.parse_nagios_perfdata(perfdata)
-        
-        for metric_name, value in metrics.items():
-            metric_name = re.sub(r'[^a-zA-Z0-9_-]', '_', metric_name)
-            metric_path = f"nagios.hosts.{hostname}.{metric_name}"
+        for metric_path, value in self.host_metrics(hostname, perfdata):
             self.send_metric(metric_path, value, timestamp)
             print(f"Sent metric: {metric_path} = {value}")
     
+    def process_perfdata_file(self, path, batch_size=BULK_BATCH_SIZE):
+        """Stream a rotated service/host perfdata file, sending metrics in batches
+
+        Memory use is bounded by the batch size regardless of file length.
+        After every delivered batch the file offset is saved (path + .offset),
+        so a run that fails partway resumes after the last delivered batch.
+        Returns (records, metrics) processed, or None if sending failed.
+        """
+        records = 0
+        sent = 0
+        offset = read_offset(path)
+        if offset:
+            print(f"Resuming {path} at byte {offset}")
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                offset += len(raw)
+                record = parse_perfdata_record(raw.decode('utf-8', errors='replace'))
+                if record is None:
+                    continue
+                kind, timet, hostname, service_desc, perfdata = record
+                if not perfdata:
+                    continue
+                try:
+                    timestamp = int(timet)
+                except (TypeError, ValueError):
+                    timestamp = int(time.time())
+                
+                if kind == 'service':
+                    lines = self.service_metrics(hostname or 'unknown', service_desc or 'unknown', perfdata)
+                else:
+                    lines = self.host_metrics(hostname or 'unknown', perfdata)
+                for metric_path, value in lines:
+                    self.buffer.append(f"{metric_path} {value} {timestamp}\n")
+                records += 1
+                
+                if len(self.buffer) >= batch_size:
+                    sent += len(self.buffer)
+                    if not self.flush():
+                        return None
+                    write_offset(path, offset)
+        sent += len(self.buffer)
+        if not self.flush():
+            return None
+        write_offset(path, offset)
+        return records, sent
+    
     def close_connection(self):
-        """Close connection to Graphite"""
+        """Flush queued metrics and close connection to Graphite"""
+        self.flush()
         if self.socket:
             self.socket.close()
 
+def process_bulk(reporter, paths, keep=False):
+    """Process rotated perfdata files; a file is removed only once fully sent"""
+    failed = False
+    for path in paths:
+        started = time.time()
+        result = reporter.process_perfdata_file(path)
+        if result is None:
+            print(f"Failed to send metrics from {path}, keeping it for the next run")
+            failed = True
+            break
+        records, metrics = result
+        print(f"Processed {path}: {records} records, {metrics} metrics in {time.time() - started:.2f}s")
+        if not keep:
+            os.remove(path)
+            remove_offset(path)
+    return not failed
+
 def main():
     if len(sys.argv) < 2:
         print("Usage: nagios_graphite.py [service|host]")
+        print("       nagios_graphite.py bulk [--keep] <perfdata_file>...")
         sys.exit(1)
     
     data_type = sys.argv[1].lower()
@@ -125,8 +266,14 @@ def main():
             reporter.process_service_perfdata()
         elif data_type == 'host':
             reporter.process_host_perfdata()
+        elif data_type == 'bulk':
+            keep = '--keep' in sys.argv[2:]
+            paths = [p for p in sys.argv[2:]
+                     if p != '--keep' and not p.endswith(OFFSET_SUFFIX) and os.path.isfile(p)]
+            if not process_bulk(reporter, paths, keep=keep):
+                sys.exit(2)
         else:
-            print("Invalid data type. Use 'service' or 'host'")
+            print("Invalid data type. Use 'service', 'host' or 'bulk'")
             sys.exit(1)
     finally:
         reporter.close_connection()
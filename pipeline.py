@@ -0,0 +1,61 @@
+"""
+Sample processing stages shared by the API server and the collector daemon.
+
+Whichever process runs collect_metrics gets the same downstream behaviour:
+alert evaluation, anomaly detection, optional Graphite/StatsD export and the
+latest-sample cache read by API workers.
+"""
+
+import logging
+import threading
+
+from metricsmeasure import (
+    register_sample_handler, register_timing_handler,
+    save_anomalies, write_latest_sample
+)
+from alerts import AlertEngine
+from anomaly import AnomalyDetector
+from exporter import create_exporter
+
+logger = logging.getLogger('network_pipeline')
+
+alert_engine = None
+anomaly_detector = None
+metrics_exporter = None
+
+_init_lock = threading.Lock()
+
+
+def init_pipeline():
+    """Register all sample handlers once per process"""
+    global alert_engine, anomaly_detector, metrics_exporter
+    with _init_lock:
+        if alert_engine is not None:
+            return
+
+        # Latest sample first so readers see it as soon as possible
+        register_sample_handler(write_latest_sample)
+
+        # Alert rules are evaluated off the collecting thread
+        alert_engine = AlertEngine()
+        register_sample_handler(alert_engine.submit)
+
+        # Incremental anomaly detection runs inline on each sample (microseconds per sample)
+        anomaly_detector = AnomalyDetector(sink=save_anomalies)
+        register_sample_handler(anomaly_detector.observe)
+
+        # Optional Graphite/StatsD export of every sample and probe timing (METRICS_EXPORT)
+        metrics_exporter = create_exporter()
+        if metrics_exporter is not None:
+            register_sample_handler(metrics_exporter.export_sample)
+            register_timing_handler(metrics_exporter.export_timings)
+
+        logger.info("Sample pipeline initialized")
+
+
+def shutdown_pipeline():
+    """Flush pending alerts and exports before the process exits"""
+    if alert_engine is not None:
+        alert_engine.stop()
+    if metrics_exporter is not None:
+        metrics_exporter.stop()
@@ -0,0 +1,124 @@
+"""
+Response cache for read-only API endpoints.
+
+Rendered responses are kept per route, query string and Accept header, and
+stay valid until new rows reach one of the tables they are built from. These
+tables are append-only, so their largest rowids identify their contents:
+samples written by the collector daemon, an agent ingest or a job in another
+worker all invalidate the cache without any coordination, while commits to
+other tables (job status and heartbeats) do not. Cached bodies carry strong
+ETags, and a matching If-None-Match is answered with 304.
+"""
+
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+
+from flask import current_app, request
+
+import metricsmeasure
+from static_assets import StaticAsset
+
+logger = logging.getLogger('network_cache')
+
+API_CACHE_CONTROL = 'no-cache'  # always revalidate; a 304 costs a hash lookup
+MAX_CACHE_ENTRIES = 256
+CACHED_TABLES = ('test_history', 'anomalies', 'rtt_histograms')  # append-only sources of cached responses
+
+# Caches to reset in a forked child (gunicorn --preload forks after create_app)
+_instances = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for cache in _instances:
+        cache._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class ResponseCache:
+    """LRU cache of rendered responses, invalidated by new rows in the cached tables"""
+
+    def __init__(self, db_path=None, max_entries=MAX_CACHE_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        _instances.add(self)
+
+    def _reset(self):
+        """Forget state inherited from the parent process
+
+        The parent's SQLite connection must not be used, or even closed, in
+        the child; it is dropped and the child connects on first use.
+        """
+        self._lock = threading.Lock()
+        self._conn = None
+        self._entries = OrderedDict()
+        self._generation = None
+
+    def generation(self):
+        """Largest rowid of each cached table; changes whenever rows are added to one of them"""
+        query = 'SELECT ' + ', '.join(f'(SELECT MAX(rowid) FROM {table})' for table in CACHED_TABLES)
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path or metricsmeasure.DB_PATH, check_same_thread=False)
+            try:
+                return self._conn.execute(query).fetchone()
+            except sqlite3.OperationalError:
+                return None  # schema not created yet
+
+    def _lookup(self, key, generation):
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, generation, entry):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, view):
+        """Decorator caching successful responses of a GET view"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.path, tuple(sorted(request.args.items(multi=True))),
+                   request.headers.get('Accept', ''))
+            generation = self.generation()
+            entry = self._lookup(key, generation)
+            if entry is None:
+                self.misses += 1
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = StaticAsset(response.get_data(), response.mimetype, API_CACHE_CONTROL).compress(best=False)
+                self._store(key, generation, entry)
+            else:
+                self.hits += 1
+            response = entry.respond(request)
+            response.vary.add('Accept')
+            return response
+        return wrapper
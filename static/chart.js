@@ -9,7 +9,7 @@ class HistoricalChart {
         this.options = {
             padding: 60,
             gridLines: 6,
-            maxDataPoints: 50,
+            maxDataPoints: 200,
             smoothing: true,
             showTooltip: true,
             showValues: true,
@@ -113,7 +113,31 @@ class HistoricalChart {
         return null;
     }
     
+    // Expand the columnar historical format (shared delta-encoded timestamps plus
+    // one array per field) into points, decoding only the fields the chart draws
+    static fromColumnar(data, fields = ['download_speed', 'upload_speed'], limit = Infinity) {
+        const deltas = data.timestamp || [];
+        const columns = data.columns || {};
+        const first = Math.max(0, deltas.length - limit);
+        const points = [];
+        let time = data.start;
+        for (let i = 0; i < deltas.length; i++) {
+            time += deltas[i];
+            if (i < first) continue;
+            const point = { timestamp: time };
+            for (const field of fields) {
+                point[field] = columns[field] ? columns[field][i] : undefined;
+            }
+            points.push(point);
+        }
+        return points;
+    }
+    
     updateData(newData) {
+        if (!Array.isArray(newData)) {
+            newData = HistoricalChart.fromColumnar(newData, undefined, this.options.maxDataPoints);
+        }
+        
         // Limit data points for performance
         if (newData.length > this.options.maxDataPoints) {
             this.data = newData.slice(-this.options.maxDataPoints);
@@ -61,7 +61,7 @@ class NetworkMonitor {
 
     async loadInitialData() {
         await Promise.all([
-            this.loadMetrics(),
+            this.loadLatestMetrics(),
             this.loadWifiSignal(),
             this.loadHistoricalData('24h')
         ]);
@@ -147,7 +147,8 @@ class NetworkMonitor {
 
     async loadHistoricalData(timeframe) {
         try {
-            const response = await fetch(`${this.baseURL}/api/historical/${timeframe}`);
+            const response = await fetch(`${this.baseURL}/api/historical?timeframe=${timeframe}&metrics=download_speed,upload_speed`
+                + `&max_points=${this.chart.options.maxDataPoints}&format=columnar`);
             
             if (!response.ok) {
                 throw new Error(`HTTP ${response.status}: ${response.statusText}`);
@@ -216,11 +217,35 @@ class NetworkMonitor {
         console.log(message);
     }
 
+    async loadLatestMetrics() {
+        try {
+            const response = await fetch(`${this.baseURL}/api/metrics/latest`);
+
+            if (response.status === 404) {
+                // Nothing collected yet, measure on demand instead
+                return this.loadMetrics();
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+
+            const result = await response.json();
+
+            if (result.status === 'success') {
+                this.updateMetricsDisplay(result.data);
+                this.updateConnectionStatus(true);
+            }
+        } catch (error) {
+            console.error('Failed to load latest metrics:', error);
+            this.updateConnectionStatus(false);
+        }
+    }
+
     startAutoRefresh() {
-        // Refresh metrics every 30 seconds
+        // Refresh metrics every 30 seconds from the collector's latest sample
         setInterval(() => {
             if (!this.isLoading) {
-                this.loadMetrics();
+                this.loadLatestMetrics();
                 this.loadWifiSignal();
             }
         }, 30000);
@@ -0,0 +1,144 @@
+"""
+In-memory static responses for the dashboard and prebuilt API payloads.
+
+Every file under the static folder is read once at startup, together with a
+gzip (and Brotli, when available) variant of text files, so serving the
+dashboard needs no filesystem access per request. When build_assets.py has
+been run, static/dist/index.html replaces index.html and the content-hashed
+bundles it references are served with immutable, year-long cache headers.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('network_static')
+
+DIST_DIRNAME = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=300'
+INDEX_CACHE = 'no-cache'
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/vnd.',
+                      'application/msgpack', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 512
+
+
+class StaticAsset:
+    """One static response body and its encoded variants"""
+
+    def __init__(self, body, mimetype, cache_control):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.variants = {'identity': body}
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+
+    def etag(self, encoding):
+        return self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+
+    def compress(self, best=True):
+        """Add gzip/Brotli variants for compressible bodies that have none yet
+
+        best=False trades ratio for speed, for bodies compressed at request time.
+        """
+        body = self.variants['identity']
+        if len(body) < MIN_COMPRESS_BYTES or not self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return self
+        if 'br' not in self.variants and brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11 if best else 5)
+        if 'gzip' not in self.variants:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+        return self
+
+    def respond(self, request):
+        """Build the response, negotiating Content-Encoding and honouring If-None-Match"""
+        encoding = 'identity'
+        for candidate in ('br', 'gzip'):
+            if candidate in self.variants and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        etag = self.etag(encoding)
+        headers = {
+            'Cache-Control': self.cache_control,
+            'ETag': f'"{etag}"',
+            'Vary': 'Accept-Encoding'
+        }
+        if etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+        content_type = self.mimetype + ('; charset=utf-8' if self.mimetype.startswith('text/') else '')
+        response = Response(self.variants[encoding], content_type=content_type, headers=headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class StaticAssets:
+    """Static folder snapshot keyed by URL path"""
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.assets = {}
+        self.index = None
+        self.manifest = None
+        self.load()
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def load(self):
+        assets = {}
+        dist_dir = os.path.join(self.static_folder, DIST_DIRNAME)
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                if name.endswith(('.gz', '.br')) or name == MANIFEST_NAME:
+                    continue
+                path = os.path.join(root, name)
+                url_path = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                immutable = os.path.dirname(path) == dist_dir and name != 'index.html'
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                asset = StaticAsset(self._read(path), mimetype, IMMUTABLE_CACHE if immutable else DEFAULT_CACHE)
+                self._add_variants(asset, path)
+                assets[url_path] = asset
+
+        manifest_path = os.path.join(dist_dir, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            self.index = assets.get(f'{DIST_DIRNAME}/index.html')
+            logger.info(f"Serving bundled dashboard assets: {self.manifest.get('app.js')}")
+        else:
+            self.index = assets.get('index.html')
+            logger.info("No asset manifest found, serving unbundled dashboard (run build_assets.py)")
+        if self.index is not None:
+            self.index.cache_control = INDEX_CACHE
+        self.assets = assets
+
+    def _add_variants(self, asset, path):
+        """Attach build-time precompressed files, then compress text files that lack them"""
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if os.path.exists(path + suffix):
+                asset.variants[encoding] = self._read(path + suffix)
+        asset.compress()
+
+    def get(self, path):
+        """Asset for a URL path, falling back to the dashboard index for unknown paths"""
+        return self.assets.get(path) or self.index
+
+    def respond(self, asset, request):
+        if asset is None:
+            return Response("Not found", status=404, mimetype='text/plain')
+        return asset.respond(request)
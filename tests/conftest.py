@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The application modules live at the repository root, the Nagios plugins in the monitoring stack
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'monitoring-stack', 'nagios', 'custom-plugins'))
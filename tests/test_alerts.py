@@ -0,0 +1,192 @@
+import socketserver
+import threading
+from datetime import datetime, timedelta
+from email import message_from_bytes
+
+import pytest
+
+from alerts import AlertEngine, AlertRule, SmtpNotifier
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def sample(seconds, target="8.8.8.8", **metrics):
+    return {"timestamp": (START + timedelta(seconds=seconds)).isoformat(), "target": target, **metrics}
+
+
+class RecordingNotifier:
+    def __init__(self):
+        self.digests = []
+
+    def send(self, alerts):
+        self.digests.append([(a.rule, a.target, a.state) for a in alerts])
+        return True
+
+    def close(self):
+        pass
+
+
+def engine_for(**rule):
+    rule = {"name": "high_latency", "metric": "latency", "threshold": 100, **rule}
+    return AlertEngine(rules=[AlertRule(**rule)], notifier=RecordingNotifier())
+
+
+def states(alerts):
+    return [a.state for a in alerts]
+
+
+def test_duration_window_delays_firing():
+    engine = engine_for(for_seconds=60)
+    assert engine.evaluate(sample(0, latency=150)) == []
+    assert engine.evaluate(sample(30, latency=150)) == []
+    # A dip below the threshold restarts the window
+    assert engine.evaluate(sample(45, latency=50)) == []
+    assert engine.evaluate(sample(60, latency=150)) == []
+    assert states(engine.evaluate(sample(120, latency=150))) == ["firing"]
+
+
+def test_hysteresis_resolves_only_below_clear_threshold():
+    engine = engine_for(clear_threshold=80)
+    assert states(engine.evaluate(sample(0, latency=120))) == ["firing"]
+    assert engine.evaluate(sample(10, latency=90)) == []   # below threshold, above clear
+    assert engine.evaluate(sample(20, latency=130)) == []  # still the same incident
+    assert states(engine.evaluate(sample(30, latency=70))) == ["resolved"]
+
+
+def test_cooldown_suppresses_repeated_notifications():
+    engine = engine_for(cooldown=900)
+    assert states(engine.evaluate(sample(0, latency=150))) == ["firing"]
+    assert states(engine.evaluate(sample(10, latency=50))) == ["resolved"]
+    # Fires again within the cooldown: neither the firing nor its resolution is notified
+    assert engine.evaluate(sample(20, latency=150)) == []
+    assert engine.evaluate(sample(30, latency=50)) == []
+    assert states(engine.evaluate(sample(1000, latency=150))) == ["firing"]
+
+
+def test_rules_are_tracked_per_target():
+    engine = engine_for()
+    assert states(engine.evaluate(sample(0, target="a", latency=150))) == ["firing"]
+    assert states(engine.evaluate(sample(0, target="b", latency=150))) == ["firing"]
+    assert engine.evaluate(sample(0, target="c", packet_loss=50)) == []  # metric missing
+
+
+def test_pending_notifications_are_deduplicated():
+    engine = engine_for()
+    firing = engine.evaluate(sample(0, target="a", latency=150))
+    engine._queue_alerts(firing)
+    engine._queue_alerts(firing)
+    # A resolution before delivery cancels the firing notification of the same target
+    engine._queue_alerts(engine.evaluate(sample(10, target="b", latency=150)))
+    engine._queue_alerts(engine.evaluate(sample(20, target="b", latency=50)))
+    assert engine.flush()
+    assert engine.notifier.digests == [[("high_latency", "a", "firing")]]
+    assert engine.flush() and len(engine.notifier.digests) == 1
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server recording every message it receives"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+        self.port = self.server_address[1]
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stub ESMTP')
+        envelope = {"rcpt": []}
+        for raw in self.rfile:
+            command = raw.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stub')
+            elif verb == 'MAIL':
+                envelope = {"from": command[10:], "rcpt": []}
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                envelope["rcpt"].append(command[8:])
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for line in self.rfile:
+                    if line == b'.\r\n':
+                        break
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                envelope["message"] = message_from_bytes(b''.join(data))
+                self.server.messages.append(envelope)
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+@pytest.fixture
+def smtp():
+    server = SmtpStub()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_engine_delivers_one_digest_to_local_smtp(smtp):
+    notifier = SmtpNotifier(host='127.0.0.1', port=smtp.port, starttls=False,
+                            sender='monitor@example.com', recipients=['ops@example.com', 'noc@example.com'])
+    engine = AlertEngine(rules=[AlertRule("high_latency", "latency", 100),
+                                AlertRule("high_packet_loss", "packet_loss", 10, severity="critical")],
+                         notifier=notifier, digest_window=3600)
+    engine.submit(sample(0, target="a", latency=150, packet_loss=0))
+    engine.submit(sample(0, target="b", latency=20, packet_loss=40))
+    engine.stop()  # flushes the pending digest
+
+    assert len(smtp.messages) == 1
+    message = smtp.messages[0]
+    assert message["rcpt"] == ['<ops@example.com>', '<noc@example.com>']
+    assert message["message"]["Subject"] == "Network Metrics Alert: 2 firing, 0 resolved"
+    body = message["message"].get_payload()
+    assert "high_latency firing on a" in body and "[CRITICAL] high_packet_loss firing on b" in body
+    assert smtp.connections == 1
+
+
+def test_digests_reuse_the_smtp_connection(smtp):
+    notifier = SmtpNotifier(host='127.0.0.1', port=smtp.port, starttls=False, recipients=['ops@example.com'])
+    engine = AlertEngine(rules=[AlertRule("high_latency", "latency", 100)], notifier=notifier)
+    assert notifier.send(engine.evaluate(sample(0, latency=150)))
+    assert notifier.send(engine.evaluate(sample(60, latency=10)))
+    notifier.close()
+    assert [m["message"]["Subject"] for m in smtp.messages] == [
+        "Network Metrics Alert: 1 firing, 0 resolved", "Network Metrics Alert: 0 firing, 1 resolved"]
+    assert smtp.connections == 1
+
+
+def test_alerts_without_recipients_are_logged(caplog):
+    notifier = SmtpNotifier(host='127.0.0.1', port=1, recipients=[])
+    engine = engine_for()
+    assert notifier.send(engine.evaluate(sample(0, latency=150)))
+    assert "no ALERT_RECIPIENTS configured" in caplog.text
+
+
+def test_cancelled_notification_does_not_start_the_cooldown():
+    engine = engine_for(cooldown=900)
+    # Fires and resolves within one digest window: nothing is sent
+    engine._queue_alerts(engine.evaluate(sample(0, latency=150)))
+    engine._queue_alerts(engine.evaluate(sample(10, latency=50)))
+    assert engine.flush() and engine.notifier.digests == []
+    # A real breach minutes later is not suppressed by the cancelled notification
+    engine._queue_alerts(engine.evaluate(sample(120, latency=150)))
+    assert engine.flush()
+    assert engine.notifier.digests == [[("high_latency", "8.8.8.8", "firing")]]
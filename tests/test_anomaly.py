@@ -0,0 +1,153 @@
+import os
+import random
+import time
+from datetime import datetime
+
+import pytest
+
+import metricsmeasure
+from anomaly import AnomalyDetector
+
+LATENCY = {"latency": (1, "latency_spike", 1.0)}
+# Local midnight, so hour-of-day seasons line up with the loop below
+DAY_START = datetime(2026, 1, 1).timestamp()
+
+
+def steady(i):
+    return 20.0 + (i % 2) * 0.5
+
+
+def feed(detector, values, step=300, start=DAY_START):
+    """Feed (index, value) pairs and return the detections by index"""
+    found = {}
+    for i, value in values:
+        detection = detector.update("8.8.8.8", "latency", value, start + i * step)
+        if detection is not None:
+            found[i] = detection
+    return found
+
+
+def test_no_detections_during_warmup():
+    detector = AnomalyDetector(metrics=LATENCY, warmup=10)
+    assert feed(detector, [(i, 500.0 if i % 3 else 20.0) for i in range(10)]) == {}
+
+
+def test_spike_is_detected_against_the_ewma_baseline():
+    detector = AnomalyDetector(metrics=LATENCY)
+    found = feed(detector, [(i, steady(i)) for i in range(50)] + [(50, 80.0)])
+    assert list(found) == [50]
+    spike = found[50]
+    assert spike["kind"] == "latency_spike" and spike["target"] == "8.8.8.8"
+    assert spike["expected"] == pytest.approx(20.25, abs=0.5)
+    assert spike["score"] > detector.z_threshold
+
+
+def test_outliers_are_clipped_before_learning():
+    detector = AnomalyDetector(metrics=LATENCY)
+    found = feed(detector, [(i, steady(i)) for i in range(50)] + [(50, 1000.0), (51, 20.0)])
+    assert list(found) == [50]
+    state = detector._series[("8.8.8.8", "latency")]
+    assert state.mean < 21.0
+
+
+def test_direction_of_degradation():
+    metrics = {"download_speed": (-1, "throughput_drop", 1.0)}
+    detector = AnomalyDetector(metrics=metrics)
+    for i in range(50):
+        assert detector.update("t", "download_speed", 100.0 + i % 2, DAY_START + i * 300) is None
+    assert detector.update("t", "download_speed", 400.0, DAY_START + 50 * 300) is None
+    assert detector.update("t", "download_speed", 40.0, DAY_START + 51 * 300)["kind"] == "throughput_drop"
+
+
+def test_cusum_flags_a_sustained_shift_below_the_spike_threshold():
+    detector = AnomalyDetector(metrics=LATENCY)
+    found = feed(detector, [(i, steady(i) + (3.5 if i >= 100 else 0.0)) for i in range(120)])
+    assert found and min(found) >= 100
+    first = found[min(found)]
+    assert first["kind"] == "level_shift"
+    assert first["score"] < detector.z_threshold
+
+
+def test_seasonal_baseline_absorbs_daily_pattern():
+    # Without clipping the busy hour is learned as its own baseline after season_warmup days
+    detector = AnomalyDetector(metrics=LATENCY, clip=100.0)
+    hourly = [(h, 60.0 if h % 24 == 12 else steady(h)) for h in range(24 * 5)]
+    found = feed(detector, hourly, step=3600)
+    assert sorted(found) == [12, 36, 60]
+    # The busy-hour value is now expected at noon, but not at 05:00
+    assert detector.update("8.8.8.8", "latency", 60.0, DAY_START + (24 * 5 + 5) * 3600) is not None
+    assert detector.update("8.8.8.8", "latency", 60.0, DAY_START + (24 * 5 + 12) * 3600) is None
+
+
+
+@pytest.fixture
+def berlin_time(monkeypatch):
+    if not os.path.exists('/usr/share/zoneinfo/Europe/Berlin'):
+        pytest.skip("no tz database")
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_seasons_follow_daylight_saving_time(berlin_time):
+    detector = AnomalyDetector(metrics=LATENCY)
+    for day in (datetime(2026, 1, 15, 12, 30), datetime(2026, 7, 15, 12, 30)):
+        detector.update("8.8.8.8", "latency", 20.0, day.timestamp())
+    season_count = detector._series[("8.8.8.8", "latency")].season_count
+    assert season_count[12] == 2 and sum(season_count) == 2
+
+def test_noise_alone_stays_quiet():
+    rng = random.Random(3)
+    detector = AnomalyDetector()
+    detections = []
+    for i in range(2000):
+        detections += detector.observe({
+            "target": "10.0.0.1",
+            "timestamp": datetime.fromtimestamp(DAY_START + i * 300).isoformat(),
+            "latency": rng.gauss(20, 1),
+            "download_speed": rng.gauss(100, 5),
+        })
+    assert detections == []
+
+
+def test_observe_scores_samples_per_series_and_calls_the_sink():
+    batches = []
+    detector = AnomalyDetector(metrics=LATENCY, sink=batches.append)
+
+    def sample(i, latency, agent="local"):
+        return {"timestamp": datetime.fromtimestamp(DAY_START + i * 300).isoformat(),
+                "target": "8.8.8.8", "agent": agent, "latency": latency}
+
+    for i in range(50):
+        detector.observe(sample(i, steady(i)))
+    assert detector.observe({"target": "8.8.8.8", "error": "timeout"}) == []
+    assert detector.observe(sample(50, None)) == []
+    # A remote agent's samples form their own series, still in warmup
+    assert detector.observe(sample(50, 90.0, agent="edge-01")) == []
+    detections = detector.observe(sample(51, 90.0))
+    assert [d["target"] for d in detections] == ["8.8.8.8"]
+    assert batches == [detections]
+    assert detector.series_count() == 2
+
+
+def test_detections_are_saved_and_queried(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricsmeasure, 'DB_PATH', str(tmp_path / 'metrics.db'))
+    metricsmeasure.init_db()
+    detector = AnomalyDetector(metrics=LATENCY)
+    now = datetime.now().timestamp()
+    found = feed(detector, [(i, steady(i)) for i in range(30)] + [(30, 90.0)], start=now - 30 * 300)
+
+    assert metricsmeasure.save_anomalies(list(found.values()))
+    saved = metricsmeasure.get_anomalies()
+    assert [(a["target"], a["metric"], a["kind"], a["value"]) for a in saved] == [
+        ("8.8.8.8", "latency", "latency_spike", 90.0)]
+    assert metricsmeasure.get_anomalies(metric="jitter") == []
+
+
+def test_save_anomalies_reports_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr(metricsmeasure, 'DB_PATH', str(tmp_path / 'missing' / 'metrics.db'))
+    detection = {"timestamp": "2026-01-01T00:00:00", "target": "t", "metric": "latency",
+                 "kind": "latency_spike", "value": 90.0, "expected": 20.0, "score": 70.0}
+    assert metricsmeasure.save_anomalies([detection]) is False
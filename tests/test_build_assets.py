@@ -0,0 +1,122 @@
+import gzip
+import os
+import shutil
+import subprocess
+
+import pytest
+from flask import Flask, request
+
+import build_assets
+import static_assets
+from build_assets import build, minify_css, minify_js
+from static_assets import IMMUTABLE_CACHE, INDEX_CACHE, StaticAssets
+
+STATIC_DIR = os.path.join(os.path.dirname(build_assets.__file__), 'static')
+
+
+@pytest.mark.parametrize('source, expected', [
+    # Regular expression literals after operators, keywords and inside character classes
+    ('var re = /\\/\\/[^/]*/g; // strip\n', 'var re = /\\/\\/[^/]*/g;\n'),
+    ('function f(x) {\n    return /[/]+/.test(x)\n}\n', 'function f(x) {\nreturn /[/]+/.test(x)\n}\n'),
+    ('if (!/^\\d+$/.test(v)) {}\n', 'if (!/^\\d+$/.test(v)) {}\n'),
+    # Division is not mistaken for a regex
+    ('var half = total / 2 / count;  /* ratio */\n', 'var half = total / 2 / count;\n'),
+    ('var r = (a) / b, s = x[1] / y;\n', 'var r = (a) / b, s = x[1] / y;\n'),
+    # Comment markers inside strings stay, escaped quotes do not end the string
+    ('var s = "// not a comment", t = \'/* nor this */\';\n', 'var s = "// not a comment", t = \'/* nor this */\';\n'),
+    ('var q = "say \\"hi\\" // still text";\n', 'var q = "say \\"hi\\" // still text";\n'),
+    # Template literals, with substitutions, are copied verbatim
+    ('var tpl = `${a / b} // kept\n  ${c}`;\n', 'var tpl = `${a / b} // kept\n  ${c}`;\n'),
+])
+def test_minify_js_keeps_literals_intact(source, expected):
+    assert minify_js(source) == expected
+
+
+def test_minify_js_keeps_line_breaks_for_semicolon_insertion():
+    source = "let a = 1\n\n\n    let b = a\n/* block\ncomment */\n(b)\n"
+    assert minify_js(source) == "let a = 1\nlet b = a\n(b)\n"
+    assert minify_js("a/*x*/b") == "a b\n"
+
+
+def test_minify_css():
+    assert minify_css("/* theme */\nbody {\n  color: red;\n  margin: 0 auto;\n}\n\na > b , c { x: 1 }") == \
+        "body{color: red;margin: 0 auto}a>b,c{x: 1}\n"
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+def test_dashboard_bundle_is_valid_javascript(tmp_path):
+    static_dir = shutil.copytree(STATIC_DIR, tmp_path / 'static', ignore=shutil.ignore_patterns('dist'))
+    manifest = build(str(static_dir))
+    assert manifest["sources"]["app.js"]
+    subprocess.run(['node', '--check', str(static_dir / manifest["app.js"])], check=True)
+
+
+@pytest.fixture
+def assets(tmp_path):
+    static_dir = tmp_path / 'static'
+    static_dir.mkdir()
+    (static_dir / 'index.html').write_text(
+        '<html><head>\n    <link rel="stylesheet" href="style.css">\n</head><body>\n'
+        '    <script src="a.js"></script>\n    <script src="b.js"></script>\n</body></html>\n')
+    (static_dir / 'a.js').write_text("// first\nvar total = 0;\n" * 100)
+    (static_dir / 'b.js').write_text("function show(x) {\n    return /^\\d+$/.test(x)\n}\n")
+    (static_dir / 'style.css').write_text("body {\n  color: red;\n}\n")
+    manifest = build(str(static_dir))
+    return StaticAssets(str(static_dir)), manifest
+
+
+def respond(assets, path, **headers):
+    with Flask(__name__).test_request_context(headers=headers):
+        return assets.respond(assets.get(path), request)
+
+
+def test_built_index_references_hashed_bundles(assets):
+    assets, manifest = assets
+    assert assets.manifest == manifest
+    assert manifest["sources"] == {"app.js": ["a.js", "b.js"], "app.css": ["style.css"]}
+    for path in ('', 'unknown/route'):
+        response = respond(assets, path)
+        html = response.get_data(as_text=True)
+        assert response.headers['Cache-Control'] == INDEX_CACHE
+        assert f'src="/{manifest["app.js"]}"' in html and f'href="/{manifest["app.css"]}"' in html
+        assert 'a.js' not in html and 'b.js' not in html
+
+
+def test_hashed_bundles_are_immutable_and_precompressed(assets):
+    assets, manifest = assets
+    plain = respond(assets, manifest["app.js"])
+    assert plain.headers['Cache-Control'] == IMMUTABLE_CACHE
+    assert plain.mimetype in ('application/javascript', 'text/javascript')
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+
+    gzipped = respond(assets, manifest["app.js"], **{'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(gzipped.get_data()) == plain.get_data()
+    assert gzipped.headers['ETag'] != plain.headers['ETag']
+
+    preferred = respond(assets, manifest["app.js"], **{'Accept-Encoding': 'gzip, br'})
+    assert preferred.headers['Content-Encoding'] == ('br' if static_assets.brotli else 'gzip')
+
+    # Unbundled sources are still served, but only briefly cacheable
+    assert respond(assets, 'a.js').headers['Cache-Control'] == static_assets.DEFAULT_CACHE
+
+
+def test_matching_etag_returns_304(assets):
+    assets, manifest = assets
+    etag = respond(assets, manifest["app.js"], **{'Accept-Encoding': 'gzip'}).headers['ETag']
+    revalidated = respond(assets, manifest["app.js"], **{'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert revalidated.status_code == 304 and revalidated.get_data() == b''
+    assert revalidated.headers['Cache-Control'] == IMMUTABLE_CACHE
+
+    # The gzip ETag does not validate the identity body
+    assert respond(assets, manifest["app.js"], **{'If-None-Match': etag}).status_code == 200
+
+
+def test_rebuild_replaces_stale_bundles(assets, tmp_path):
+    _, manifest = assets
+    (tmp_path / 'static' / 'b.js').write_text("var changed = 1;\n")
+    rebuilt = build(str(tmp_path / 'static'))
+    assert rebuilt["app.js"] != manifest["app.js"]
+    dist = os.listdir(tmp_path / 'static' / 'dist')
+    assert os.path.basename(manifest["app.js"]) not in dist
+    assert os.path.basename(rebuilt["app.js"]) in dist
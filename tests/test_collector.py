@@ -0,0 +1,117 @@
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import collector
+from collector import Collector, LeaderLock
+
+HOLD_LOCK = """
+import sys, time
+from collector import LeaderLock
+lock = LeaderLock(sys.argv[1])
+print("leader" if lock.try_acquire() else "standby", flush=True)
+time.sleep(60)
+"""
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / 'collector.lock')
+
+
+def test_only_one_lock_is_held_at_a_time(lock_path):
+    leader, standby = LeaderLock(lock_path), LeaderLock(lock_path)
+    assert leader.try_acquire() and leader.held
+    assert leader.try_acquire()  # idempotent for the holder
+    assert not standby.try_acquire() and not standby.held
+    with open(lock_path) as f:
+        assert f.read() == f"{os.getpid()}\n"
+
+    leader.release()
+    assert not leader.held
+    assert standby.try_acquire()
+    assert not leader.try_acquire()
+    standby.release()
+
+
+def test_standby_takes_over_when_the_leader_process_dies(lock_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.Popen([sys.executable, '-c', HOLD_LOCK, lock_path], env=env,
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == "leader"
+        standby = LeaderLock(lock_path)
+        assert not standby.try_acquire()
+    finally:
+        process.send_signal(signal.SIGKILL)  # no cleanup: the OS releases the lock
+        process.wait(10)
+    assert standby.try_acquire()
+    standby.release()
+
+
+def test_collector_measures_only_while_leading(lock_path, monkeypatch):
+    collections = []
+    monkeypatch.setattr(collector, 'collect_once', lambda: collections.append(time.monotonic()))
+    leader = LeaderLock(lock_path)
+    assert leader.try_acquire()
+
+    standby = Collector(interval=0.05, lock=LeaderLock(lock_path), retry_interval=0.05)
+    thread = threading.Thread(target=standby.run, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.3)
+        assert collections == [] and not standby.lock.held
+
+        leader.release()  # the leader exits; the standby takes over and starts measuring
+        wait_until(lambda: len(collections) >= 3)
+        assert standby.lock.held
+    finally:
+        standby.stop()
+        thread.join(5)
+    assert not standby.lock.held
+    assert LeaderLock(lock_path).try_acquire()
+
+
+def test_collection_errors_do_not_end_leadership(lock_path, monkeypatch):
+    attempts = []
+
+    def failing_collect():
+        attempts.append(1)
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(collector, 'collect_once', failing_collect)
+    leader = Collector(interval=0.01, lock=LeaderLock(lock_path), retry_interval=0.01)
+    thread = threading.Thread(target=leader.run, daemon=True)
+    thread.start()
+    try:
+        wait_until(lambda: len(attempts) >= 3)
+        assert leader.lock.held
+    finally:
+        leader.stop()
+        thread.join(5)
+
+
+def test_gunicorn_workers_start_the_embedded_collector(monkeypatch):
+    started = []
+    monkeypatch.setattr(collector, 'start_embedded_collector', lambda: started.append(os.getpid()))
+    config = runpy.run_path(os.path.join(os.path.dirname(collector.__file__), 'gunicorn.conf.py'))
+
+    monkeypatch.delenv('EMBEDDED_COLLECTOR', raising=False)
+    config['post_fork'](server=None, worker=None)
+    assert started == []
+    monkeypatch.setenv('EMBEDDED_COLLECTOR', '1')
+    config['post_fork'](server=None, worker=None)
+    assert started == [os.getpid()]
@@ -0,0 +1,97 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import app1
+import metricsmeasure
+from columnar import COLUMNAR_MIMETYPE, encode_columnar
+
+URL = '/api/historical?timeframe=24h&metrics=latency'
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def test_encode_columnar_delta_encodes_the_time_axis():
+    rows = [{"timestamp": (START + timedelta(milliseconds=ms)).isoformat(), "target": "8.8.8.8",
+             "latency": latency, "data": "{}"}
+            for ms, latency in ((0, 12.5), (300000, None), (300012, 14.0))]
+    assert encode_columnar(rows) == {
+        "start": int(START.timestamp() * 1000),
+        "timestamp": [0, 300000, 12],
+        "columns": {"target": ["8.8.8.8"] * 3, "latency": [12.5, None, 14.0]},
+    }
+
+
+def test_encode_columnar_uses_the_bucket_time_of_grouped_rows():
+    rows = [{"time": START.isoformat(), "protocol": "tcp", "avg_latency": 1.0},
+            {"time": (START + timedelta(hours=1)).isoformat(), "protocol": "tcp", "avg_latency": 2.0}]
+    encoded = encode_columnar(rows)
+    assert encoded["timestamp"] == [0, 3600000]
+    assert encoded["columns"] == {"protocol": ["tcp", "tcp"], "avg_latency": [1.0, 2.0]}
+
+
+def test_encode_columnar_handles_no_rows():
+    assert encode_columnar([]) == {"start": None, "timestamp": [], "columns": {}}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metricsmeasure, 'DB_PATH', str(tmp_path / 'metrics.db'))
+    app1.response_cache._reset()
+    metricsmeasure.init_db()
+    conn = sqlite3.connect(metricsmeasure.DB_PATH)
+    now = datetime.now()
+    conn.executemany('INSERT INTO test_history (timestamp, protocol, target, latency) VALUES (?, ?, ?, ?)',
+                     [((now - timedelta(minutes=5 * (3 - i))).isoformat(), 'tcp', '8.8.8.8', float(i))
+                      for i in range(3)])
+    conn.commit()
+    conn.close()
+    yield app1.create_app().test_client()
+    app1.response_cache._reset()
+
+
+def test_format_parameter_selects_columnar(client):
+    response = client.get(URL + '&format=columnar')
+    assert response.status_code == 200 and response.mimetype == COLUMNAR_MIMETYPE
+    body = response.get_json()
+    assert body["format"] == "columnar" and body["count"] == 3
+    assert body["data"]["timestamp"] == [0, 300000, 300000]
+    assert body["data"]["columns"]["latency"] == [0.0, 1.0, 2.0]
+
+
+def test_accept_header_negotiates_the_format(client):
+    rows = client.get(URL, headers={'Accept': 'application/json'})
+    assert rows.mimetype == 'application/json'
+    assert [row["latency"] for row in rows.get_json()["data"]] == [0.0, 1.0, 2.0]
+
+    columnar = client.get(URL, headers={'Accept': f'application/json;q=0.5, {COLUMNAR_MIMETYPE}'})
+    assert columnar.mimetype == COLUMNAR_MIMETYPE
+    assert 'Accept' in columnar.headers['Vary']
+
+    # An explicit ?format= wins over the Accept header
+    explicit = client.get(URL + '&format=json', headers={'Accept': COLUMNAR_MIMETYPE})
+    assert explicit.mimetype == 'application/json'
+
+
+def test_unknown_format_is_rejected(client):
+    response = client.get(URL + '&format=csv')
+    assert response.status_code == 400
+    assert "Unknown format" in response.get_json()["message"]
+
+
+def test_msgpack_without_the_package_is_not_acceptable(client, monkeypatch):
+    monkeypatch.setattr(app1, 'msgpack', None)
+    for response in (client.get(URL + '&format=msgpack'),
+                     client.get(URL, headers={'Accept': 'application/x-msgpack'})):
+        assert response.status_code == 406
+        assert response.get_json()["status"] == "error"
+
+
+def test_msgpack_carries_the_columnar_body(client):
+    msgpack = pytest.importorskip('msgpack')
+    response = client.get(URL, headers={'Accept': 'application/msgpack'})
+    assert response.status_code == 200 and response.mimetype == 'application/msgpack'
+    body = msgpack.unpackb(response.get_data(), raw=False)
+    assert body["format"] == "columnar"
+    assert body["data"] == client.get(URL + '&format=columnar').get_json()["data"]
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from downsample import downsample_rows, lttb_indices
+
+START = datetime(2026, 1, 1)
+FIELDS = [f"metric{i}" for i in range(9)]
+
+
+def make_rows(count, fields=FIELDS, **extra):
+    rng = np.random.default_rng(7)
+    rows = []
+    for i in range(count):
+        row = {"timestamp": (START + timedelta(minutes=i)).isoformat(), **extra}
+        row.update({field: float(rng.normal(50, 2)) for field in fields})
+        rows.append(row)
+    return rows
+
+
+def test_lttb_keeps_endpoints_and_threshold():
+    x = np.arange(1000)
+    y = np.sin(x / 50)
+    kept = lttb_indices(x, y, 100)
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 999
+    assert np.all(np.diff(kept) > 0)
+    assert len(lttb_indices(x[:10], y[:10], 100)) == 10
+
+
+@pytest.mark.parametrize('max_points', [3, 10, 50, 200])
+def test_many_varying_fields_respect_the_point_cap(max_points):
+    rows = make_rows(1000)
+    reduced = downsample_rows(rows, max_points, FIELDS)
+    assert len(reduced) == max_points
+    assert reduced[0] is rows[0] and reduced[-1] is rows[-1]
+    assert [r["timestamp"] for r in reduced] == sorted(r["timestamp"] for r in reduced)
+
+
+def test_peaks_in_any_field_are_preserved():
+    rows = make_rows(1000)
+    rows[137]["metric2"] = 500.0  # latency spike
+    rows[512]["metric7"] = -400.0  # throughput dip
+    rows[880]["metric4"] = 100.0
+    reduced = downsample_rows(rows, 10, FIELDS)
+    assert len(reduced) == 10
+    for position in (137, 512, 880):
+        assert rows[position] in reduced
+
+
+def test_constant_fields_are_ignored_and_series_capped_separately():
+    rows = make_rows(300, fields=["latency"], protocol="tcp", loss=0.0)
+    rows += make_rows(300, fields=["latency"], protocol="udp", loss=0.0)
+    rows[450]["latency"] = 900.0
+    reduced = downsample_rows(rows, 20, ["latency", "loss"], series_fields=["protocol"])
+    assert [r["protocol"] for r in reduced].count("tcp") == 20
+    assert [r["protocol"] for r in reduced].count("udp") == 20
+    assert rows[450] in reduced
+
+
+def test_null_aggregates_and_small_series_are_kept():
+    rows = make_rows(50)
+    rows[10]["metric0"] = None
+    assert len(downsample_rows(rows, 5, FIELDS)) == 5
+    assert downsample_rows(rows, 50, FIELDS) == rows
+    assert downsample_rows(rows, None, FIELDS) == rows
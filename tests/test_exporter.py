@@ -0,0 +1,130 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from exporter import MetricsExporter, StatsdBackend, create_exporter
+
+
+class RecordingBackend:
+    """Records batches; send blocks while the gate is closed"""
+
+    def __init__(self, fail=()):
+        self.batches = []
+        self.fail = list(fail)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.in_send = threading.Event()
+        self.closed = False
+
+    def send(self, points):
+        self.in_send.set()
+        self.gate.wait(5)
+        if self.fail:
+            raise self.fail.pop(0)
+        self.batches.append(list(points))
+
+    def close(self):
+        self.closed = True
+
+    def values(self):
+        return [value for batch in self.batches for _, value, _, _ in batch]
+
+
+def timings(exporter, start, count):
+    exporter.export_timings("8.8.8.8", "tcp", {f"p{i:04d}": float(i) for i in range(start, start + count)})
+
+
+def test_points_are_sent_in_batches_of_batch_size():
+    backend = RecordingBackend()
+    exporter = MetricsExporter(backend, batch_size=500, flush_interval=10)
+    timings(exporter, 0, 1050)
+    exporter.stop()
+    assert [len(batch) for batch in backend.batches] == [500, 500, 50]
+    assert backend.values() == [float(i) for i in range(1050)]
+    assert exporter.exported == 1050 and exporter.dropped == 0
+    assert backend.closed
+
+
+def test_full_queue_drops_the_oldest_points():
+    backend = RecordingBackend()
+    backend.gate.clear()
+    exporter = MetricsExporter(backend, queue_size=5, batch_size=2, flush_interval=10)
+    timings(exporter, 0, 2)
+    assert backend.in_send.wait(5)  # the worker is stuck sending the first batch
+
+    for i in range(2, 10):
+        timings(exporter, i, 1)
+    assert exporter.dropped == 3
+    backend.gate.set()
+    exporter.stop()
+    assert backend.values() == [0.0, 1.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+
+
+def test_in_flight_batch_is_retried_after_connection_errors():
+    backend = RecordingBackend(fail=[ConnectionRefusedError("carbon is down")])
+    exporter = MetricsExporter(backend, batch_size=3, flush_interval=0.01)
+    timings(exporter, 0, 3)
+    deadline = time.monotonic() + 5
+    while exporter.exported < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    exporter.stop()
+    assert backend.values() == [0.0, 1.0, 2.0]
+    assert exporter.exported == 3 and exporter.dropped == 0
+
+
+def test_unexpected_errors_drop_the_batch():
+    backend = RecordingBackend(fail=[ValueError("cannot encode")])
+    exporter = MetricsExporter(backend, batch_size=2, flush_interval=10)
+    timings(exporter, 0, 4)
+    exporter.stop()
+    assert backend.values() == [2.0, 3.0]
+    assert exporter.dropped == 2
+
+
+def test_sample_fields_become_sanitized_gauges():
+    backend = RecordingBackend()
+    exporter = MetricsExporter(backend, prefix="net", flush_interval=10)
+    exporter.export_sample({"timestamp": "2026-01-01T00:00:00", "target": "8.8.8.8", "agent": "edge 01",
+                            "protocol": "udp", "latency": 12.5, "packet_loss": 0, "tls": True, "note": "x"})
+    exporter.export_sample({"target": "8.8.8.8", "error": "timeout", "latency": 1.0})
+    exporter.stop()
+    (batch,) = backend.batches
+    assert sorted((path, value, kind) for path, value, _, kind in batch) == [
+        ("net.edge_01_8_8_8_8.udp.latency", 12.5, "gauge"),
+        ("net.edge_01_8_8_8_8.udp.packet_loss", 0, "gauge"),
+    ]
+
+
+@pytest.fixture
+def udp_listener():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.settimeout(1)
+    yield listener
+    listener.close()
+
+
+def test_statsd_packs_points_into_datagrams(udp_listener):
+    backend = StatsdBackend(*udp_listener.getsockname())
+    points = [(f"net.host.probe_ms.probe{i:03d}", i + 0.5, 0, 'timing') for i in range(200)]
+    points.append(("net.host.tcp.latency", 12.5, 0, 'gauge'))
+    backend.send(points)
+
+    datagrams = []
+    lines = []
+    while len(lines) < len(points):
+        datagram = udp_listener.recv(65536)
+        datagrams.append(datagram)
+        lines.extend(datagram.decode().split('\n'))
+    assert len(datagrams) > 1
+    assert all(len(d) <= StatsdBackend.MAX_DATAGRAM for d in datagrams)
+    assert lines[0] == "net.host.probe_ms.probe000:0.5|ms"
+    assert lines[-1] == "net.host.tcp.latency:12.5|g"
+
+
+def test_create_exporter():
+    assert create_exporter('') is None
+    assert create_exporter('influx') is None
+    assert isinstance(create_exporter('statsd').backend, StatsdBackend)
@@ -0,0 +1,176 @@
+import pickle
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from graphite_relay import CarbonSender, DiskSpool, GraphiteRelay, RelayServer
+
+
+class FakeCarbon:
+    """Carbon listener on localhost that decodes plaintext or pickle streams"""
+
+    def __init__(self, use_pickle, port=0):
+        self.use_pickle = use_pickle
+        self.received = []
+        self._lock = threading.Lock()
+        self._conns = []
+        self._listener = socket.socket()
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(('127.0.0.1', port))
+        self._listener.listen()
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            self._conns.append(conn)
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn):
+        buffer = b''
+        while True:
+            try:
+                data = conn.recv(65536)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            with self._lock:
+                buffer = self._decode(buffer)
+
+    def _decode(self, buffer):
+        if not self.use_pickle:
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                path, value, timestamp = line.decode().split()
+                self.received.append((path, float(value), int(timestamp)))
+            return buffer
+        while len(buffer) >= 4:
+            (length,) = struct.unpack('!L', buffer[:4])
+            if len(buffer) < 4 + length:
+                break
+            for path, (timestamp, value) in pickle.loads(buffer[4:4 + length]):
+                self.received.append((path, float(value), int(timestamp)))
+            buffer = buffer[4 + length:]
+        return buffer
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.received) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return list(self.received)
+
+    def stop(self):
+        # shutdown() first: close() alone does not wake threads blocked in accept/recv
+        for sock in [self._listener] + self._conns:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+def _lines(start, count):
+    return [f"nagios.host.metric{i} {i}.5 {1700000000 + i}" for i in range(start, start + count)]
+
+
+def _expected(lines):
+    return [(p, float(v), int(t)) for p, v, t in (line.split() for line in lines)]
+
+
+@pytest.mark.parametrize('use_pickle', [False, True], ids=['plaintext', 'pickle'])
+def test_outage_is_spooled_and_replayed_in_order(tmp_path, use_pickle):
+    carbon = FakeCarbon(use_pickle)
+    spool = DiskSpool(str(tmp_path / 'spool'))
+    relay = GraphiteRelay(CarbonSender('127.0.0.1', carbon.port, use_pickle=use_pickle, timeout=1),
+                          spool, batch_size=10, retry_interval=0)
+
+    relay.submit(_lines(0, 5))
+    assert relay.flush()
+    assert carbon.wait_for(5) == _expected(_lines(0, 5))
+
+    # Carbon goes away; the relay keeps accepting lines and spools them
+    carbon.stop()
+    relay.submit(_lines(5, 25))
+    assert not relay.flush()
+    assert sum(len(spool.read(name)) for name in spool.segments()) == 25
+    relay.submit(_lines(30, 3))
+    assert not relay.flush()
+
+    # Carbon is back on the same port: spooled lines first, then new ones, nothing twice
+    carbon = FakeCarbon(use_pickle, port=carbon.port)
+    relay.submit(_lines(33, 2))
+    assert relay.flush()
+    assert carbon.wait_for(30) == _expected(_lines(5, 30))
+    assert spool.segments() == []
+    assert relay.sent == 35
+    carbon.stop()
+
+
+class FlakySender:
+    """Accepts `accept` chunks, then fails like a dropped carbon connection"""
+
+    def __init__(self, accept):
+        self.accept = accept
+        self.chunks = []
+
+    def send(self, lines):
+        if len(self.chunks) >= self.accept:
+            raise ConnectionResetError("connection reset by peer")
+        self.chunks.append(list(lines))
+
+    def close(self):
+        pass
+
+
+def test_partially_sent_batch_spools_only_the_rest(tmp_path):
+    spool = DiskSpool(str(tmp_path / 'spool'))
+    sender = FlakySender(accept=2)
+    relay = GraphiteRelay(sender, spool, batch_size=10, retry_interval=0)
+
+    relay.submit(_lines(0, 35))
+    assert not relay.flush()
+    assert [spool.read(name) for name in spool.segments()] == [_lines(20, 15)]
+
+    # Replay stops after one more chunk and keeps only the undelivered remainder of the segment
+    sender.accept = 3
+    assert not relay.flush()
+    assert [spool.read(name) for name in spool.segments()] == [_lines(30, 5)]
+
+    sender.accept = 10
+    assert relay.flush()
+    assert [line for chunk in sender.chunks for line in chunk] == _lines(0, 35)
+    assert spool.segments() == []
+
+
+def test_bulk_connection_is_submitted_in_batches(tmp_path):
+    submitted = []
+
+    class Recorder:
+        batch_size = 100
+
+        def submit(self, lines):
+            submitted.append(len(lines))
+
+    path = str(tmp_path / 'relay.sock')
+    server = RelayServer(path, Recorder())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.sendall(('\n'.join(_lines(0, 1050)) + '\nnot a metric\n').encode())
+        deadline = time.monotonic() + 5
+        while sum(submitted) < 1050 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert submitted == [100] * 10 + [50]
@@ -0,0 +1,104 @@
+import math
+import random
+
+import pytest
+
+from histogram import SUB_BUCKETS, LatencyHistogram, _bucket_bounds, _bucket_index
+
+# Half a bucket width over its lowest value: 1 / 128
+MAX_RELATIVE_ERROR = 1 / SUB_BUCKETS
+
+
+def lognormal(count, seed=11):
+    rng = random.Random(seed)
+    return [rng.lognormvariate(3, 0.8) for _ in range(count)]
+
+
+def exact_percentile(samples_ms, p):
+    values = sorted(max(0, int(round(ms * 1000))) for ms in samples_ms)
+    rank = max(1, math.ceil(len(values) * p / 100))
+    return values[rank - 1] / 1000
+
+
+def test_buckets_cover_values_within_the_error_bound():
+    for value in list(range(300)) + [1000, 4095, 4096, 65535, 10 ** 6, 2 ** 40 + 12345]:
+        low, width = _bucket_bounds(_bucket_index(value))
+        assert low <= value < low + width
+        if value >= SUB_BUCKETS:
+            assert (width - 1) / 2 / low <= MAX_RELATIVE_ERROR
+
+
+def test_bucket_indexes_are_monotonic():
+    indexes = [_bucket_index(v) for v in range(200000)]
+    assert all(b - a in (0, 1) for a, b in zip(indexes, indexes[1:]))
+
+
+@pytest.mark.parametrize('p', [1, 25, 50, 90, 99, 99.9, 100])
+def test_percentiles_are_within_the_error_bound(p):
+    samples = lognormal(50000)
+    histogram = LatencyHistogram()
+    for ms in samples:
+        histogram.record(ms)
+    exact = exact_percentile(samples, p)
+    assert histogram.percentile(p) == pytest.approx(exact, rel=MAX_RELATIVE_ERROR)
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for ms in (0.001, 0.05, 0.1, 0.127, -1):
+        histogram.record(ms)
+    assert [histogram.percentile(p) for p in (20, 40, 60, 80, 100)] == [0.0, 0.001, 0.05, 0.1, 0.127]
+    assert histogram.min == 0 and histogram.max == 127
+
+
+def test_merge_equals_recording_everything():
+    samples = lognormal(20000)
+    combined = LatencyHistogram()
+    for ms in samples:
+        combined.record(ms)
+    parts = [LatencyHistogram() for _ in range(4)]
+    for i, ms in enumerate(samples):
+        parts[i % 4].record(ms)
+
+    merged = LatencyHistogram()
+    for part in parts + [LatencyHistogram()]:
+        merged.merge(part)
+    assert merged.counts == combined.counts
+    assert (merged.count, merged.min, merged.max) == (combined.count, combined.min, combined.max)
+    assert merged.summary() == combined.summary()
+
+
+def test_weighted_records_and_empty_summary():
+    histogram = LatencyHistogram().record(10, count=99).record(500)
+    assert histogram.percentile(99) == pytest.approx(10, rel=MAX_RELATIVE_ERROR)
+    assert histogram.percentile(99.5) == 500
+    assert histogram.mean() == pytest.approx((99 * 10 + 500) / 100, rel=MAX_RELATIVE_ERROR)
+    assert LatencyHistogram().summary() == {
+        "count": 0, "min": None, "max": None, "mean": None,
+        "percentiles": {"p50": None, "p90": None, "p99": None, "p99.9": None}}
+
+
+def test_encoding_round_trips():
+    histogram = LatencyHistogram().record(0.2, count=300).record(3_600_000)
+    for ms in lognormal(5000):
+        histogram.record(ms)
+    decoded = LatencyHistogram.from_bytes(histogram.to_bytes())
+    assert decoded.counts == histogram.counts
+    assert (decoded.count, decoded.min, decoded.max) == (histogram.count, histogram.min, histogram.max)
+    assert decoded.summary() == histogram.summary()
+
+
+def test_encoding_is_compact_and_handles_empty_histograms():
+    interval = LatencyHistogram()
+    for ms in (21.3, 22.0, 22.4, 25.1, 30.8):
+        interval.record(ms)
+    assert len(interval.to_bytes()) < 32
+    empty = LatencyHistogram.from_bytes(LatencyHistogram().to_bytes())
+    assert (empty.count, empty.min, empty.max, empty.counts) == (0, None, None, {})
+
+
+def test_unknown_encoding_is_rejected():
+    data = bytearray(LatencyHistogram().record(5).to_bytes())
+    data[0] += 1
+    with pytest.raises(ValueError):
+        LatencyHistogram.from_bytes(bytes(data))
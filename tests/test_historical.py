@@ -0,0 +1,86 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import app1
+import metricsmeasure
+from histogram import LatencyHistogram
+from metricsmeasure import query_historical
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metricsmeasure, 'DB_PATH', str(tmp_path / 'metrics.db'))
+    metricsmeasure.init_db()
+    return metricsmeasure.DB_PATH
+
+
+def seed(path, count, days=30, agent=None):
+    """Spread count rows evenly over the last days, newest last"""
+    now = datetime.now()
+    step = timedelta(days=days) / count
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO test_history (timestamp, protocol, target, agent, latency) VALUES (?, ?, ?, ?, ?)',
+        [((now - (count - i) * step).isoformat(), 'tcp', '8.8.8.8', agent, float(i)) for i in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def test_capped_window_keeps_the_newest_rows(db):
+    seed(db, 15000)
+    rows = query_historical(timeframe='30d', metrics=['latency'], limit=10000)
+    assert len(rows) == 10000
+    assert [r["latency"] for r in rows] == [float(i) for i in range(5000, 15000)]
+    assert datetime.now() - datetime.fromisoformat(rows[-1]["timestamp"]) < timedelta(hours=1)
+
+
+def test_endpoint_flags_truncation_before_downsampling(db, monkeypatch):
+    monkeypatch.setattr(app1, 'MAX_HISTORY_ROWS', 1000)
+    seed(db, 1500)
+    app1.response_cache._reset()
+    client = app1.create_app().test_client()
+
+    body = client.get('/api/historical?timeframe=30d&metrics=latency&max_points=100').get_json()
+    assert body["truncated"] is True
+    assert body["downsampled_from"] == 1000 and body["count"] == 100
+    assert body["data"][-1]["latency"] == 1499.0
+
+    body = client.get('/api/historical?timeframe=30d&metrics=latency&group_by=protocol').get_json()
+    assert body["truncated"] is False
+
+
+def test_rows_without_agent_group_with_local(db):
+    seed(db, 10, days=7, agent=None)
+    seed(db, 5, days=7, agent='local')
+    seed(db, 3, days=7, agent='edge-01')
+    rows = query_historical(timeframe='30d', group_by=['agent'], metrics=['latency'], aggregates=['count'])
+    assert [(r["agent"], r["count"]) for r in rows] == [('edge-01', 3), ('local', 15)]
+
+
+def test_grouped_rows_stay_in_ascending_order(db):
+    seed(db, 48, days=2)
+    rows = query_historical(timeframe='3d', group_by=['time'], bucket='6h', metrics=['latency'], limit=4)
+    times = [r["time"] for r in rows]
+    assert len(times) == 4 and times == sorted(times)
+    assert datetime.now() - datetime.fromisoformat(times[-1]) < timedelta(hours=6)
+
+
+def test_latency_distribution_has_no_agent_dimension(db):
+    for target, ms in (('8.8.8.8', 10.0), ('1.1.1.1', 30.0)):
+        metricsmeasure.save_rtt_histograms({"timestamp": datetime.now().isoformat(), "target": target,
+                                            "protocol": "icmp"}, {"icmp": LatencyHistogram().record(ms)})
+    app1.response_cache._reset()
+    client = app1.create_app().test_client()
+
+    body = client.get('/api/latency_distribution?group_by=target&percentiles=50').get_json()
+    assert [(r["probe"], r["target"], r["count"]) for r in body["data"]] == [
+        ('icmp', '1.1.1.1', 1), ('icmp', '8.8.8.8', 1)]
+
+    response = client.get('/api/latency_distribution?group_by=agent')
+    assert response.status_code == 400
+    assert "time, probe, target, protocol" in response.get_json()["message"]
+    spec = client.get('/api/swagger.json').get_json()["paths"]["/api/latency_distribution"]["get"]
+    assert "agent" not in [p["name"] for p in spec["parameters"]]
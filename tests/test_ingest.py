@@ -0,0 +1,159 @@
+import io
+import sqlite3
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+import app1
+import metricsmeasure
+from metricsmeasure import AgentSpool, ship_pending
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metricsmeasure, 'DB_PATH', str(tmp_path / 'central.db'))
+    monkeypatch.setattr(metricsmeasure, 'LATEST_SAMPLE_PATH', str(tmp_path / 'latest.json'))
+    client = app1.create_app().test_client()
+    metricsmeasure.init_db()
+    return client
+
+
+@pytest.fixture
+def network(client, monkeypatch):
+    """Route the agents' urlopen calls to the Flask test client"""
+    state = {"lose_ack": 0}
+
+    class Response(io.BytesIO):
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    def urlopen(req, timeout=None):
+        response = client.post(req.full_url.split('http://central', 1)[1], data=req.data,
+                               headers=dict(req.header_items()))
+        if response.status_code >= 400:
+            raise urllib.error.HTTPError(req.full_url, response.status_code, response.get_json()["message"],
+                                         response.headers, None)
+        if state["lose_ack"]:
+            state["lose_ack"] -= 1
+            raise urllib.error.URLError("connection reset before the response arrived")
+        return Response(response.get_data())
+
+    monkeypatch.setattr(urllib.request, 'urlopen', urlopen)
+    return state
+
+
+def _spool(tmp_path, name, count):
+    spool = AgentSpool(str(tmp_path / f'{name}.db'))
+    start = datetime.now() - timedelta(hours=3)
+    for i in range(count):
+        spool.append({"sample_id": uuid.uuid4().hex, "timestamp": (start + timedelta(minutes=i)).isoformat(),
+                      "agent": name, "target": "8.8.8.8", "latency": 10.0 + i})
+    return spool
+
+
+def _rows_by_agent():
+    conn = sqlite3.connect(metricsmeasure.DB_PATH)
+    return dict(conn.execute('SELECT agent, COUNT(*) FROM test_history GROUP BY agent').fetchall())
+
+
+def test_two_agents_deduplicate_on_sample_id(tmp_path, network):
+    first, second = _spool(tmp_path, 'edge-01', 3), _spool(tmp_path, 'edge-02', 2)
+
+    # The server stores the batch but the acknowledgement is lost; the retry is deduplicated
+    network["lose_ack"] = 1
+    assert ship_pending(first, 'http://central', 'edge-01') == 'error'
+    assert first.pending() == 3
+    assert ship_pending(first, 'http://central', 'edge-01') == 'partial'
+    assert ship_pending(second, 'http://central', 'edge-02', batch_size=2) == 'full'
+    assert ship_pending(second, 'http://central', 'edge-02') == 'empty'
+
+    assert first.pending() == second.pending() == 0
+    assert _rows_by_agent() == {'edge-01': 3, 'edge-02': 2}
+    # Replayed agent samples never become the local latest reading
+    assert metricsmeasure.read_latest_sample() is None
+
+
+def test_batch_is_retried_after_server_error(tmp_path, network, monkeypatch):
+    spool = _spool(tmp_path, 'edge-01', 3)
+    save = app1.save_test_results
+    calls = []
+
+    def flaky_save(samples):
+        calls.append(len(samples))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return save(samples)
+
+    monkeypatch.setattr(app1, 'save_test_results', flaky_save)
+    assert ship_pending(spool, 'http://central', 'edge-01') == 500
+    assert spool.pending() == 3
+    assert ship_pending(spool, 'http://central', 'edge-01') == 'partial'
+    assert spool.pending() == 0
+    assert _rows_by_agent() == {'edge-01': 3}
+
+
+def test_spool_is_kept_when_token_is_rejected(tmp_path, network, monkeypatch):
+    monkeypatch.setattr(app1, 'INGEST_TOKEN', 'rotated')
+    spool = _spool(tmp_path, 'edge-01', 3)
+
+    assert ship_pending(spool, 'http://central', 'edge-01', token='stale') == 401
+    assert spool.pending() == 3
+    assert _rows_by_agent() == {}
+
+    assert ship_pending(spool, 'http://central', 'edge-01', token='rotated') == 'partial'
+    assert spool.pending() == 0
+
+
+class StopAgent(Exception):
+    pass
+
+
+def test_oversized_batch_is_kept_and_batch_size_halved(tmp_path, network, monkeypatch):
+    monkeypatch.setattr(app1, 'MAX_INGEST_SAMPLES', 2)
+    monkeypatch.setattr(metricsmeasure, 'collect_metrics', lambda: {"error": "no probes in tests"})
+    monkeypatch.setattr(metricsmeasure.time, 'sleep', lambda seconds: None)
+    spool = _spool(tmp_path, 'edge-01', 3)
+    ship = metricsmeasure.ship_pending
+    calls = []
+
+    def recording_ship(spool, *args, batch_size, **kwargs):
+        outcome = ship(spool, *args, batch_size=batch_size, **kwargs)
+        calls.append((batch_size, outcome, spool.pending()))
+        if outcome == 'partial' or len(calls) == 5:
+            raise StopAgent()
+        return outcome
+
+    monkeypatch.setattr(metricsmeasure, 'ship_pending', recording_ship)
+    with pytest.raises(StopAgent):
+        metricsmeasure.run_agent('http://central', agent_name='edge-01', batch_size=4,
+                                 spool_path=str(tmp_path / 'edge-01.db'))
+    assert calls == [(4, 413, 3), (2, 'full', 1), (2, 'partial', 0)]
+    assert _rows_by_agent() == {'edge-01': 3}
+
+
+def test_malformed_batch_is_dropped(tmp_path, client, monkeypatch):
+    response = client.post('/api/ingest', data=b'not gzip', headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+
+    def rejected(server_url, lines, agent_name, token=None):
+        raise urllib.error.HTTPError(server_url, 400, "Malformed batch", {}, None)
+
+    monkeypatch.setattr(metricsmeasure, 'ship_batch', rejected)
+    spool = _spool(tmp_path, 'edge-01', 3)
+    assert ship_pending(spool, 'http://central', 'edge-01') == 'dropped'
+    assert spool.pending() == 0
+
+
+def test_ingest_size_limits_return_413(client, monkeypatch):
+    monkeypatch.setattr(app1, 'MAX_INGEST_BYTES', 64)
+    body = '\n'.join(f'{{"sample_id": "{i}", "timestamp": "2026-01-01T00:00:00"}}' for i in range(3))
+    response = client.post('/api/ingest', data=body)
+    assert response.status_code == 413
+    assert "64 bytes" in response.get_json()["message"]
@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import jobs
+from jobs import JobManager, JobQueueFull
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    release = threading.Event()
+    monkeypatch.setitem(jobs.JOB_TYPES, "wait", (lambda params: release.wait(5) and {"done": True}, ()))
+    monkeypatch.setitem(jobs.JOB_TYPES, "echo", (lambda params: params, ("value",)))
+    yield str(tmp_path / "jobs.db")
+    release.set()
+
+
+def _status(db_path, job_id):
+    return sqlite3.connect(db_path).execute("SELECT status, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _wait_running(manager, job):
+    deadline = time.monotonic() + 5
+    while manager.get(job["id"])["status"] != "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_identical_jobs_merge_while_queued(db_path):
+    manager = JobManager(db_path, workers=1)
+    running, _ = manager.submit("wait")
+    _wait_running(manager, running)
+    queued, merged = manager.submit("wait")
+    again, merged_again = manager.submit("wait")
+    assert not merged and merged_again
+    assert again["id"] == queued["id"] != running["id"]
+
+
+def test_job_without_live_owner_is_not_merged_into(db_path):
+    orphan, _ = JobManager(db_path, workers=0).submit("echo", {"value": "x"})
+    job, merged = JobManager(db_path, workers=1).submit("echo", {"value": "x"})
+    assert not merged and job["id"] != orphan["id"]
+    assert _status(db_path, orphan["id"]) == ("failed", jobs.ORPHANED_JOB_ERROR)
+
+
+def test_orphaned_jobs_are_failed_on_startup(db_path, monkeypatch):
+    manager = JobManager(db_path, workers=1)
+    _wait_running(manager, manager.submit("wait")[0])
+    queued, _ = manager.submit("wait")
+    # The owner stops beating, as if its process had been killed
+    sqlite3.connect(db_path, isolation_level=None).execute("DELETE FROM job_owners")
+
+    JobManager(db_path, workers=1).queued_count()
+    assert _status(db_path, queued["id"])[0] == "failed"
+
+
+def test_queue_limit_counts_jobs_of_all_workers(db_path):
+    first = JobManager(db_path, workers=1, max_queued=2)
+    second = JobManager(db_path, workers=1, max_queued=2)
+    for manager in (first, second):  # keep both workers busy
+        _wait_running(manager, manager.submit("wait")[0])
+    first.submit("echo", {"value": "http"})
+    second.submit("echo", {"value": "https"})
+    assert first.queued_count() == second.queued_count() == 2
+    with pytest.raises(JobQueueFull):
+        second.submit("echo", {"value": "icmp"})
+
+
+# Runs in a fresh interpreter: forking the multi-threaded test process could
+# copy a lock held by another thread into the child
+FORK_SCENARIO = """
+import os, sys, threading, time
+import jobs
+release = threading.Event()
+jobs.JOB_TYPES["wait"] = (lambda params: release.wait(5) and {"done": True}, ())
+jobs.JOB_TYPES["echo"] = (lambda params: params, ("value",))
+jobs.JOB_OWNER_TIMEOUT = 1
+jobs.JOB_HEARTBEAT_INTERVAL = 0.1
+
+manager = jobs.JobManager("jobs.db", workers=1)  # created before forking, like gunicorn --preload
+read_end, write_end = os.pipe()
+pid = os.fork()
+if pid == 0:
+    try:
+        running, _ = manager.submit("wait")
+        while manager.get(running["id"])["status"] != "running":
+            time.sleep(0.01)
+        os.write(write_end, manager.submit("wait")[0]["id"].encode())
+    finally:
+        os._exit(0)  # dies without cleaning up, like a killed worker
+os.close(write_end)
+manager.submit("echo", {"value": "x"})  # this process keeps beating from now on
+orphan_id = os.read(read_end, 64).decode()
+os.waitpid(pid, 0)
+print(orphan_id, manager.get(orphan_id)["status"])
+
+time.sleep(1.5)
+job, merged = manager.submit("wait")
+print(job["id"], merged, manager.get(orphan_id)["status"], manager.get(orphan_id)["error"])
+release.set()
+"""
+
+
+def test_forked_workers_own_their_jobs(tmp_path):
+    # Only the dead child's owner stops beating, so its queued job is reaped
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run([sys.executable, '-c', FORK_SCENARIO], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    first, second = result.stdout.splitlines()
+    orphan_id, before = first.split()
+    job_id, merged, after, error = second.split(' ', 3)
+    assert before == "queued"
+    assert merged == "False" and job_id != orphan_id
+    assert (after, error) == ("failed", jobs.ORPHANED_JOB_ERROR)
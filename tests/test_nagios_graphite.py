@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+import nagios_graphite
+from nagios_graphite import (
+    NagiosGraphiteReporter, parse_perfdata_record, process_bulk, read_offset
+)
+
+
+@pytest.mark.parametrize('perfdata, expected', [
+    ("time=0.012s;1.0;2.0;0.0 size=1024B;;;0", {"time": 0.012, "size": 1024.0}),
+    ("'Round Trip Average'=12.5ms;100;200 'Packet Loss'=0%;20;60", {"Round Trip Average": 12.5, "Packet Loss": 0.0}),
+    ("temp=-3.5C offset=.25 rate=1.5e3/s", {"temp": -3.5, "offset": 0.25, "rate": 1500.0}),
+    ("'/var/log'=4096MB;;;0;8192 users=3", {"/var/log": 4096.0, "users": 3.0}),
+    ("status=U load=", {}),
+    ("", {}),
+])
+def test_perfdata_values(perfdata, expected):
+    assert NagiosGraphiteReporter().parse_nagios_perfdata(perfdata) == expected
+
+
+def test_metric_paths_are_sanitized():
+    reporter = NagiosGraphiteReporter()
+    assert list(reporter.service_metrics('web-01.example', 'HTTP Check', "'Response Time'=0.2s")) == [
+        ('nagios.services.web-01_example.HTTP_Check.Response_Time', 0.2)]
+    assert list(reporter.host_metrics('db 1', 'rta=1.2ms;3000;5000;0 pl=0%')) == [
+        ('nagios.hosts.db_1.rta', 1.2), ('nagios.hosts.db_1.pl', 0.0)]
+
+
+@pytest.mark.parametrize('line, expected', [
+    ("DATATYPE::SERVICEPERFDATA\tTIMET::1700000000\tHOSTNAME::web-01\tSERVICEDESC::HTTP\t"
+     "SERVICEPERFDATA::time=0.1s\tSERVICECHECKCOMMAND::check_http\n",
+     ('service', '1700000000', 'web-01', 'HTTP', 'time=0.1s')),
+    ("DATATYPE::HOSTPERFDATA\tTIMET::1700000001\tHOSTNAME::db-01\tHOSTPERFDATA::rta=1.2ms;3000;5000;0\n",
+     ('host', '1700000001', 'db-01', None, 'rta=1.2ms;3000;5000;0')),
+    ("[SERVICEPERFDATA]\t1700000002\tweb-01\tDisk /\t0.05\t0.1\tDISK OK\t'/'=512MB;;;0;1024\n",
+     ('service', '1700000002', 'web-01', 'Disk /', "'/'=512MB;;;0;1024")),
+    ("[HOSTPERFDATA]\t1700000003\tdb-01\t0.02\tPING OK\trta=0.5ms pl=0%\r\n",
+     ('host', '1700000003', 'db-01', None, 'rta=0.5ms pl=0%')),
+    ("[SERVICEPERFDATA]\ttoo\tshort\n", None),
+    ("some unrelated log line\n", None),
+])
+def test_perfdata_templates(line, expected):
+    assert parse_perfdata_record(line) == expected
+
+
+class FakeSocket:
+    """Accepts `accept` writes, then fails like a lost relay connection"""
+
+    def __init__(self, accept=None):
+        self.accept = accept
+        self.lines = []
+
+    def sendall(self, data):
+        if self.accept is not None and self.accept <= 0:
+            raise BrokenPipeError("relay went away")
+        if self.accept is not None:
+            self.accept -= 1
+        self.lines.extend(data.decode().splitlines())
+
+    def close(self):
+        pass
+
+
+def _write_perfdata(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(f"[SERVICEPERFDATA]\t{1700000000 + i}\thost{i}\tsvc\t0.1\t0.0\tOK\tvalue={i}\n")
+
+
+def test_failed_bulk_run_resumes_without_resending(tmp_path):
+    path = str(tmp_path / 'service-perfdata.1')
+    _write_perfdata(path, 10)
+
+    reporter = NagiosGraphiteReporter()
+    reporter.socket = FakeSocket(accept=2)
+    assert reporter.process_perfdata_file(path, batch_size=3) is None
+    first_run = reporter.socket.lines
+    assert len(first_run) == 6
+    # The failed batch is dropped, so closing the connection does not send it again
+    assert reporter.buffer == []
+    assert read_offset(path) > 0
+
+    reporter.socket = FakeSocket()
+    assert process_bulk(reporter, [path])
+    values = [int(float(line.split()[1])) for line in first_run + reporter.socket.lines]
+    assert values == list(range(10))
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + nagios_graphite.OFFSET_SUFFIX)
+
+
+def test_offset_of_a_replaced_file_is_ignored(tmp_path):
+    path = str(tmp_path / 'service-perfdata.1')
+    _write_perfdata(path, 10)
+    nagios_graphite.write_offset(path, os.path.getsize(path))
+    _write_perfdata(path, 2)  # rotated again, shorter than the saved offset
+    assert read_offset(path) == 0
@@ -0,0 +1,86 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import app1
+import metricsmeasure
+from jobs import JobManager
+
+URL = '/api/historical?timeframe=24h&metrics=latency'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metricsmeasure, 'DB_PATH', str(tmp_path / 'metrics.db'))
+    app1.response_cache._reset()  # forget the connection and entries of earlier tests
+    client = app1.create_app().test_client()
+    metricsmeasure.init_db()
+    add_sample(1.0)
+    yield client
+    app1.response_cache._reset()
+
+
+def add_sample(latency):
+    conn = sqlite3.connect(metricsmeasure.DB_PATH)
+    conn.execute('INSERT INTO test_history (timestamp, protocol, target, latency) VALUES (?, ?, ?, ?)',
+                 (datetime.now().isoformat(), 'tcp', '8.8.8.8', latency))
+    conn.commit()
+    conn.close()
+
+
+def test_responses_carry_etags_and_revalidate_with_304(client):
+    first = client.get(URL)
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+    assert 'Accept' in first.headers['Vary']
+
+    hits = app1.response_cache.hits
+    again = client.get(URL)
+    assert again.headers['ETag'] == etag and again.get_data() == first.get_data()
+    assert app1.response_cache.hits == hits + 1
+
+    revalidated = client.get(URL, headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304 and revalidated.get_data() == b''
+
+
+def test_accept_header_selects_a_separate_entry(client):
+    rows = client.get(URL)
+    columnar = client.get(URL, headers={'Accept': app1.COLUMNAR_MIMETYPE})
+    assert columnar.get_json()["format"] == "columnar"
+    assert columnar.headers['ETag'] != rows.headers['ETag']
+
+
+def test_new_samples_invalidate_the_cache(client):
+    etag = client.get(URL).headers['ETag']
+    add_sample(2.0)
+    response = client.get(URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [row["latency"] for row in response.get_json()["data"]] == [1.0, 2.0]
+    assert response.headers['ETag'] != etag
+
+
+def test_job_activity_does_not_invalidate_the_cache(client):
+    etag = client.get(URL).headers['ETag']
+    manager = JobManager(metricsmeasure.DB_PATH, workers=0)
+    manager._beat()
+    manager.queued_count()
+    misses = app1.response_cache.misses
+    assert client.get(URL, headers={'If-None-Match': etag}).status_code == 304
+    assert app1.response_cache.misses == misses
+
+
+def test_new_anomalies_invalidate_the_anomaly_list(client):
+    assert client.get('/api/anomalies').get_json()["count"] == 0
+    metricsmeasure.save_anomalies([{"timestamp": datetime.now().isoformat(), "target": "8.8.8.8",
+                                    "metric": "latency", "kind": "latency_spike", "value": 90.0,
+                                    "expected": 20.0, "score": 70.0}])
+    assert client.get('/api/anomalies').get_json()["count"] == 1
+
+
+def test_errors_are_not_cached(client):
+    assert client.get('/api/historical?timeframe=bogus').status_code == 400
+    assert app1.response_cache.generation() is not None
+    assert len(app1.response_cache._entries) == 0
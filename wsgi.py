@@ -1,5 +1,19 @@
 # Save this as wsgi.py
-from app1 import app
+import os
 
+from app1 import create_app
+from collector import start_embedded_collector
+
+# Schema, pipeline and static assets are set up here, before the server accepts
+# traffic. With `gunicorn --preload` this runs once in the master process.
+app = create_app()
+
+# Collection normally runs in its own process (python collector.py). With
+# EMBEDDED_COLLECTOR=1 every worker runs a standby collector thread instead and
+# the leader lock guarantees that only one of them measures. Under gunicorn the
+# post_fork hook in gunicorn.conf.py starts it, since a thread started here
+# would stay in the master with --preload.
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    if os.environ.get('EMBEDDED_COLLECTOR') == '1':
+        start_embedded_collector()
+    app.run()